@@ -0,0 +1,174 @@
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Handler déposant les enregistrements dans une file bornée, vidée par un thread
+    d'écriture (QueueListener).
+
+    La boucle d'événements n'écrit jamais elle-même sur la sortie : si la file
+    est pleine (sortie trop lente), l'enregistrement est abandonné et compté
+    au lieu de bloquer la requête en cours.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Le formatage est laissé au thread d'écriture ; seules les informations
+        # d'exception, liées à la pile courante, sont converties en texte ici
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formate chaque enregistrement en une ligne JSON, avec les champs d'accès éventuels."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        access = getattr(record, "access", None)
+        if access:
+            entry.update(access)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class AccessLogger:
+    """
+    Journal d'accès structuré de l'API Gateway.
+
+    Les requêtes en erreur (code >= 400) sont toujours journalisées ; les
+    requêtes réussies peuvent être échantillonnées. Chaque enregistrement
+    porte le taux d'échantillonnage appliqué pour permettre de reconstituer
+    les volumes.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = 1.0):
+        """
+        Initialise le journal d'accès.
+
+        Args:
+            logger: Le logger utilisé pour écrire les enregistrements
+            sample_rate: Proportion des requêtes réussies journalisées (entre 0 et 1)
+        """
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+
+    def log(self, method: str, path: str, status_code: int, duration: float, client_ip: Optional[str] = None):
+        """
+        Journalise une requête traitée.
+
+        Args:
+            method: La méthode HTTP
+            path: Le chemin demandé
+            status_code: Le code de la réponse
+            duration: La durée de traitement en secondes
+            client_ip: L'adresse du client
+        """
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        sample_rate = 1.0
+        if status_code < 400 and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                return
+            sample_rate = self.sample_rate
+        duration_ms = round(duration * 1000, 1)
+        self.logger.info(
+            "%s %s %s %.1fms", method, path, status_code, duration_ms,
+            extra={"access": {
+                "method": method,
+                "path": path,
+                "status": status_code,
+                "duration_ms": duration_ms,
+                "client": client_ip,
+                "sample_rate": sample_rate,
+            }},
+        )
+
+
+class LoggingPipeline:
+    """File de journalisation et thread d'écriture associés."""
+
+    def __init__(self, handler: DroppingQueueHandler, listener: logging.handlers.QueueListener,
+                 access_logger: AccessLogger):
+        self.handler = handler
+        self.listener = listener
+        self.access_logger = access_logger
+        self.running = False
+
+    def start(self):
+        """Démarre le thread d'écriture."""
+        if not self.running:
+            self.listener.start()
+            self.running = True
+
+    def stop(self):
+        """Arrête le thread d'écriture après avoir vidé la file."""
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "queued": self.handler.queue.qsize(),
+            "queue_size": self.handler.queue.maxsize,
+            "dropped": self.handler.dropped,
+            "sampled_out": self.access_logger.sampled_out,
+            "sample_rate": self.access_logger.sample_rate,
+        }
+
+
+def setup_logging(logger_name: str, level: int = logging.INFO, json_format: bool = True,
+                  queue_size: int = 10000, sample_rate: float = 1.0,
+                  stream_handler: Optional[logging.Handler] = None) -> LoggingPipeline:
+    """
+    Configure la journalisation non bloquante : le logger racine dépose les
+    enregistrements dans une file bornée, écrite sur la sortie par un thread dédié.
+
+    Args:
+        logger_name: Le nom du logger du journal d'accès
+        level: Le niveau de journalisation
+        json_format: Écrit des lignes JSON plutôt que du texte
+        queue_size: Taille maximum de la file ; au-delà, les enregistrements sont abandonnés
+        sample_rate: Proportion des requêtes réussies journalisées
+        stream_handler: Le handler d'écriture (sortie d'erreur standard par défaut)
+
+    Returns:
+        Le pipeline de journalisation, dont le thread d'écriture est démarré et
+        sera arrêté (file vidée) à la fin du processus
+    """
+    output = stream_handler or logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    logging.basicConfig(level=level, handlers=[handler])
+    pipeline = LoggingPipeline(handler, listener, AccessLogger(logging.getLogger(logger_name), sample_rate))
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    return pipeline
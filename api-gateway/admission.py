@@ -0,0 +1,158 @@
+import os
+import time
+from typing import Dict, Optional, Sequence
+
+# Classes de priorité, de la plus importante à la moins importante
+VALIDATION = 0
+PURCHASE = 1
+AUTH = 2
+BROWSE = 3
+REPORTS = 4
+PRIORITY_NAMES = {
+    VALIDATION: "validation",
+    PURCHASE: "purchase",
+    AUTH: "auth",
+    BROWSE: "browse",
+    REPORTS: "reports",
+}
+
+
+class LatencyBaseline:
+    """
+    Latence de référence d'un service : la plus faible latence observée sur
+    les deux dernières fenêtres d'échantillons, afin de suivre un service
+    devenu durablement plus lent.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.samples = 0
+        self.current_min = float("inf")
+        self.previous_min = float("inf")
+
+    def update(self, latency: float) -> float:
+        self.current_min = min(self.current_min, latency)
+        self.samples += 1
+        if self.samples >= self.window:
+            self.previous_min, self.current_min = self.current_min, float("inf")
+            self.samples = 0
+        return min(self.current_min, self.previous_min)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Contrôle d'admission de l'API Gateway, par limite de concurrence adaptative.
+
+    La limite du nombre de requêtes simultanées suit un algorithme AIMD piloté
+    par la latence des services : elle augmente d'environ une unité par
+    « aller-retour » tant que les latences restent proches de leur valeur de
+    référence, et diminue de façon multiplicative dès qu'un appel est en échec
+    ou nettement plus lent (une seule fois par épisode de congestion).
+
+    Chaque classe de priorité ne peut occuper qu'une part de la limite : à
+    l'approche de la saturation, les requêtes les moins prioritaires sont
+    refusées les premières, ce qui préserve une marge pour les plus prioritaires.
+    """
+
+    def __init__(self, initial_limit: int = 200, min_limit: int = 20, max_limit: int = 2000,
+                 tolerance: float = 2.0, backoff: float = 0.9,
+                 shares: Sequence[float] = (1.0, 0.9, 0.8, 0.7, 0.5), baseline_window: int = 1000):
+        """
+        Initialise le limiteur.
+
+        Args:
+            initial_limit: Limite initiale de requêtes simultanées
+            min_limit: Limite minimum
+            max_limit: Limite maximum
+            tolerance: Rapport à la latence de référence au-delà duquel un appel signale une congestion
+            backoff: Facteur de réduction de la limite en cas de congestion
+            shares: Part de la limite accessible à chaque classe de priorité
+            baseline_window: Nombre d'échantillons par fenêtre de latence de référence
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.shares = tuple(shares)
+        self.baseline_window = baseline_window
+        self.baselines: Dict[str, LatencyBaseline] = {}
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.admitted = [0] * len(self.shares)
+        self.shed = [0] * len(self.shares)
+
+    def try_acquire(self, priority: int) -> bool:
+        """
+        Tente d'admettre une requête.
+
+        Args:
+            priority: La classe de priorité de la requête
+
+        Returns:
+            True si la requête est admise (et doit être libérée avec `release`)
+        """
+        if self.in_flight >= self.limit * self.shares[priority]:
+            self.shed[priority] += 1
+            return False
+        self.in_flight += 1
+        self.admitted[priority] += 1
+        return True
+
+    def release(self):
+        """Libère la place d'une requête admise."""
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def record(self, service: str, latency: float, success: bool = True):
+        """
+        Ajuste la limite à partir d'un appel à un service.
+
+        Args:
+            service: Le service appelé (chaque service a sa propre latence de référence)
+            latency: La durée de l'appel en secondes
+            success: False en cas d'erreur réseau ou d'erreur serveur
+        """
+        baseline = self.baselines.get(service)
+        if baseline is None:
+            baseline = self.baselines[service] = LatencyBaseline(self.baseline_window)
+        reference = baseline.update(latency)
+        now = time.monotonic()
+        if not success or latency > reference * self.tolerance:
+            # Les appels commencés avant la dernière réduction relèvent du même épisode
+            if now - latency >= self.last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+        elif self.in_flight * 2 >= self.limit:
+            # Augmentation additive, seulement si la limite est réellement sollicitée
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def retry_after(self, priority: int) -> int:
+        """Délai conseillé avant une nouvelle tentative : plus long pour les classes moins prioritaires."""
+        return 1 + priority
+
+    def snapshot(self) -> Dict[str, object]:
+        """Renvoie l'état du limiteur pour l'endpoint de santé."""
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "classes": {
+                PRIORITY_NAMES.get(priority, str(priority)): {
+                    "max_in_flight": int(self.limit * share),
+                    "admitted": self.admitted[priority],
+                    "shed": self.shed[priority],
+                }
+                for priority, share in enumerate(self.shares)
+            },
+        }
+
+
+def build_admission_limiter() -> Optional[AdaptiveConcurrencyLimiter]:
+    """Crée le limiteur d'admission configuré par l'environnement (None s'il est désactivé)."""
+    if os.getenv("ADMISSION_ENABLED", "true").lower() not in ("1", "true", "yes", "on"):
+        return None
+    return AdaptiveConcurrencyLimiter(
+        initial_limit=int(os.getenv("ADMISSION_INITIAL_LIMIT", "200")),
+        min_limit=int(os.getenv("ADMISSION_MIN_LIMIT", "20")),
+        max_limit=int(os.getenv("ADMISSION_MAX_LIMIT", "2000")),
+        tolerance=float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0")),
+    )
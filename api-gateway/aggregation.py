@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("api-gateway")
+
+# Lecture d'une ressource du service de billetterie : (code de statut, corps JSON ou None)
+Fetch = Callable[[str], Awaitable[Tuple[int, Any]]]
+
+
+class AggregationError(Exception):
+    """La ressource principale d'un document composé n'a pas pu être lue."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def fetch_safely(fetch: Fetch, path: str) -> Tuple[int, Any]:
+    try:
+        return await fetch(path)
+    except Exception as e:
+        logger.error(f"Aggregated read {path} failed: {str(e)}")
+        return 500, None
+
+
+async def compose_my_tickets(fetch: Fetch, user_id: int, max_concurrency: int = 8) -> Dict[str, object]:
+    """
+    Compose la page « Mes billets » : les billets de l'utilisateur, le détail de
+    l'offre de chacun et son QR code.
+
+    Les billets sont lus en premier ; les offres (chacune lue une seule fois, même
+    si plusieurs billets la partagent) et les QR codes sont ensuite lus en
+    parallèle, le nombre de QR codes générés simultanément étant borné pour ne pas
+    saturer le service. Une offre ou un QR code indisponible n'empêche pas de
+    renvoyer le document : la valeur manquante vaut null et l'erreur est décrite
+    dans la liste "errors".
+
+    Args:
+        fetch: La fonction de lecture d'un chemin du service de billetterie
+        user_id: L'identifiant de l'utilisateur
+        max_concurrency: Nombre maximum de QR codes demandés simultanément
+
+    Returns:
+        Le document composé : {"tickets": [{"ticket", "offer", "qr_code"}, ...], "errors": [...], "partial": bool}
+
+    Raises:
+        AggregationError: Si les billets de l'utilisateur n'ont pas pu être lus
+    """
+    status_code, tickets = await fetch_safely(fetch, f"/tickets/user/{user_id}")
+    if status_code != 200 or not isinstance(tickets, list):
+        raise AggregationError(status_code if status_code >= 500 else 502, "Could not load tickets")
+
+    offer_ids = list(dict.fromkeys(ticket["offer_id"] for ticket in tickets))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_qr_code(ticket_id: int) -> Tuple[int, Any]:
+        async with semaphore:
+            return await fetch_safely(fetch, f"/tickets/{ticket_id}/qrcode")
+
+    results = await asyncio.gather(
+        *[fetch_safely(fetch, f"/offers/{offer_id}") for offer_id in offer_ids],
+        *[fetch_qr_code(ticket["id"]) for ticket in tickets],
+    )
+    offer_results = dict(zip(offer_ids, results[:len(offer_ids)]))
+    qr_results = results[len(offer_ids):]
+
+    errors: List[Dict[str, object]] = []
+    offers: Dict[int, Optional[Dict[str, Any]]] = {}
+    for offer_id, (status_code, body) in offer_results.items():
+        offers[offer_id] = body if status_code == 200 else None
+        if status_code != 200:
+            errors.append({"resource": "offer", "id": offer_id, "status": status_code})
+
+    items = []
+    for ticket, (status_code, body) in zip(tickets, qr_results):
+        qr_code = body.get("qr_code") if status_code == 200 and isinstance(body, dict) else None
+        if qr_code is None:
+            errors.append({"resource": "qr_code", "id": ticket["id"], "status": status_code})
+        items.append({"ticket": ticket, "offer": offers[ticket["offer_id"]], "qr_code": qr_code})
+    return {"tickets": items, "errors": errors, "partial": bool(errors)}
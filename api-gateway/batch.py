@@ -0,0 +1,257 @@
+import json
+import math
+import base64
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from routes import SCOPE_KEY, RouteTable
+
+logger = logging.getLogger("api-gateway")
+
+# En-têtes de réponse repris dans le résultat de chaque sous-requête
+RESULT_HEADERS = ("content-type", "etag", "cache-control", "x-cache", "retry-after", "location", "www-authenticate")
+
+# En-têtes de la requête groupée qui ne concernent pas les sous-requêtes : les
+# réponses des services doivent notamment être reçues non compressées pour être
+# intégrées au résultat
+EXCLUDED_HEADERS = {"accept-encoding", "content-length", "content-type", "host", "transfer-encoding"}
+
+
+# Clés du scope ASGI de la requête groupée reprises par les sous-requêtes
+INHERITED_SCOPE_KEYS = (
+    "type", "asgi", "http_version", "scheme", "root_path", "client", "server", "app", "state",
+    "extensions", "starlette.exception_handlers", "fastapi_astack", "fastapi_middleware_astack",
+)
+
+
+class BatchError(Exception):
+    """Requête groupée invalide."""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+@dataclass
+class SubRequest:
+    """
+    Sous-requête d'une requête groupée.
+
+    Attributes:
+        method: La méthode HTTP (seules les lectures GET sont acceptées)
+        path: Le chemin dans l'API Gateway (ex: /tickets/offers/1)
+        query: La query string, sans le "?"
+        headers: Les en-têtes propres à la sous-requête
+        id: L'identifiant choisi par le client, renvoyé avec le résultat
+    """
+    method: str
+    path: str
+    query: str = ""
+    headers: Dict[str, str] = field(default_factory=dict)
+    id: Optional[str] = None
+
+
+def parse_batch(body: bytes, max_requests: int, batch_path: str = "/batch",
+                routes: Optional[RouteTable] = None) -> List[SubRequest]:
+    """
+    Analyse le corps d'une requête groupée.
+
+    Args:
+        body: Le corps JSON : {"requests": [{"method": "GET", "path": "/tickets/offers/1"}, ...]}
+        max_requests: Nombre maximum de sous-requêtes
+        batch_path: Le chemin des requêtes groupées, qui ne peuvent pas être imbriquées
+        routes: La table de routage : seules les routes relayées à un service sont
+            acceptées, les endpoints propres à l'API Gateway (flux Server-Sent Events
+            de la salle d'attente notamment) ne pouvant pas être mis en tampon
+
+    Returns:
+        Les sous-requêtes, dans l'ordre de la requête
+
+    Raises:
+        BatchError: Si le corps est invalide
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise BatchError("Invalid JSON body")
+    items = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError("The body must contain a non-empty 'requests' list")
+    if len(items) > max_requests:
+        raise BatchError(f"A batch may contain at most {max_requests} requests")
+
+    subrequests = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            raise BatchError("Each request must have a 'path'")
+        method = str(item.get("method", "GET")).upper()
+        if method != "GET":
+            raise BatchError("Only GET requests can be batched")
+        path, _, query = item["path"].partition("?")
+        if not path.startswith("/") or path.startswith(batch_path):
+            raise BatchError(f"Invalid path: {path}")
+        if routes is not None and routes.match(method, path).service is None:
+            raise BatchError(f"Path cannot be batched: {path}")
+        headers = item.get("headers") or {}
+        if not isinstance(headers, dict):
+            raise BatchError("'headers' must be an object")
+        subrequests.append(SubRequest(
+            method=method,
+            path=path,
+            query=query,
+            headers={str(key).lower(): str(value) for key, value in headers.items()},
+            id=str(item["id"]) if item.get("id") is not None else None,
+        ))
+    return subrequests
+
+
+def batch_cost(count: int, requests_per_unit: int) -> int:
+    """Nombre d'unités de limitation de débit décomptées pour une requête groupée."""
+    return max(1, math.ceil(count / requests_per_unit))
+
+
+def encode_body(content_type: str, body: bytes):
+    """
+    Intègre le corps d'une réponse au résultat : objet JSON, texte, ou base64
+    pour les contenus binaires.
+
+    Returns:
+        Un tuple (corps, encodage : None ou "base64")
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == "application/json" or media_type.endswith("+json"):
+        try:
+            return json.loads(body), None
+        except ValueError:
+            pass
+    if media_type.startswith("text/") or media_type.endswith("json"):
+        try:
+            return body.decode("utf-8"), None
+        except UnicodeDecodeError:
+            pass
+    if not body:
+        return None, None
+    return base64.b64encode(body).decode("ascii"), "base64"
+
+
+class BatchExecutor:
+    """
+    Exécute les sous-requêtes d'une requête groupée en parallèle.
+
+    Chaque sous-requête est confiée directement au routeur de l'application :
+    elle bénéficie de l'authentification à l'entrée, du cache, du regroupement
+    des lectures et des pools de connexions, sans repasser par les middlewares
+    (limitation de débit décomptée une fois pour la requête groupée). Le
+    contrôle d'admission par priorité s'applique à chaque sous-requête.
+    """
+
+    def __init__(self, app, admission=None, routes: Optional[RouteTable] = None, shed_message: str = "{}"):
+        """
+        Args:
+            app: L'application ASGI destinataire des sous-requêtes : le routeur, enveloppé
+                d'un ExceptionMiddleware pour que les exceptions HTTP deviennent des réponses
+            admission: Le limiteur de concurrence adaptatif (aucun contrôle si None)
+            routes: La table de routage, qui désigne la classe de priorité de chaque route
+            shed_message: Le message des sous-requêtes délestées ({} : délai conseillé)
+        """
+        self.app = app
+        self.admission = admission
+        self.routes = routes if routes is not None else RouteTable([])
+        self.shed_message = shed_message
+
+    async def run(self, scope, subrequests: Sequence[SubRequest]) -> List[Dict[str, object]]:
+        """
+        Exécute les sous-requêtes.
+
+        Args:
+            scope: Le scope ASGI de la requête groupée, dont les en-têtes sont repris
+            subrequests: Les sous-requêtes
+
+        Returns:
+            Le résultat de chaque sous-requête, dans l'ordre de la requête
+        """
+        base_headers = [
+            (name, value) for name, value in scope["headers"]
+            if name.decode("latin-1").lower() not in EXCLUDED_HEADERS
+        ]
+        return list(await asyncio.gather(*[self._run_one(scope, base_headers, sub) for sub in subrequests]))
+
+    async def _run_one(self, parent_scope, base_headers, sub: SubRequest) -> Dict[str, object]:
+        route = self.routes.match(sub.method, sub.path)
+        priority = route.priority if self.admission is not None else None
+        if priority is not None and not self.admission.try_acquire(priority):
+            retry_after = self.admission.retry_after(priority)
+            return self._result(sub, 503, {"retry-after": str(retry_after)},
+                                {"detail": self.shed_message.format(retry_after)})
+        try:
+            status_code, headers, body = await self._dispatch(parent_scope, base_headers, sub, route)
+        except Exception as e:
+            logger.error(f"Batched request {sub.method} {sub.path} failed: {str(e)}")
+            return self._result(sub, 500, {}, {"detail": "Internal server error"})
+        finally:
+            if priority is not None:
+                self.admission.release()
+        content, encoding = encode_body(headers.get("content-type", ""), body)
+        result = self._result(sub, status_code, headers, content)
+        if encoding is not None:
+            result["encoding"] = encoding
+        return result
+
+    async def _dispatch(self, parent_scope, base_headers, sub: SubRequest, route):
+        overridden = {name.encode("latin-1") for name in sub.headers}
+        headers = [(name, value) for name, value in base_headers if name.lower() not in overridden]
+        headers += [(name.encode("latin-1"), value.encode("latin-1")) for name, value in sub.headers.items()
+                    if name not in EXCLUDED_HEADERS]
+        # Le scope reprend le contexte de la requête groupée (application, gestionnaires
+        # d'exceptions, piles de ressources de FastAPI), mais pas son routage
+        scope = {key: parent_scope[key] for key in INHERITED_SCOPE_KEYS if key in parent_scope}
+        scope.update({
+            "method": sub.method,
+            "path": sub.path,
+            "raw_path": sub.path.encode(),
+            "query_string": sub.query.encode(),
+            "headers": headers,
+            SCOPE_KEY: route,
+        })
+
+        received = False
+        disconnected = asyncio.Event()
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Le client de la requête groupée reste connecté jusqu'à la fin des sous-requêtes
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        status_code = 500
+        response_headers: Dict[str, str] = {}
+        chunks: List[bytes] = []
+
+        async def send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    name = name.decode("latin-1").lower()
+                    if name in RESULT_HEADERS:
+                        response_headers[name] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            disconnected.set()
+        return status_code, response_headers, b"".join(chunks)
+
+    @staticmethod
+    def _result(sub: SubRequest, status_code: int, headers: Dict[str, str], body) -> Dict[str, object]:
+        result = {"status": status_code, "headers": headers, "body": body}
+        if sub.id is not None:
+            result = {"id": sub.id, **result}
+        return result
@@ -0,0 +1,145 @@
+"""
+Micro-benchmark des middlewares de l'API Gateway.
+
+Compare le coût par requête des trois middlewares `@app.middleware("http")`
+historiques (journal, en-têtes de sécurité, limitation de débit) à celui du
+middleware ASGI unique `GatewayMiddleware`, sur une route qui répond
+immédiatement. Les requêtes sont envoyées directement à l'application ASGI,
+sans réseau, pour isoler le surcoût des middlewares.
+
+Usage :
+    cd api-gateway
+    python benchmarks/bench_middleware.py [--requests 20000]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from middleware import GatewayMiddleware
+from rate_limiter import GCRARateLimiter
+
+logger = logging.getLogger("api-gateway")
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/tickets/offers")
+    async def offers():
+        return PlainTextResponse("ok")
+
+    return app
+
+
+def build_legacy_app(auth_limiter, api_limiter) -> FastAPI:
+    # Reproduction des middlewares remplacés par GatewayMiddleware
+    app = build_app()
+
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        logger.info(f"Request: {request.method} {request.url}")
+        response = await call_next(request)
+        logger.info(f"Response status: {response.status_code}")
+        return response
+
+    @app.middleware("http")
+    async def add_security_headers(request: Request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        response.headers["Content-Security-Policy"] = "default-src 'self'; img-src 'self' data: https://api.qrserver.com; style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline'"
+        return response
+
+    @app.middleware("http")
+    async def rate_limit_middleware(request: Request, call_next):
+        limiter = auth_limiter if request.url.path.startswith("/auth/token") else api_limiter
+        allowed, wait_time, remaining = await limiter.check(request.client.host)
+        if not allowed:
+            return JSONResponse(status_code=429, content={"detail": wait_time})
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = str(limiter.max_requests)
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers["X-RateLimit-Reset"] = str(limiter.window_size)
+        return response
+
+    return app
+
+
+def build_single_app(auth_limiter, api_limiter) -> FastAPI:
+    app = build_app()
+    app.add_middleware(GatewayMiddleware, auth_limiter=auth_limiter, api_limiter=api_limiter)
+    return app
+
+
+async def run(app, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/tickets/offers",
+        "raw_path": b"/tickets/offers",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"gateway")],
+        "client": ("10.0.0.1", 50000),
+        "server": ("gateway", 8080),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # Échauffement
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Nombre de requêtes par variante")
+    args = parser.parse_args()
+
+    # Le journal est écrit, mais vers /dev/null
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler(open(os.devnull, "w")))
+    logger.propagate = False
+
+    def limiters():
+        return (
+            GCRARateLimiter(max_requests=10 ** 9, window_size=60),
+            GCRARateLimiter(max_requests=10 ** 9, window_size=60),
+        )
+
+    variants = [
+        ("sans middleware", build_app()),
+        ("3 middlewares http", build_legacy_app(*limiters())),
+        ("GatewayMiddleware", build_single_app(*limiters())),
+    ]
+    baseline = None
+    print(f"{'Variante':<20} {'µs / requête':>14} {'surcoût (µs)':>14}")
+    for name, app in variants:
+        per_request = asyncio.run(run(app, args.requests))
+        baseline = per_request if baseline is None else baseline
+        print(f"{name:<20} {per_request:>14.1f} {per_request - baseline:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark des limiteurs de taux de l'API Gateway.
+
+Compare la fenêtre glissante (`RateLimiter`) et GCRA (`GCRARateLimiter`) :
+temps moyen d'une vérification complète (is_allowed + get_remaining_requests,
+comme dans le middleware) et mémoire conservée par adresse IP.
+
+Usage :
+    cd api-gateway
+    python benchmarks/bench_rate_limiter.py [--ips 10000] [--requests 200000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter, GCRARateLimiter
+
+
+def bench_time(limiter_class, ips, requests, max_requests):
+    limiter = limiter_class(max_requests=max_requests, window_size=60)
+    addresses = [f"10.0.{i // 256}.{i % 256}" for i in range(ips)]
+    sequence = [random.choice(addresses) for _ in range(requests)]
+    started = time.perf_counter()
+    for address in sequence:
+        limiter.is_allowed(address)
+        limiter.get_remaining_requests(address)
+    elapsed = time.perf_counter() - started
+    return elapsed / requests * 1e9
+
+
+def bench_memory(limiter_class, ips, max_requests):
+    # Cas le plus défavorable : chaque adresse a consommé toute sa fenêtre
+    tracemalloc.start()
+    limiter = limiter_class(max_requests=max_requests, window_size=60)
+    for i in range(ips):
+        address = f"10.1.{i // 256}.{i % 256}"
+        for _ in range(max_requests):
+            limiter.is_allowed(address)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / ips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ips", type=int, default=10000, help="Nombre d'adresses IP distinctes")
+    parser.add_argument("--requests", type=int, default=200000, help="Nombre de vérifications")
+    parser.add_argument("--max-requests", type=int, default=200, help="Limite par fenêtre (api_limiter : 200)")
+    args = parser.parse_args()
+
+    print(f"{'Limiteur':<18} {'ns / requête':>14} {'octets / IP':>14}")
+    for limiter_class in (RateLimiter, GCRARateLimiter):
+        per_request = bench_time(limiter_class, args.ips, args.requests, args.max_requests)
+        per_ip = bench_memory(limiter_class, min(args.ips, 2000), args.max_requests)
+        print(f"{limiter_class.__name__:<18} {per_request:>14.0f} {per_ip:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Clé de cache : (service, chemin, query string normalisée)
+CacheKey = Tuple[str, str, str]
+
+
+@dataclass
+class CachedResponse:
+    """Réponse conservée en cache, avec son corps brut et sa date d'expiration."""
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    expires_at: float
+    epoch: int = 0
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("etag")
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Indique si un en-tête If-None-Match désigne un ETag (comparaison faible).
+
+    Args:
+        if_none_match: La valeur de l'en-tête If-None-Match
+        etag: L'ETag de la représentation
+
+    Returns:
+        True si le client possède déjà cette représentation
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+class SharedEpochs:
+    """
+    Compteurs d'invalidation par service, partagés entre les workers d'un même
+    hôte via un fichier projeté en mémoire.
+
+    Chaque worker a son propre cache ; une écriture reçue par un worker n'en
+    supprime que les entrées locales. Le worker incrémente aussi le compteur du
+    service, et les autres workers écartent à la lecture les entrées enregistrées
+    sous un compteur antérieur. L'invalidation entre workers porte ainsi sur
+    toutes les entrées du service, quel que soit le préfixe écrit.
+    """
+
+    COUNTER = struct.Struct("<Q")
+
+    def __init__(self, path: Optional[str] = None, slots: int = 64):
+        """
+        Args:
+            path: Le chemin du fichier partagé (dans /dev/shm par défaut)
+            slots: Le nombre de compteurs (les services sont répartis par empreinte)
+        """
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(directory, "jo-gateway-cache-epochs")
+        self.path = path
+        self.slots = slots
+        size = slots * self.COUNTER.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.memory = mmap.mmap(self.fd, size)
+
+    def _offset(self, service: str) -> int:
+        slot = int.from_bytes(hashlib.blake2b(service.encode(), digest_size=4).digest(), "little") % self.slots
+        return slot * self.COUNTER.size
+
+    def get(self, service: str) -> int:
+        return self.COUNTER.unpack_from(self.memory, self._offset(service))[0]
+
+    def bump(self, service: str) -> int:
+        offset = self._offset(service)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self.COUNTER.size, offset)
+        try:
+            epoch = self.COUNTER.unpack_from(self.memory, offset)[0] + 1
+            self.COUNTER.pack_into(self.memory, offset, epoch)
+            return epoch
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.COUNTER.size, offset)
+
+    def close(self):
+        self.memory.close()
+        os.close(self.fd)
+
+
+class ResponseCache:
+    """
+    Cache LRU en mémoire des réponses GET relayées par l'API Gateway.
+
+    La durée de vie des réponses est fournie à chaque mise en cache (elle est
+    déclarée par route dans la table de routage). Les clés tiennent compte
+    des paramètres de la query string (skip, limit...). Le nombre d'entrées est
+    borné : l'entrée la moins récemment utilisée est évincée en premier. Une
+    entrée expirée portant un ETag est conservée pour être revalidée auprès du
+    service (If-None-Match) plutôt que téléchargée à nouveau.
+    """
+
+    def __init__(self, max_entries: int = 1024, epochs: Optional[SharedEpochs] = None):
+        """
+        Initialise le cache.
+
+        Args:
+            max_entries: Nombre maximum de réponses conservées
+            epochs: Les compteurs d'invalidation partagés avec les autres workers (aucun si None)
+        """
+        self.max_entries = max_entries
+        self.epochs = epochs
+        self.entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.revalidations = 0
+
+    @staticmethod
+    def make_key(service: str, path: str, query_params: Iterable[Tuple[str, str]]) -> CacheKey:
+        """
+        Construit la clé de cache d'une requête.
+
+        Les paramètres sont triés afin que `?skip=0&limit=10` et `?limit=10&skip=0`
+        partagent la même entrée.
+
+        Args:
+            service: Le nom du service
+            path: Le chemin de la requête dans le service
+            query_params: Les paramètres de la query string (paires clé/valeur)
+        """
+        query = "&".join(f"{key}={value}" for key, value in sorted(query_params))
+        return service, path, query
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        """
+        Renvoie la réponse en cache pour une clé si elle n'a pas expiré.
+
+        Args:
+            key: La clé de cache
+
+        Returns:
+            La réponse en cache, ou None en cas d'absence
+        """
+        entry = self._current(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None and entry.etag is None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get_stale(self, key: CacheKey) -> Optional[CachedResponse]:
+        """
+        Renvoie l'entrée expirée d'une clé si elle peut être revalidée (ETag connu).
+
+        Args:
+            key: La clé de cache
+
+        Returns:
+            L'entrée expirée, ou None
+        """
+        entry = self._current(key)
+        if entry is None or entry.etag is None:
+            return None
+        return entry
+
+    def _current(self, key: CacheKey) -> Optional[CachedResponse]:
+        # Une entrée invalidée par un autre worker est supprimée, même si elle a un ETag
+        entry = self.entries.get(key)
+        if entry is not None and self.epochs is not None and entry.epoch != self.epochs.get(key[0]):
+            del self.entries[key]
+            self.invalidations += 1
+            return None
+        return entry
+
+    def revalidate(self, key: CacheKey, entry: CachedResponse, ttl: float):
+        """
+        Prolonge une entrée confirmée par le service (réponse 304).
+
+        Args:
+            key: La clé de cache
+            entry: L'entrée revalidée
+            ttl: Nouvelle durée de vie de l'entrée, en secondes
+        """
+        entry.expires_at = time.monotonic() + ttl
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.revalidations += 1
+
+    def set(self, key: CacheKey, status_code: int, headers: Mapping[str, str], body: bytes, ttl: float):
+        """
+        Conserve une réponse en cache.
+
+        Args:
+            key: La clé de cache
+            status_code: Le code de statut de la réponse
+            headers: Les en-têtes de la réponse
+            body: Le corps brut de la réponse
+            ttl: Durée de vie de l'entrée, en secondes
+        """
+        epoch = self.epochs.get(key[0]) if self.epochs is not None else 0
+        self.entries[key] = CachedResponse(status_code, dict(headers), body, time.monotonic() + ttl, epoch)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, service: str, path_prefix: str = "") -> int:
+        """
+        Supprime les entrées d'un service dont le chemin commence par un préfixe.
+
+        Args:
+            service: Le nom du service
+            path_prefix: Le préfixe des chemins à invalider (tous si vide)
+
+        Returns:
+            Le nombre d'entrées supprimées
+        """
+        keys = [
+            key for key in self.entries
+            if key[0] == service and key[1].startswith(path_prefix)
+        ]
+        for key in keys:
+            del self.entries[key]
+        self.invalidations += len(keys)
+        if self.epochs is not None:
+            self.epochs.bump(service)
+        return len(keys)
+
+    def clear(self):
+        """Vide le cache."""
+        self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Renvoie les compteurs du cache."""
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "revalidations": self.revalidations,
+        }
+
+
+# Écritures invalidant des routes en cache :
+# (service, préfixe écrit) -> liste de (service, préfixe à invalider)
+INVALIDATION_RULES: Dict[Tuple[str, str], List[Tuple[str, str]]] = {
+    ("admin", "/offers"): [("tickets", "/offers")],
+}
+
+
+def invalidate_after_write(cache: ResponseCache, service: str, path: str) -> int:
+    """
+    Invalide les entrées en cache rendues obsolètes par une écriture réussie.
+
+    Args:
+        cache: Le cache à invalider
+        service: Le service ayant reçu l'écriture
+        path: Le chemin de l'écriture dans le service
+
+    Returns:
+        Le nombre d'entrées supprimées
+    """
+    removed = 0
+    for (write_service, write_prefix), targets in INVALIDATION_RULES.items():
+        if write_service == service and path.startswith(write_prefix):
+            for target_service, target_prefix in targets:
+                removed += cache.invalidate(target_service, target_prefix)
+    return removed
+
+
+# Cache des réponses, dont les durées de vie sont déclarées par la table de routage ;
+# avec plusieurs workers, les invalidations sont propagées par des compteurs en
+# mémoire partagée
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "1024")),
+    epochs=SharedEpochs(os.getenv("GATEWAY_CACHE_SHM_PATH") or None)
+    if os.getenv("GATEWAY_CACHE_SHARED_INVALIDATION", "false").lower() in ("1", "true", "yes", "on") else None,
+)
@@ -0,0 +1,294 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional
+
+logger = logging.getLogger("api-gateway")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur protégeant l'API Gateway d'un service défaillant.
+
+    Le disjoncteur observe les derniers appels au service (fenêtre glissante). Il
+    s'ouvre lorsque la proportion d'appels en échec ou trop lents dépasse un seuil :
+    les requêtes sont alors rejetées immédiatement au lieu d'attendre une erreur
+    réseau. Après un délai, il passe en semi-ouvert et laisse passer quelques
+    requêtes d'essai ; leur succès le referme, un échec le rouvre.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_duration: float = 2.0,
+        window_size: int = 20,
+        minimum_calls: int = 10,
+        open_duration: float = 30.0,
+        half_open_max_calls: int = 3,
+    ):
+        """
+        Initialise le disjoncteur.
+
+        Args:
+            name: Le nom du service protégé
+            failure_rate_threshold: Proportion d'appels en échec ou lents déclenchant l'ouverture
+            slow_call_duration: Durée (en secondes) au-delà de laquelle un appel est considéré lent
+            window_size: Nombre d'appels récents pris en compte
+            minimum_calls: Nombre minimum d'appels observés avant de pouvoir s'ouvrir
+            open_duration: Durée (en secondes) pendant laquelle le disjoncteur reste ouvert
+            half_open_max_calls: Nombre de requêtes d'essai en semi-ouvert
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.minimum_calls = minimum_calls
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self.outcomes: Deque[bool] = deque(maxlen=window_size)  # True = appel en échec ou lent
+        self._state = CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.half_open_successes = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """État courant, en tenant compte de l'expiration de la période d'ouverture."""
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.open_duration:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Indique si une requête peut être envoyée au service.
+
+        Returns:
+            False si le disjoncteur est ouvert, ou semi-ouvert avec toutes ses
+            requêtes d'essai déjà en cours
+        """
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self.half_open_calls < self.half_open_max_calls:
+            self.half_open_calls += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """
+        Rend une requête d'essai réservée par `allow_request` sans enregistrer de
+        résultat (requête annulée avant la réponse du service).
+        """
+        if self._state == HALF_OPEN:
+            self.half_open_calls = max(0, self.half_open_calls - 1)
+
+    def retry_after(self) -> int:
+        """Renvoie le nombre de secondes avant la prochaine tentative possible."""
+        if self._state != OPEN:
+            return 1
+        return max(1, int(self.open_duration - (time.monotonic() - self.opened_at)) + 1)
+
+    def record_success(self, duration: float):
+        """
+        Enregistre un appel abouti.
+
+        Args:
+            duration: La durée de l'appel en secondes
+        """
+        self._record(duration >= self.slow_call_duration)
+
+    def record_failure(self):
+        """Enregistre un appel en échec (erreur réseau ou erreur serveur)."""
+        self._record(True)
+
+    def record_probe(self, healthy: bool):
+        """
+        Prend en compte le résultat d'une sonde de santé active.
+
+        Une sonde en échec ouvre le disjoncteur ; une sonde réussie sur un
+        disjoncteur ouvert le fait passer en semi-ouvert sans attendre la fin
+        de la période d'ouverture, et sur un disjoncteur semi-ouvert rend les
+        requêtes d'essai restées réservées.
+
+        Args:
+            healthy: Le résultat de la sonde
+        """
+        if not healthy and self._state != OPEN:
+            self._transition(OPEN)
+        elif healthy and self._state == OPEN:
+            self._transition(HALF_OPEN)
+        elif healthy and self._state == HALF_OPEN:
+            self.half_open_calls = 0
+
+    def _record(self, bad: bool):
+        state = self.state
+        if state == HALF_OPEN:
+            self.half_open_calls = max(0, self.half_open_calls - 1)
+            if bad:
+                self._transition(OPEN)
+            else:
+                self.half_open_successes += 1
+                if self.half_open_successes >= self.half_open_max_calls:
+                    self._transition(CLOSED)
+            return
+        if state == OPEN:
+            return
+        self.outcomes.append(bad)
+        if len(self.outcomes) >= self.minimum_calls and self.failure_rate() >= self.failure_rate_threshold:
+            self._transition(OPEN)
+
+    def failure_rate(self) -> float:
+        """Renvoie la proportion d'appels en échec ou lents dans la fenêtre."""
+        if not self.outcomes:
+            return 0.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit breaker for {self.name}: {self._state} -> {state}")
+        self._state = state
+        self.half_open_calls = 0
+        self.half_open_successes = 0
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CLOSED:
+            self.outcomes.clear()
+
+    def snapshot(self) -> Dict[str, object]:
+        """Renvoie l'état du disjoncteur pour l'endpoint de santé."""
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate(), 3),
+            "observed_calls": len(self.outcomes),
+            "rejected": self.rejected,
+        }
+
+
+class HealthProber:
+    """
+    Sonde active vérifiant périodiquement l'endpoint /health de chaque instance
+    de chaque service.
+
+    Les résultats alimentent les répartiteurs, qui éjectent les instances ne
+    répondant plus, et les disjoncteurs : un service dont aucune instance ne
+    répond est coupé sans attendre que des requêtes clientes échouent, et un
+    service rétabli est remis en service dès la sonde suivante.
+    """
+
+    def __init__(self, pools, breakers: Dict[str, CircuitBreaker], balancers, interval: float = 5.0,
+                 timeout: float = 2.0, path: str = "/health"):
+        """
+        Initialise la sonde.
+
+        Args:
+            pools: Les pools de connexions des services (nom -> ServicePool)
+            breakers: Les disjoncteurs des services (nom -> CircuitBreaker)
+            balancers: Les répartiteurs des services (nom -> LoadBalancer)
+            interval: Intervalle entre deux sondes, en secondes
+            timeout: Délai maximum d'une sonde, en secondes
+            path: Le chemin sondé sur chaque service
+        """
+        self.pools = pools
+        self.breakers = breakers
+        self.balancers = balancers
+        self.interval = interval
+        self.timeout = timeout
+        self.path = path
+        self.task: Optional[asyncio.Task] = None
+
+    async def probe_replica(self, name: str, replica) -> bool:
+        """
+        Sonde une instance d'un service et l'éjecte ou la rétablit selon le résultat.
+
+        Args:
+            name: Le nom du service
+            replica: L'instance à sonder
+
+        Returns:
+            True si l'instance a répondu avec un code de succès
+        """
+        client = self.pools[name].open()
+        try:
+            response = await client.get(f"{replica.url}{self.path}", timeout=self.timeout)
+            healthy = response.status_code < 500
+        except Exception:
+            healthy = False
+        balancer = self.balancers[name]
+        if healthy:
+            balancer.restore(replica)
+        else:
+            balancer.eject(replica)
+        return healthy
+
+    async def probe(self, name: str) -> bool:
+        """
+        Sonde toutes les instances d'un service et met à jour son disjoncteur.
+
+        Args:
+            name: Le nom du service
+
+        Returns:
+            True si au moins une instance a répondu avec un code de succès
+        """
+        results = await asyncio.gather(
+            *[self.probe_replica(name, replica) for replica in self.balancers[name].replicas]
+        )
+        healthy = any(results)
+        self.breakers[name].record_probe(healthy)
+        return healthy
+
+    async def probe_all(self):
+        """Sonde tous les services en parallèle."""
+        await asyncio.gather(*[self.probe(name) for name in self.breakers])
+
+    async def _run(self):
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Démarre la sonde en tâche de fond."""
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Arrête la sonde."""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+def build_breakers(services: Iterable[str]) -> Dict[str, CircuitBreaker]:
+    """
+    Crée un disjoncteur par service, configuré à partir des variables d'environnement.
+
+    Args:
+        services: Les noms des services
+
+    Returns:
+        Dictionnaire associant le nom de chaque service à son disjoncteur
+    """
+    return {
+        name: CircuitBreaker(
+            name,
+            failure_rate_threshold=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+            slow_call_duration=float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "2.0")),
+            window_size=int(os.getenv("CIRCUIT_WINDOW_SIZE", "20")),
+            minimum_calls=int(os.getenv("CIRCUIT_MINIMUM_CALLS", "10")),
+            open_duration=float(os.getenv("CIRCUIT_OPEN_SECONDS", "30")),
+        )
+        for name in services
+    }
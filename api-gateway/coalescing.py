@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+@dataclass
+class CoalesceRule:
+    """
+    Règle de regroupement des lectures identiques simultanées.
+
+    Attributes:
+        service: Le nom du service
+        path_prefix: Le préfixe des chemins concernés
+        public: Si vrai, la réponse ne dépend pas de l'utilisateur et les requêtes
+            de tous les clients sont regroupées ; sinon, seules les requêtes portant
+            le même en-tête Authorization le sont
+    """
+    service: str
+    path_prefix: str
+    public: bool = False
+
+
+class SingleFlight:
+    """
+    Regroupe les appels identiques en cours ("single-flight").
+
+    Le premier appel pour une clé lance le travail ; les appels suivants avec la
+    même clé, tant que le premier n'est pas terminé, attendent et reçoivent le même
+    résultat (ou la même exception) au lieu de relancer le travail.
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Exécute `fn` une seule fois pour tous les appels simultanés de même clé.
+
+        Le travail s'exécute dans une tâche séparée : l'annulation d'un appelant
+        (client déconnecté) n'interrompt pas les autres.
+
+        Args:
+            key: La clé identifiant l'appel
+            fn: La fonction asynchrone à exécuter
+
+        Returns:
+            Le résultat de `fn`
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Renvoie les compteurs de regroupement."""
+        return {
+            "in_flight": len(self.calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+
+def coalescing_key(
+    rule: CoalesceRule,
+    method: str,
+    path: str,
+    query_params: Iterable[Tuple[str, str]],
+    authorization: Optional[str],
+) -> Tuple[str, str, str, str, str]:
+    """
+    Construit la clé de regroupement d'une requête.
+
+    La clé combine la méthode, le service, le chemin, la query string normalisée et
+    la portée d'authentification : "public" pour les routes publiques, sinon une
+    empreinte de l'en-tête Authorization (le jeton n'est pas conservé en clair).
+
+    Args:
+        rule: La règle applicable
+        method: La méthode HTTP
+        path: Le chemin de la requête dans le service
+        query_params: Les paramètres de la query string
+        authorization: La valeur de l'en-tête Authorization, si présent
+    """
+    if rule.public:
+        scope = "public"
+    elif authorization:
+        scope = hashlib.sha256(authorization.encode()).hexdigest()
+    else:
+        scope = "anonymous"
+    query = "&".join(f"{key}={value}" for key, value in sorted(query_params))
+    return method, rule.service, path, query, scope
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,290 @@
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# Brotli et Zstandard dépendent des paquets optionnels brotli et zstandard
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Types de contenu compressibles ; les images et contenus binaires le sont déjà
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+def available_encoders() -> Dict[str, type]:
+    """Renvoie les encodages utilisables, par ordre de préférence du serveur."""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """
+    Analyse un en-tête Accept-Encoding.
+
+    Args:
+        value: La valeur de l'en-tête (ex: "gzip;q=0.8, br")
+
+    Returns:
+        Dictionnaire associant chaque encodage à son poids (q)
+    """
+    weights = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def negotiate(accept_encoding: str, encoders) -> Optional[str]:
+    """
+    Choisit l'encodage de la réponse.
+
+    Le poids indiqué par le client prime ; à poids égal, l'ordre de préférence
+    du serveur (zstd, br puis gzip) départage.
+
+    Args:
+        accept_encoding: La valeur de l'en-tête Accept-Encoding
+        encoders: Les encodages disponibles, par ordre de préférence
+
+    Returns:
+        Le nom de l'encodage, ou None si la réponse doit être envoyée telle quelle
+    """
+    weights = parse_accept_encoding(accept_encoding)
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for name in encoders:
+        weight = weights.get(name, wildcard)
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type == "text/event-stream":
+        # Les événements doivent parvenir au client sans attendre le seuil de compression
+        return False
+    return content_type.endswith("+json") or content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI compressant les réponses selon l'en-tête Accept-Encoding.
+
+    Seules les réponses d'un type compressible et d'une taille au moins égale
+    au seuil sont compressées ; les réponses déjà compressées par un service
+    sont relayées telles quelles. Les réponses relayées en flux sont compressées
+    au fil de l'eau, chaque morceau étant envoyé dès qu'il est compressé.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, levels: Optional[Dict[str, int]] = None):
+        """
+        Initialise le middleware.
+
+        Args:
+            app: L'application ASGI enveloppée
+            minimum_size: Taille minimum (en octets) d'une réponse à compresser
+            levels: Niveau de compression par encodage (gzip, br, zstd)
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding, self.encoders) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(send, encoding, self.encoders[encoding], self.levels[encoding],
+                                         self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """Compresse une réponse en interceptant les messages envoyés par l'application."""
+
+    def __init__(self, send, encoding: str, encoder_class, level: int, minimum_size: int):
+        self.downstream = send
+        self.encoding = encoding
+        self.encoder_class = encoder_class
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = message.get("headers", [])
+            content_type, content_encoding, content_length = self._inspect(headers)
+            compressible = is_compressible(content_type) and message["status"] not in (204, 304)
+            if compressible and not any(
+                name.lower() == b"vary" and b"accept-encoding" in value.lower() for name, value in headers
+            ):
+                message["headers"] = list(headers) + [(b"vary", b"Accept-Encoding")]
+            # Contenu déjà compressé, non compressible ou trop petit : relayé tel quel
+            if (not compressible or content_encoding
+                    or (content_length is not None and content_length < self.minimum_size)):
+                self.passthrough = True
+                await self.downstream(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            self.pending.append(body)
+            self.pending_size += len(body)
+            if more_body and self.pending_size < self.minimum_size:
+                # On attend d'en savoir assez pour décider de compresser
+                return
+            body = b"".join(self.pending)
+            self.pending = []
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": body, "more_body": False})
+                return
+            self.encoder = self.encoder_class(self.level)
+            if not more_body:
+                data = self.encoder.compress(body) + self.encoder.finish()
+                await self.downstream(self._compressed_start(len(data)))
+                await self.downstream({"type": "http.response.body", "body": data, "more_body": False})
+                return
+            await self.downstream(self._compressed_start(None))
+
+        if more_body:
+            data = self.encoder.compress(body) + self.encoder.flush()
+        else:
+            data = self.encoder.compress(body) + self.encoder.finish()
+        await self.downstream({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _compressed_start(self, content_length: Optional[int]):
+        """Prépare le message de début de réponse compressée."""
+        headers = []
+        for name, value in self.start_message.get("headers", []):
+            name = name.lower()
+            if name == b"content-length":
+                continue
+            if name == b"etag" and not value.startswith(b"W/"):
+                # La représentation compressée diffère : l'ETag devient faible
+                value = b"W/" + value
+            headers.append((name, value))
+        headers.append((b"content-encoding", self.encoding.encode()))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        self.start_message["headers"] = headers
+        return self.start_message
+
+    @staticmethod
+    def _inspect(headers) -> Tuple[str, bool, Optional[int]]:
+        content_type, content_encoding, content_length = "", False, None
+        for name, value in headers:
+            name = name.lower()
+            if name == b"content-type":
+                content_type = value.decode("latin-1")
+            elif name == b"content-encoding":
+                content_encoding = value.strip().lower() not in (b"", b"identity")
+            elif name == b"content-length":
+                content_length = int(value)
+        return content_type, content_encoding, content_length
+
+
+def compression_levels_from_env() -> Dict[str, int]:
+    """Lit les niveaux de compression configurés (COMPRESSION_GZIP_LEVEL, ...)."""
+    levels = {}
+    for name, variable in (("gzip", "COMPRESSION_GZIP_LEVEL"), ("br", "COMPRESSION_BROTLI_LEVEL"),
+                           ("zstd", "COMPRESSION_ZSTD_LEVEL")):
+        value = os.getenv(variable)
+        if value is not None:
+            levels[name] = int(value)
+    return levels
@@ -0,0 +1,109 @@
+import json
+import time
+import contextvars
+from typing import Callable, Dict, Optional
+
+# En-tête portant le temps restant (en millisecondes) pour traiter la requête.
+# Un délai relatif, plutôt qu'une date absolue, ne dépend pas de la
+# synchronisation des horloges entre l'API Gateway et les services.
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Le temps alloué à la requête est écoulé."""
+
+
+def parse_timeout(value: Optional[str]) -> Optional[float]:
+    """Analyse la valeur de l'en-tête de délai ; renvoie un temps en secondes, ou None s'il est invalide."""
+    try:
+        milliseconds = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, milliseconds) / 1000
+
+
+def remaining() -> Optional[float]:
+    """Temps restant (en secondes, éventuellement négatif) pour la requête en cours, ou None sans échéance."""
+    deadline = _deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """Renvoie les en-têtes complétés du temps restant, à transmettre avec un appel sortant."""
+    left = remaining()
+    if left is None:
+        return headers
+    return {**headers, DEADLINE_HEADER: str(max(0, int(left * 1000)))}
+
+
+def set_deadline(budget: Optional[float]):
+    """Fixe l'échéance de la requête en cours ; renvoie le jeton permettant de la rétablir."""
+    return _deadline.set(time.monotonic() + budget if budget is not None else None)
+
+
+class DeadlineMiddleware:
+    """
+    Middleware ASGI fixant l'échéance de chaque requête : le plus court du temps
+    reçu dans l'en-tête x-request-timeout-ms et du temps alloué à la route.
+
+    L'échéance est ensuite respectée par les appels aux services (`inject`,
+    `remaining`). Une requête arrivée après son échéance est refusée sans être
+    traitée : le client ne l'attend plus, et une requête interrompue par
+    DeadlineExceeded reçoit une réponse 504.
+    """
+
+    def __init__(self, app, budget_for: Optional[Callable[[dict], Optional[float]]] = None):
+        """
+        Args:
+            app: L'application ASGI
+            budget_for: Renvoie le temps alloué à une requête d'après son scope ASGI (None : pas de limite)
+        """
+        self.app = app
+        self.budget_for = budget_for
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.budget_for(scope) if self.budget_for is not None else None
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER.encode():
+                received = parse_timeout(value.decode("latin-1"))
+                if received is not None:
+                    budget = received if budget is None else min(budget, received)
+                break
+
+        if budget is not None and budget <= 0:
+            await deadline_exceeded_response(send)
+            return
+        started = False
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = set_deadline(budget)
+        try:
+            await self.app(scope, receive, send_tracking)
+        except DeadlineExceeded:
+            if started:
+                raise
+            await deadline_exceeded_response(send)
+        finally:
+            _deadline.reset(token)
+
+
+async def deadline_exceeded_response(send):
+    body = json.dumps({"detail": "Deadline exceeded"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 504,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
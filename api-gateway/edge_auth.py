@@ -0,0 +1,188 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from jose import JWTError, jwt
+
+# Niveaux d'accès d'une route
+PUBLIC = "public"
+AUTHENTICATED = "authenticated"
+EMPLOYEE = "employee"
+ADMIN = "admin"
+
+# En-têtes d'identité transmis aux services ; ceux envoyés par les clients sont ignorés
+IDENTITY_HEADERS = ("x-user-sub", "x-user-id", "x-user-is-admin", "x-user-is-employee")
+
+
+class EdgeAuthError(Exception):
+    """Requête rejetée par l'API Gateway faute d'authentification ou de droits suffisants."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class Identity:
+    """Identité extraite d'un token vérifié (user_id est absent des tokens émis avant son ajout)."""
+    subject: str
+    is_admin: bool
+    is_employee: bool
+    expires_at: Optional[float]
+    user_id: Optional[int] = None
+
+    def headers(self) -> Dict[str, str]:
+        """Renvoie les en-têtes d'identité à transmettre aux services."""
+        headers = {
+            "x-user-sub": self.subject,
+            "x-user-is-admin": "true" if self.is_admin else "false",
+            "x-user-is-employee": "true" if self.is_employee else "false",
+        }
+        if self.user_id is not None:
+            headers["x-user-id"] = str(self.user_id)
+        return headers
+
+
+class TokenVerifier:
+    """
+    Vérifie les tokens JWT émis par le service d'authentification.
+
+    Les tokens déjà vérifiés sont conservés dans un cache LRU jusqu'à leur
+    expiration (`exp`) : les requêtes suivantes d'un même client ne refont ni
+    le décodage ni la vérification de signature. La clé du cache est le token
+    complet, pour qu'une signature valide associée à d'autres données ne puisse
+    pas être confondue avec le token vérifié.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str = "HS256", max_entries: int = 10000):
+        """
+        Initialise le vérificateur.
+
+        Args:
+            secret_key: La clé partagée avec le service d'authentification
+            algorithm: L'algorithme de signature des tokens
+            max_entries: Nombre maximum de tokens vérifiés conservés
+        """
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Identity]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def verify(self, token: str) -> Optional[Identity]:
+        """
+        Vérifie un token et renvoie l'identité qu'il porte.
+
+        Args:
+            token: Le token JWT
+
+        Returns:
+            L'identité, ou None si le token est invalide ou expiré
+        """
+        now = time.time()
+        identity = self.entries.get(token)
+        if identity is not None:
+            if identity.expires_at > now:
+                self.entries.move_to_end(token)
+                self.hits += 1
+                return identity
+            del self.entries[token]
+
+        self.misses += 1
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            self.rejected += 1
+            return None
+        subject = payload.get("sub")
+        if not subject:
+            self.rejected += 1
+            return None
+        expires_at = payload.get("exp")
+        user_id = payload.get("user_id")
+        identity = Identity(
+            subject=str(subject),
+            is_admin=bool(payload.get("is_admin", False)),
+            is_employee=bool(payload.get("is_employee", False)),
+            expires_at=float(expires_at) if expires_at is not None else None,
+            user_id=user_id if isinstance(user_id, int) and not isinstance(user_id, bool) else None,
+        )
+        # Un token sans date d'expiration est vérifié à chaque requête
+        if identity.expires_at is not None:
+            self.entries[token] = identity
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return identity
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+        }
+
+
+class EdgeAuthenticator:
+    """
+    Contrôle d'accès à l'entrée de l'API Gateway.
+
+    Le niveau d'accès requis par chaque route est déclaré dans la table de
+    routage (routes.py) ; les requêtes non authentifiées ou sans les droits
+    requis sont rejetées sans solliciter le service.
+    """
+
+    def __init__(self, verifier: TokenVerifier, enabled: bool = True):
+        """
+        Initialise le contrôle d'accès.
+
+        Args:
+            verifier: Le vérificateur de tokens
+            enabled: Si faux, aucune requête n'est rejetée ni identifiée
+        """
+        self.verifier = verifier
+        self.enabled = enabled
+
+    def check(self, access: str, authorization: Optional[str]) -> Optional[Identity]:
+        """
+        Vérifie qu'une requête satisfait un niveau d'accès.
+
+        Args:
+            access: Le niveau d'accès requis
+            authorization: La valeur de l'en-tête Authorization
+
+        Returns:
+            L'identité de l'utilisateur, ou None pour une route publique
+
+        Raises:
+            EdgeAuthError: Si le token est absent ou invalide (401) ou si les
+                droits sont insuffisants (403)
+        """
+        if not self.enabled or access == PUBLIC:
+            return None
+
+        scheme, _, token = (authorization or "").partition(" ")
+        identity = self.verifier.verify(token.strip()) if scheme.lower() == "bearer" and token else None
+        if identity is None:
+            raise EdgeAuthError(401, "Could not validate credentials")
+        if access == ADMIN and not identity.is_admin:
+            raise EdgeAuthError(403, "Not enough permissions")
+        if access == EMPLOYEE and not (identity.is_employee or identity.is_admin):
+            raise EdgeAuthError(403, "Not enough permissions")
+        return identity
+
+
+# Les niveaux d'accès des routes sont déclarés dans la table de routage (routes.py)
+edge_auth = EdgeAuthenticator(
+    TokenVerifier(
+        os.getenv("SECRET_KEY", "YOUR_SECRET_KEY"),
+        max_entries=int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000")),
+    ),
+    enabled=os.getenv("EDGE_AUTH_ENABLED", "true").lower() in ("1", "true", "yes", "on"),
+)
@@ -0,0 +1,181 @@
+import os
+import time
+import random
+import itertools
+from typing import Dict, List, Optional
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+POWER_OF_TWO = "power_of_two"
+STRATEGIES = (ROUND_ROBIN, LEAST_OUTSTANDING, POWER_OF_TWO)
+
+
+def parse_replicas(value: str) -> List[str]:
+    """
+    Découpe une liste d'URL séparées par des virgules.
+
+    Args:
+        value: La valeur de configuration (ex: "http://tickets-1:8001,http://tickets-2:8001")
+
+    Returns:
+        La liste des URL, sans barre oblique finale
+    """
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+class Replica:
+    """Instance d'un service, avec son nombre de requêtes en cours et son état d'éjection."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.total_requests = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def snapshot(self, now: float) -> Dict[str, object]:
+        return {
+            "url": self.url,
+            "healthy": self.is_healthy(now),
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class LoadBalancer:
+    """
+    Répartit les requêtes d'un service entre ses instances.
+
+    Stratégies disponibles :
+        - round_robin : chaque instance à tour de rôle
+        - least_outstanding : l'instance ayant le moins de requêtes en cours
+        - power_of_two : la moins chargée de deux instances tirées au hasard
+
+    Une instance est éjectée temporairement après plusieurs échecs consécutifs ou
+    une sonde de santé en échec. Si toutes les instances sont éjectées, la
+    répartition se fait entre toutes (le disjoncteur du service prend le relais).
+    """
+
+    def __init__(self, service: str, urls: List[str], strategy: str = ROUND_ROBIN,
+                 eject_after: int = 3, ejection_duration: float = 30.0):
+        """
+        Initialise le répartiteur.
+
+        Args:
+            service: Le nom du service
+            urls: Les URL des instances du service
+            strategy: La stratégie de sélection
+            eject_after: Nombre d'échecs consécutifs entraînant l'éjection d'une instance
+            ejection_duration: Durée (en secondes) de l'éjection
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        if not urls:
+            raise ValueError(f"No replica configured for service {service}")
+        self.service = service
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.ejection_duration = ejection_duration
+        self._counter = itertools.count()
+
+    def choose(self, exclude: Optional[Replica] = None) -> Replica:
+        """
+        Sélectionne l'instance qui recevra la prochaine requête.
+
+        Args:
+            exclude: Une instance à écarter s'il en existe d'autres (requête de couverture)
+
+        Returns:
+            L'instance choisie
+        """
+        now = time.monotonic()
+        replicas = [replica for replica in self.replicas if replica is not exclude] or self.replicas
+        candidates = [replica for replica in replicas if replica.is_healthy(now)] or replicas
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == LEAST_OUTSTANDING:
+            return min(candidates, key=lambda replica: replica.outstanding)
+        if self.strategy == POWER_OF_TWO:
+            first, second = random.sample(candidates, 2)
+            return first if first.outstanding <= second.outstanding else second
+        return candidates[next(self._counter) % len(candidates)]
+
+    def acquire(self, replica: Replica):
+        """Comptabilise une requête envoyée à une instance."""
+        replica.outstanding += 1
+        replica.total_requests += 1
+
+    def release(self, replica: Replica):
+        """Comptabilise la fin d'une requête envoyée à une instance."""
+        replica.outstanding = max(0, replica.outstanding - 1)
+
+    def record(self, replica: Replica, success: bool):
+        """
+        Enregistre le résultat d'un appel et éjecte l'instance si nécessaire.
+
+        Args:
+            replica: L'instance appelée
+            success: False en cas d'erreur réseau ou d'erreur serveur
+        """
+        if success:
+            replica.consecutive_failures = 0
+            return
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.eject_after:
+            self.eject(replica)
+
+    def eject(self, replica: Replica):
+        """Éjecte une instance pour la durée configurée."""
+        replica.ejected_until = time.monotonic() + self.ejection_duration
+
+    def restore(self, replica: Replica):
+        """Remet une instance en service."""
+        replica.ejected_until = 0.0
+        replica.consecutive_failures = 0
+
+    def find(self, url: str) -> Optional[Replica]:
+        """Renvoie l'instance correspondant à une URL."""
+        for replica in self.replicas:
+            if replica.url == url:
+                return replica
+        return None
+
+    def healthy_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for replica in self.replicas if replica.is_healthy(now))
+
+    def snapshot(self) -> Dict[str, object]:
+        """Renvoie l'état du répartiteur et de ses instances."""
+        now = time.monotonic()
+        return {
+            "strategy": self.strategy,
+            "replicas": [replica.snapshot(now) for replica in self.replicas],
+        }
+
+
+def build_balancers(endpoints: Dict[str, List[str]]) -> Dict[str, LoadBalancer]:
+    """
+    Crée un répartiteur par service. La stratégie se configure par service avec
+    la variable <SERVICE>_LB_STRATEGY.
+
+    Args:
+        endpoints: Dictionnaire associant le nom de chaque service à ses URL
+
+    Returns:
+        Dictionnaire associant le nom de chaque service à son répartiteur
+    """
+    return {
+        name: LoadBalancer(
+            name,
+            urls,
+            strategy=os.getenv(f"{name.upper()}_LB_STRATEGY", ROUND_ROBIN),
+            eject_after=int(os.getenv("LB_EJECT_AFTER_FAILURES", "3")),
+            ejection_duration=float(os.getenv("LB_EJECTION_SECONDS", "30")),
+        )
+        for name, urls in endpoints.items()
+    }
@@ -1,26 +1,124 @@
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.middleware.exceptions import ExceptionMiddleware
 import httpx
 import os
+import time
+import asyncio
+import json
 from dotenv import load_dotenv
 import logging
-from typing import Dict, Any
-from rate_limiter import auth_limiter, api_limiter
+from typing import Dict, Any, Optional, Tuple
+from contextlib import asynccontextmanager
+from rate_limiter import auth_limiter, api_limiter, rate_limit_backend, sweep_periodically, RATE_LIMIT_SWEEP_INTERVAL
+from rate_limit_backends import RedisBackend
+from pools import build_pools
+from load_balancer import Replica, build_balancers, parse_replicas
+from circuit_breaker import OPEN, HealthProber, build_breakers
+from cache import response_cache, invalidate_after_write, etag_matches
+from coalescing import coalescing_key, single_flight
+from middleware import API_MESSAGE, RATE_LIMIT_REJECTIONS, SHED_MESSAGE, GatewayMiddleware
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, build_multiprocess_metrics
+from tracing import TracingMiddleware, build_tracer
+import deadline
+from deadline import DeadlineMiddleware
+from batch import BatchError, BatchExecutor, batch_cost, parse_batch
+from aggregation import AggregationError, compose_my_tickets
+from access_log import setup_logging
+from admission import build_admission_limiter
+from retry import build_hedging_policy, build_retry_budget, build_retry_policy
+from compression import CompressionMiddleware, compression_levels_from_env
+from edge_auth import IDENTITY_HEADERS, EdgeAuthError, edge_auth
+from waiting_room import QueueToken, RedisQueueStore, WaitingRoomError, build_waiting_room, coerce_offer_id
+from routes import METHODS, RoutePolicy, gateway_routes
 
 # Chargement des variables d'environnement
 load_dotenv()
 
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()]
+# Configuration du logging : les enregistrements sont écrits par un thread dédié
+# (file bornée) pour ne jamais bloquer la boucle d'événements
+log_pipeline = setup_logging(
+    "api-gateway",
+    json_format=os.getenv("LOG_FORMAT", "json").lower() == "json",
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0")),
 )
 logger = logging.getLogger("api-gateway")
 
+# Traçage distribué : contexte propagé aux services par l'en-tête traceparent
+tracer = build_tracer("api-gateway")
+
+# Configuration des services : chaque variable peut lister plusieurs instances
+# séparées par des virgules (ex: "http://tickets-1:8001,http://tickets-2:8001")
+SERVICE_ENDPOINTS = {
+    "auth": parse_replicas(os.getenv("AUTH_SERVICE_URL", "http://localhost:8000")),
+    "tickets": parse_replicas(os.getenv("TICKETS_SERVICE_URL", "http://localhost:8001")),
+    "admin": parse_replicas(os.getenv("ADMIN_SERVICE_URL", "http://localhost:8003")),
+    "validation": parse_replicas(os.getenv("VALIDATION_SERVICE_URL", "http://localhost:8002")),
+}
+
+# Un pool de connexions, un répartiteur et un disjoncteur par service
+pools = build_pools(SERVICE_ENDPOINTS)
+balancers = build_balancers(SERVICE_ENDPOINTS)
+breakers = build_breakers(SERVICE_ENDPOINTS)
+
+# Nouvelles tentatives des lectures dont le service n'a pas pu être joint et
+# requêtes de couverture des lectures lentes, dans la limite d'un budget commun
+retry_policy = build_retry_policy()
+retry_budget = build_retry_budget()
+hedging = build_hedging_policy()
+
+# Contrôle d'admission par priorité, piloté par la latence des services
+admission_limiter = build_admission_limiter()
+
+# Salle d'attente virtuelle des offres à forte demande (WAITING_ROOM_OFFERS)
+waiting_room = build_waiting_room()
+WAITING_ROOM_MAX_POLL_INTERVAL = float(os.getenv("WAITING_ROOM_MAX_POLL_INTERVAL", "15"))
+
+# Requêtes groupées : nombre maximum de sous-requêtes, et nombre de sous-requêtes
+# décomptées comme une seule requête par la limitation de débit
+BATCH_PATH = "/batch"
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_REQUESTS_PER_UNIT = int(os.getenv("BATCH_REQUESTS_PER_UNIT", "5"))
+
+# Nombre maximum de QR codes demandés simultanément par la page « Mes billets »
+MY_TICKETS_QR_CONCURRENCY = int(os.getenv("MY_TICKETS_QR_CONCURRENCY", "8"))
+
+# Agrégation des métriques des workers lancés par server.py (METRICS_MULTIPROC_DIR)
+multiprocess_metrics = build_multiprocess_metrics(REGISTRY)
+
+# Sonde de santé active des services (désactivée si l'intervalle vaut 0)
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))
+health_prober = HealthProber(pools, breakers, balancers, interval=HEALTH_PROBE_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ouvre les pools de connexions et démarre les tâches de fond au démarrage."""
+    for pool in pools.values():
+        pool.open()
+    if HEALTH_PROBE_INTERVAL > 0:
+        health_prober.start()
+    if multiprocess_metrics is not None:
+        multiprocess_metrics.start()
+    sweeper = asyncio.ensure_future(
+        sweep_periodically([auth_limiter, api_limiter], RATE_LIMIT_SWEEP_INTERVAL)
+    )
+    yield
+    sweeper.cancel()
+    await health_prober.stop()
+    if isinstance(rate_limit_backend, RedisBackend):
+        await rate_limit_backend.close()
+    if isinstance(waiting_room.store, RedisQueueStore):
+        await waiting_room.store.close()
+    for pool in pools.values():
+        await pool.close()
+    if multiprocess_metrics is not None:
+        multiprocess_metrics.stop()
+
 # Configuration de l'application
-app = FastAPI(title="API Gateway - Billetterie JO")
+app = FastAPI(title="API Gateway - Billetterie JO", lifespan=lifespan)
 
 # Configuration CORS
 app.add_middleware(
@@ -31,160 +129,698 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration des services
-SERVICE_ENDPOINTS = {
-    "auth": os.getenv("AUTH_SERVICE_URL", "http://localhost:8000"),
-    "tickets": os.getenv("TICKETS_SERVICE_URL", "http://localhost:8001"),
-    "admin": os.getenv("ADMIN_SERVICE_URL", "http://localhost:8003"),
-    "validation": os.getenv("VALIDATION_SERVICE_URL", "http://localhost:8002"),
+# Compression des réponses selon l'en-tête Accept-Encoding du client
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    levels=compression_levels_from_env(),
+)
+
+# Limitation de débit, en-têtes de sécurité HTTP et journal d'accès
+app.add_middleware(
+    GatewayMiddleware,
+    auth_limiter=auth_limiter,
+    api_limiter=api_limiter,
+    access_logger=log_pipeline.access_logger,
+    admission=admission_limiter,
+    routes=gateway_routes,
+    batch_path=BATCH_PATH,
+)
+
+# Échéance de chaque requête : temps alloué à la route, ou délai plus court demandé
+# par le client, transmis aux services (en-tête x-request-timeout-ms)
+app.add_middleware(DeadlineMiddleware, budget_for=lambda scope: gateway_routes.resolve(scope).timeout)
+
+# Span serveur de chaque requête, parent des appels aux services ; la décision
+# d'échantillonnage est prise ici, sans tenir compte d'un traceparent du client
+app.add_middleware(TracingMiddleware, tracer=tracer, trust_parent=False)
+
+# Métriques Prometheus des requêtes (middleware le plus externe, pour mesurer aussi les requêtes refusées)
+app.add_middleware(MetricsMiddleware, registry=REGISTRY, prefix="gateway_http")
+
+# En-têtes "hop-by-hop" propres à chaque connexion, qui ne doivent pas être relayés
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
 }
 
-# Client HTTP asynchrone
-http_client = httpx.AsyncClient()
-
-# Middleware pour le logging des requêtes
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
-    response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
-    return response
-
-# Middleware pour ajouter des en-têtes de sécurité HTTP
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    
-    # Ajouter des en-têtes de sécurité
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    response.headers["Content-Security-Policy"] = "default-src 'self'; img-src 'self' data: https://api.qrserver.com; style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline'"
-    
-    return response
-
-# Middleware pour limiter le taux de requêtes
-@app.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
-    client_ip = request.client.host
-    
-    # Appliquer différentes limites selon le type de requête
-    if request.url.path.startswith("/auth/token"):
-        # Limiter les tentatives d'authentification
-        allowed, wait_time = auth_limiter.is_allowed(client_ip)
-        if not allowed:
-            logger.warning(f"Rate limit exceeded for auth request from {client_ip}")
-            return JSONResponse(
-                status_code=429,
-                content={
-                    "detail": f"Trop de tentatives de connexion. Veuillez réessayer dans {wait_time} secondes."
-                }
+# Méthodes pour lesquelles le corps de la requête est transmis au service
+METHODS_WITH_BODY = {"POST", "PUT"}
+
+# En-têtes de requête conditionnelle, évalués par l'API Gateway pour les lectures mises en cache
+CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since"}
+
+def filter_headers(headers) -> Dict[str, str]:
+    """
+    Filtre les en-têtes à relayer entre le client et un service.
+    
+    Args:
+        headers: Les en-têtes d'origine (requête ou réponse)
+        
+    Returns:
+        Les en-têtes sans les en-têtes hop-by-hop, l'en-tête host ni les en-têtes
+        d'identité, qui ne sont renseignés que par l'API Gateway
+    """
+    return {
+        key: value
+        for key, value in headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+        and key.lower() != "host"
+        and key.lower() not in IDENTITY_HEADERS
+    }
+
+def is_cacheable(response: httpx.Response) -> bool:
+    """Indique si le service autorise la mise en cache partagée de sa réponse."""
+    cache_control = response.headers.get("cache-control", "").lower()
+    return "no-store" not in cache_control and "private" not in cache_control
+
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "gateway_upstream_request_duration_seconds", "Durée des appels aux services", ("service", "outcome")
+)
+
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "gateway_upstream_retries_total", "Nouvelles tentatives et requêtes de couverture envoyées aux services",
+    ("service", "kind"),
+)
+RETRY_BUDGET_EXHAUSTED = REGISTRY.counter(
+    "gateway_retry_budget_exhausted_total", "Tentatives supplémentaires refusées faute de budget", ("service",)
+)
+
+def record_latency(service: str, duration: float, success: bool):
+    """Enregistre la latence d'un appel et la transmet au contrôle d'admission et à la couverture des lectures."""
+    UPSTREAM_DURATION.labels(service, "success" if success else "error").observe(duration)
+    if success:
+        hedging.record(service, duration)
+    if admission_limiter is not None:
+        admission_limiter.record(service, duration, success)
+
+class ConnectFailed(HTTPException):
+    """Le service n'a pas pu être joint : la requête ne l'a pas atteint et peut être renvoyée."""
+
+    def __init__(self, service: str, replica: Replica):
+        super().__init__(status_code=503, detail=f"Service {service} unavailable")
+        self.replica = replica
+
+async def send_upstream(service: str, method: str, upstream_path: str, headers: Dict[str, str], content=None) -> Tuple[Replica, httpx.Response]:
+    """
+    Envoie une requête à une instance du service et traduit les erreurs réseau en erreurs HTTP.
+    
+    L'instance est choisie par le répartiteur du service ; le résultat de l'appel
+    est enregistré par le répartiteur et par le disjoncteur du service. L'appel
+    est annulé, avec une réponse 504, si l'échéance de la requête est atteinte
+    avant la réception des en-têtes de la réponse.
+    
+    Les lectures (GET), idempotentes, sont renvoyées à une autre instance si le
+    service n'a pas pu être joint, et couvertes par une seconde requête si elles
+    tardent (voir `send_hedged`), dans la limite du budget de tentatives.
+    
+    Args:
+        upstream_path: Le chemin dans le service, query string comprise
+    
+    Returns:
+        Un tuple (instance appelée, réponse), à libérer avec `release_upstream`
+    """
+    # Ne pas solliciter le service pour une requête dont le client n'attend plus la réponse,
+    # avant de réserver une requête d'essai du disjoncteur
+    budget = deadline.remaining()
+    if budget is not None and budget <= 0:
+        raise HTTPException(status_code=504, detail=f"Deadline exceeded before calling service {service}")
+    
+    # Échouer immédiatement si le disjoncteur du service est ouvert
+    breaker = breakers[service]
+    if not breaker.allow_request():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service {service} unavailable",
+            headers={"Retry-After": str(breaker.retry_after())},
+        )
+    
+    try:
+        if method != "GET":
+            return await call_replica(service, balancers[service].choose(), method, upstream_path, headers, content)
+        return await send_with_retries(service, upstream_path, headers)
+    except asyncio.CancelledError:
+        # Requête annulée sans résultat : la requête d'essai éventuellement réservée est rendue
+        breaker.release()
+        raise
+
+async def send_with_retries(service: str, upstream_path: str, headers: Dict[str, str]) -> Tuple[Replica, httpx.Response]:
+    """Envoie une lecture, renvoyée à une autre instance si le service n'a pas pu être joint (voir `send_upstream`)."""
+    breaker = breakers[service]
+    retry_budget.deposit()
+    attempt, failed = 1, None
+    while True:
+        try:
+            return await send_hedged(service, upstream_path, headers, exclude=failed)
+        except ConnectFailed as e:
+            delay = retry_policy.backoff(attempt)
+            left = deadline.remaining()
+            if (attempt >= retry_policy.max_attempts or breaker.state == OPEN
+                    or (left is not None and left <= delay)):
+                raise
+            if not retry_budget.try_withdraw():
+                RETRY_BUDGET_EXHAUSTED.labels(service).inc()
+                raise
+            UPSTREAM_RETRIES.labels(service, "retry").inc()
+            logger.warning(f"Retrying GET {upstream_path} on service {service} after a connection failure")
+            attempt, failed = attempt + 1, e.replica
+            await asyncio.sleep(delay)
+
+async def send_hedged(service: str, upstream_path: str, headers: Dict[str, str], exclude=None) -> Tuple[Replica, httpx.Response]:
+    """
+    Envoie une lecture et, si elle n'a pas reçu de réponse après le délai de
+    couverture du service (p95 de sa latence), envoie une seconde requête à une
+    autre instance : la première réponse reçue est retenue et l'autre requête annulée.
+    
+    Args:
+        exclude: Une instance à éviter (instance injoignable lors de la tentative précédente)
+    """
+    balancer = balancers[service]
+    replica = balancer.choose(exclude)
+    hedge_delay = hedging.delay(service, len(balancer.replicas))
+    if hedge_delay is None:
+        return await call_replica(service, replica, "GET", upstream_path, headers)
+    
+    tasks = [asyncio.ensure_future(call_replica(service, replica, "GET", upstream_path, headers))]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done:
+            if retry_budget.try_withdraw():
+                UPSTREAM_RETRIES.labels(service, "hedge").inc()
+                hedge = balancer.choose(exclude=replica)
+                tasks.append(asyncio.ensure_future(call_replica(service, hedge, "GET", upstream_path, headers)))
+            else:
+                RETRY_BUDGET_EXHAUSTED.labels(service).inc()
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # La requête perdante est annulée ; sa réponse, si elle est déjà reçue, est libérée
+        for task in tasks:
+            if task is not winner:
+                task.cancel()
+                asyncio.ensure_future(discard_upstream(service, task))
+
+async def discard_upstream(service: str, task: asyncio.Future):
+    try:
+        replica, response = await task
+    except (asyncio.CancelledError, Exception):
+        return
+    await release_upstream(service, replica, response)
+
+async def call_replica(service: str, replica: Replica, method: str, upstream_path: str, headers: Dict[str, str], content=None) -> Tuple[Replica, httpx.Response]:
+    """Envoie une requête à une instance donnée du service (voir `send_upstream`)."""
+    breaker = breakers[service]
+    pool = pools[service]
+    balancer = balancers[service]
+    target_url = f"{replica.url}{upstream_path}"
+    balancer.acquire(replica)
+    # Le span de l'appel couvre l'envoi de la requête jusqu'à la réception des en-têtes de la réponse
+    span = tracer.start_span(f"{method} {service}", kind="client", attributes={
+        "peer.service": service, "http.method": method, "http.url": target_url,
+    })
+    started = time.perf_counter()
+    with span:
+        try:
+            upstream_request = pool.build_request(
+                method, target_url, headers=deadline.inject(tracer.inject(headers, span)), content=content
             )
+            response = await asyncio.wait_for(pool.send(upstream_request), deadline.remaining())
+        except asyncio.CancelledError:
+            # Requête de couverture perdante ou requête abandonnée : ni succès ni échec de
+            # l'instance (la requête d'essai du disjoncteur est rendue par `send_upstream`)
+            balancer.release(replica)
+            raise
+        except asyncio.TimeoutError:
+            balancer.release(replica)
+            balancer.record(replica, False)
+            breaker.record_failure()
+            record_latency(service, time.perf_counter() - started, False)
+            logger.warning(f"Deadline exceeded calling {target_url}")
+            raise HTTPException(status_code=504, detail=f"Service {service} did not respond in time")
+        except httpx.RequestError as e:
+            balancer.release(replica)
+            balancer.record(replica, False)
+            breaker.record_failure()
+            record_latency(service, time.perf_counter() - started, False)
+            logger.error(f"Error routing request to {target_url}: {str(e)}")
+            if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                raise ConnectFailed(service, replica)
+            raise HTTPException(status_code=503, detail=f"Service {service} unavailable")
+        except Exception as e:
+            balancer.release(replica)
+            breaker.record_failure()
+            logger.error(f"Unexpected error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+    
+    success = response.status_code < 500
+    duration = time.perf_counter() - started
+    balancer.record(replica, success)
+    record_latency(service, duration, success)
+    if success:
+        breaker.record_success(duration)
     else:
-        # Limiter les requêtes API générales
-        allowed, wait_time = api_limiter.is_allowed(client_ip)
-        if not allowed:
-            logger.warning(f"Rate limit exceeded for API request from {client_ip}")
-            return JSONResponse(
-                status_code=429,
-                content={
-                    "detail": f"Trop de requêtes. Veuillez réessayer dans {wait_time} secondes."
-                }
-            )
+        breaker.record_failure()
+    return replica, response
+
+async def release_upstream(service: str, replica: Replica, response: httpx.Response):
+    """Libère la réponse d'un service et sa connexion une fois le corps consommé."""
+    try:
+        await pools[service].release(response)
+    finally:
+        balancers[service].release(replica)
+
+async def fetch_buffered(service: str, upstream_path: str, headers: Dict[str, str], cache_key=None, cache_ttl=None):
+    """
+    Effectue une lecture (GET) et renvoie la réponse entièrement lue, sans la décompresser.
     
-    # Ajouter des en-têtes pour informer le client des limites
-    response = await call_next(request)
+    La réponse est mise en cache si une durée de vie est fournie et que le service
+    l'autorise. Si le cache contient une version expirée portant un ETag, la lecture
+    est conditionnelle (If-None-Match) : une réponse 304 du service prolonge l'entrée
+    en cache sans retransférer le corps.
     
-    if request.url.path.startswith("/auth/token"):
-        remaining = auth_limiter.get_remaining_requests(client_ip)
-        response.headers["X-RateLimit-Limit"] = str(auth_limiter.max_requests)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(auth_limiter.window_size)
-    else:
-        remaining = api_limiter.get_remaining_requests(client_ip)
-        response.headers["X-RateLimit-Limit"] = str(api_limiter.max_requests)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(api_limiter.window_size)
+    Returns:
+        Un tuple (code de statut, en-têtes, corps brut, état du cache : MISS ou REVALIDATED)
+    """
+    # La réponse lue ici peut être partagée entre plusieurs clients : les conditions
+    # du client sont évaluées par l'API Gateway, pas par le service
+    headers = {key: value for key, value in headers.items() if key.lower() not in CONDITIONAL_HEADERS}
+    stale = response_cache.get_stale(cache_key) if cache_ttl is not None else None
+    if stale is not None:
+        headers["if-none-match"] = stale.etag
+    replica, response = await send_upstream(service, "GET", upstream_path, headers)
+    try:
+        body = await asyncio.wait_for(read_raw(response), deadline.remaining())
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Service {service} did not respond in time")
+    finally:
+        await release_upstream(service, replica, response)
+    if stale is not None and response.status_code == 304:
+        response_cache.revalidate(cache_key, stale, cache_ttl)
+        return stale.status_code, stale.headers, stale.body, "REVALIDATED"
+    response_headers = filter_headers(response.headers)
+    if cache_ttl is not None and response.status_code == 200 and is_cacheable(response):
+        response_cache.set(cache_key, response.status_code, response_headers, body, cache_ttl)
+    return response.status_code, response_headers, body, "MISS"
+
+async def read_raw(response: httpx.Response) -> bytes:
+    return b"".join([chunk async for chunk in response.aiter_raw()])
+
+def buffered_response(request: Request, status_code: int, headers: Dict[str, str], body: bytes) -> Response:
+    """
+    Construit la réponse d'une lecture entièrement lue, ou une réponse 304 sans
+    corps si l'en-tête If-None-Match du client désigne son ETag.
+    """
+    etag = headers.get("etag")
+    if status_code == 200 and etag_matches(request.headers.get("if-none-match"), etag):
+        not_modified = {"etag": etag}
+        if "X-Cache" in headers:
+            not_modified["X-Cache"] = headers["X-Cache"]
+        return Response(status_code=304, headers=not_modified)
+    return Response(content=body, status_code=status_code, headers=headers)
+
+async def read_json(gateway_path: str, headers: Dict[str, str]) -> Tuple[int, Any]:
+    """
+    Lit une ressource d'un service pour une réponse composée par l'API Gateway.
+    
+    La lecture bénéficie, comme les requêtes relayées, du cache et du regroupement
+    des lectures identiques simultanées. Les erreurs HTTP (service indisponible,
+    échéance atteinte) sont renvoyées comme code de statut.
     
-    return response
+    Args:
+        gateway_path: Le chemin de la ressource dans l'API Gateway (ex: /tickets/offers/1)
+    
+    Returns:
+        Un tuple (code de statut, corps JSON ou None)
+    """
+    route = gateway_routes.match("GET", gateway_path)
+    if route.service is None:
+        return 404, None
+    service, path, cache_ttl = route.service, route.upstream_path(gateway_path), route.cache_ttl
+    cache_key = response_cache.make_key(service, path, []) if cache_ttl is not None else None
+    cached = response_cache.get(cache_key) if cache_key is not None else None
+    try:
+        if cached is not None:
+            status_code, body = cached.status_code, cached.body
+        else:
+            fetch = lambda: fetch_buffered(service, path, headers, cache_key, cache_ttl)
+            if route.coalesce is not None:
+                key = coalescing_key(route.coalesce, "GET", path, [], headers.get("authorization"))
+                status_code, _, body, _ = await single_flight.do(key, fetch)
+            else:
+                status_code, _, body, _ = await fetch()
+    except HTTPException as e:
+        return e.status_code, None
+    try:
+        return status_code, json.loads(body) if body else None
+    except ValueError:
+        return 502, None
+
+def authenticate(request: Request):
+    """Vérifie le token de la requête selon le niveau d'accès de sa route et traduit les refus en erreurs HTTP."""
+    try:
+        with tracer.start_span("edge_auth"):
+            return edge_auth.check(gateway_routes.resolve(request.scope).access, request.headers.get("authorization"))
+    except EdgeAuthError as e:
+        headers = {"WWW-Authenticate": "Bearer"} if e.status_code == 401 else None
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+def waiting_room_member(request: Request, identity) -> str:
+    """Identifie l'utilisateur dans la salle d'attente (adresse IP si l'authentification est désactivée)."""
+    return identity.subject if identity is not None else request.client.host
+
+def waiting_room_error(e: WaitingRoomError) -> HTTPException:
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after is not None else None
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+def is_purchase(service: str, path: str, method: str) -> bool:
+    """Indique si la requête est un achat de billet (POST /tickets/tickets/)."""
+    return service == "tickets" and method == "POST" and path.rstrip("/") == "/tickets"
+
+async def check_waiting_room(request: Request, identity, body: bytes) -> Optional[QueueToken]:
+    """
+    Vérifie le jeton de file d'attente (en-tête X-Queue-Token) d'un achat portant
+    sur une offre en salle d'attente, et le réserve pour cet achat. Les corps
+    invalides sont laissés à la validation du service ; une offre qui ne désigne
+    pas un entier est refusée (422), faute de savoir si elle est en salle d'attente.
+
+    Returns:
+        Le jeton réservé, ou None si l'achat ne passe pas par la salle d'attente
+    """
+    try:
+        offer_id = json.loads(body).get("offer_id")
+    except (ValueError, AttributeError):
+        return None
+    if offer_id is None:
+        return None
+    try:
+        offer_id = coerce_offer_id(offer_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="offer_id must be an integer")
+    if not waiting_room.is_active(offer_id):
+        return None
+    try:
+        return await waiting_room.check_purchase(
+            offer_id, waiting_room_member(request, identity), request.headers.get("x-queue-token")
+        )
+    except WaitingRoomError as e:
+        raise waiting_room_error(e)
 
 # Fonction pour router les requêtes vers les services appropriés
-async def route_request(service: str, path: str, request: Request):
+async def route_request(path: str, request: Request):
+    """
+    Relaie une requête vers un service en mode streaming.
+    
+    Le service et les politiques de la requête (accès, cache, regroupement) sont
+    ceux de sa route dans la table de routage, résolue une seule fois par requête.
+    Le corps de la requête est transmis au service au fil de sa réception et la
+    réponse du service est renvoyée au client octet par octet, sans décodage ni
+    ré-encodage JSON, ce qui permet aussi de relayer des contenus non JSON.
+    Les lectures du catalogue sont servies depuis le cache et les lectures
+    identiques simultanées sont regroupées en un seul appel au service.
+    
+    Args:
+        path: Le chemin de la requête dans le service
+    """
+    route: RoutePolicy = gateway_routes.resolve(request.scope)
+    service = route.service
     if service not in SERVICE_ENDPOINTS:
         raise HTTPException(status_code=404, detail=f"Service {service} not found")
     
-    # Construire l'URL de destination
-    target_url = f"{SERVICE_ENDPOINTS[service]}{path}"
+    method = request.method.upper()
+    if method not in METHODS:
+        raise HTTPException(status_code=405, detail=f"Method {method.lower()} not allowed")
     
-    # Extraire les headers, les paramètres de query et le body de la requête
-    headers = dict(request.headers)
-    headers.pop("host", None)  # Supprimer le header host pour éviter les conflits
+    # Vérifier le token à l'entrée, avant toute lecture en cache ou tout appel au service
+    identity = authenticate(request)
     
-    # Récupérer les paramètres de query
-    params = dict(request.query_params)
+    # Les achats d'une offre en salle d'attente exigent un jeton de file admis ;
+    # le corps, de petite taille, est alors lu pour connaître l'offre
+    content = None
+    queue_token = None
+    if waiting_room.rates and is_purchase(service, path, method):
+        content = await request.body()
+        queue_token = await check_waiting_room(request, identity, content)
     
-    try:
-        # Récupérer le body de la requête si présent
-        body = await request.body()
-        body = body if body else None
-        
-        # Effectuer la requête vers le service cible
-        method = request.method.lower()
-        if method == "get":
-            response = await http_client.get(target_url, headers=headers, params=params)
-        elif method == "post":
-            response = await http_client.post(target_url, headers=headers, params=params, content=body)
-        elif method == "put":
-            response = await http_client.put(target_url, headers=headers, params=params, content=body)
-        elif method == "delete":
-            response = await http_client.delete(target_url, headers=headers, params=params)
+    # Construire le chemin de destination en conservant la query string telle quelle
+    upstream_path = f"{path}?{request.url.query}" if request.url.query else path
+    
+    query_params = request.query_params.multi_items()
+    
+    # Servir les lectures du catalogue depuis le cache si possible
+    cache_ttl = route.cache_ttl if method == "GET" else None
+    cache_key = None
+    if cache_ttl is not None:
+        cache_key = response_cache.make_key(service, path, query_params)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return buffered_response(request, cached.status_code, {**cached.headers, "X-Cache": "HIT"}, cached.body)
+    
+    # Extraire les headers de la requête et y ajouter l'identité vérifiée
+    headers = filter_headers(request.headers)
+    if identity is not None:
+        headers.update(identity.headers())
+    
+    # Les lectures mises en cache ou regroupées sont lues entièrement
+    coalesce_rule = route.coalesce if method == "GET" else None
+    if cache_ttl is not None or coalesce_rule is not None:
+        fetch = lambda: fetch_buffered(service, upstream_path, headers, cache_key, cache_ttl)
+        if coalesce_rule is not None:
+            key = coalescing_key(
+                coalesce_rule, method, path, query_params, request.headers.get("authorization")
+            )
+            status_code, response_headers, body, cache_status = await single_flight.do(key, fetch)
         else:
-            raise HTTPException(status_code=405, detail=f"Method {method} not allowed")
-        
-        # Retourner la réponse du service
-        return JSONResponse(
-            content=response.json() if response.content else {},
-            status_code=response.status_code,
-            headers=dict(response.headers)
-        )
-    except httpx.RequestError as e:
-        logger.error(f"Error routing request to {target_url}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Service {service} unavailable")
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+            status_code, response_headers, body, cache_status = await fetch()
+        if cache_ttl is not None:
+            response_headers = {**response_headers, "X-Cache": cache_status}
+        return buffered_response(request, status_code, response_headers, body)
+    
+    # Le corps est relayé en flux plutôt que lu entièrement en mémoire
+    if content is None and method in METHODS_WITH_BODY:
+        content = request.stream()
+    try:
+        replica, response = await send_upstream(service, method, upstream_path, headers, content)
+    except BaseException:
+        # L'achat n'a pas abouti : le jeton de file d'attente reste utilisable
+        if queue_token is not None:
+            await waiting_room.release(queue_token)
+        raise
+    if queue_token is not None and not response.is_success:
+        await waiting_room.release(queue_token)
+    
+    # Une écriture réussie rend obsolètes les lectures en cache qui en dépendent
+    if method != "GET" and response.is_success:
+        invalidate_after_write(response_cache, service, path)
+    
+    # Retourner la réponse du service sans la décoder (le contenu éventuellement
+    # compressé est relayé tel quel avec ses en-têtes)
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=filter_headers(response.headers),
+        background=BackgroundTask(release_upstream, service, replica, response),
+    )
 
 # Routes pour chaque service
 @app.get("/health")
 async def health_check():
     """Vérification de l'état de l'API Gateway"""
-    return {"status": "healthy", "services": SERVICE_ENDPOINTS}
-
-# Routes pour le service d'authentification
-@app.api_route("/auth{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def auth_route(request: Request, path: str):
-    """Route pour le service d'authentification"""
-    return await route_request("auth", path, request)
-
-# Routes pour le service de billetterie
-@app.api_route("/tickets{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def tickets_route(request: Request, path: str):
-    """Route pour le service de billetterie"""
-    return await route_request("tickets", path, request)
-
-# Routes pour le service d'administration
-@app.api_route("/admin{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def admin_route(request: Request, path: str):
-    """Route pour le service d'administration"""
-    return await route_request("admin", path, request)
-
-# Routes pour le service de validation
-@app.api_route("/validation{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def validation_route(request: Request, path: str):
-    """Route pour le service de validation"""
-    return await route_request("validation", path, request)
+    circuits = {name: breaker.snapshot() for name, breaker in breakers.items()}
+    degraded = any(circuit["state"] != "closed" for circuit in circuits.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "services": SERVICE_ENDPOINTS,
+        "circuits": circuits,
+        "load_balancing": {name: balancer.snapshot() for name, balancer in balancers.items()},
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métriques de l'API Gateway au format Prometheus (additionnées sur tous les workers)"""
+    if multiprocess_metrics is not None:
+        return Response(await asyncio.to_thread(multiprocess_metrics.render), media_type=CONTENT_TYPE)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/cache")
+async def cache_stats():
+    """Compteurs du cache de réponses de l'API Gateway"""
+    return response_cache.stats()
+
+@app.get("/health/coalescing")
+async def coalescing_stats():
+    """Compteurs de regroupement des lectures simultanées"""
+    return single_flight.stats()
+
+@app.get("/health/rate-limits")
+async def rate_limits_stats():
+    """Nombre d'adresses IP suivies par les limiteurs de taux"""
+    return {"auth": auth_limiter.stats(), "api": api_limiter.stats()}
+
+@app.get("/health/logging")
+async def logging_stats():
+    """Compteurs de la file de journalisation (enregistrements abandonnés ou échantillonnés)"""
+    return log_pipeline.stats()
+
+@app.get("/health/auth")
+async def auth_stats():
+    """Compteurs du cache des tokens vérifiés par l'API Gateway"""
+    return edge_auth.verifier.stats()
+
+@app.get("/health/admission")
+async def admission_stats():
+    """Limite de concurrence adaptative et requêtes délestées par classe de priorité"""
+    if admission_limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission_limiter.snapshot()}
+
+@app.get("/health/waiting-room")
+async def waiting_room_stats():
+    """Débits d'admission et files des offres en salle d'attente"""
+    return waiting_room.stats()
+
+@app.get("/health/retries")
+async def retries_stats():
+    """Budget des nouvelles tentatives et délais de couverture des lectures par service"""
+    return {"budget": retry_budget.stats(), "hedging": hedging.stats()}
+
+@app.get("/health/pools")
+async def pools_stats():
+    """Statistiques des pools de connexions vers les services"""
+    return {name: pool.stats() for name, pool in pools.items()}
+
+# Requêtes groupées
+# Les sous-requêtes sont confiées au routeur ; les exceptions HTTP qu'elles lèvent
+# (token refusé, service indisponible...) sont converties en réponses par les
+# gestionnaires d'exceptions de l'application, comme pour une requête directe
+batch_executor = BatchExecutor(
+    ExceptionMiddleware(app.router, handlers=app.exception_handlers), admission_limiter, gateway_routes, SHED_MESSAGE
+)
+
+@app.post(BATCH_PATH)
+async def batch(request: Request):
+    """
+    Exécute plusieurs lectures en parallèle et renvoie leurs résultats en une seule réponse.
+
+    La requête groupée est décomptée par la limitation de débit comme une requête
+    par tranche de BATCH_REQUESTS_PER_UNIT sous-requêtes.
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    try:
+        subrequests = parse_batch(await request.body(), BATCH_MAX_REQUESTS, BATCH_PATH, gateway_routes)
+    except BatchError as e:
+        subrequests, error = None, e
+    cost = batch_cost(len(subrequests), BATCH_REQUESTS_PER_UNIT) if subrequests else 1
+    allowed, wait_time, remaining = await api_limiter.check(client_ip, cost)
+    if not allowed:
+        RATE_LIMIT_REJECTIONS.labels("api").inc()
+        logger.warning("Rate limit exceeded for %s from %s", BATCH_PATH, client_ip)
+        raise HTTPException(status_code=429, detail=API_MESSAGE.format(wait_time),
+                            headers={"Retry-After": str(wait_time)})
+    if subrequests is None:
+        raise HTTPException(status_code=400, detail=error.detail)
+
+    responses = await batch_executor.run(request.scope, subrequests)
+    return JSONResponse({"responses": responses}, headers={
+        "X-RateLimit-Limit": str(api_limiter.max_requests),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(api_limiter.window_size),
+    })
+
+# Page « Mes billets » composée par l'API Gateway à partir du service de billetterie
+@app.get("/me/tickets/full")
+async def my_tickets(request: Request):
+    """
+    Page « Mes billets » en une seule requête : les billets de l'utilisateur, le
+    détail de leurs offres et leurs QR codes, lus en parallèle auprès du service
+    de billetterie. Un élément indisponible vaut null et est signalé dans "errors".
+    """
+    identity = authenticate(request)
+    if identity is None or identity.user_id is None:
+        raise HTTPException(
+            status_code=401, detail="Token does not identify a user", headers={"WWW-Authenticate": "Bearer"}
+        )
+    headers = {"authorization": request.headers.get("authorization", ""), **identity.headers()}
+    try:
+        return await compose_my_tickets(
+            lambda path: read_json(f"/tickets{path}", headers), identity.user_id, MY_TICKETS_QR_CONCURRENCY
+        )
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+# Salle d'attente virtuelle
+@app.post("/waiting-room/{offer_id}/join")
+async def join_waiting_room(offer_id: int, request: Request):
+    """Place l'utilisateur dans la file d'une offre et renvoie son jeton de file d'attente"""
+    identity = authenticate(request)
+    if not waiting_room.is_active(offer_id):
+        raise HTTPException(status_code=404, detail="No waiting room for this offer")
+    token, status = await waiting_room.join(offer_id, waiting_room_member(request, identity))
+    return {"offer_id": offer_id, "token": token, **status.as_dict()}
+
+def queue_token(request: Request) -> str:
+    # Les clients EventSource ne peuvent pas ajouter d'en-tête : le jeton peut aussi être passé en paramètre
+    return request.headers.get("x-queue-token") or request.query_params.get("token")
+
+@app.get("/waiting-room/{offer_id}/status")
+async def waiting_room_status(offer_id: int, request: Request):
+    """Position du jeton dans la file d'une offre"""
+    try:
+        status = await waiting_room.status(offer_id, queue_token(request))
+    except WaitingRoomError as e:
+        raise waiting_room_error(e)
+    return status.as_dict()
+
+@app.get("/waiting-room/{offer_id}/events")
+async def waiting_room_events(offer_id: int, request: Request):
+    """Position du jeton dans la file d'une offre, envoyée en Server-Sent Events jusqu'à l'admission"""
+    token = queue_token(request)
+    try:
+        status = await waiting_room.status(offer_id, token)
+    except WaitingRoomError as e:
+        raise waiting_room_error(e)
+
+    async def events(status):
+        while True:
+            event = "admitted" if status.admitted else "position"
+            yield f"event: {event}\ndata: {json.dumps(status.as_dict())}\n\n"
+            if status.admitted:
+                return
+            # Les positions éloignées sont rafraîchies moins souvent
+            await asyncio.sleep(min(WAITING_ROOM_MAX_POLL_INTERVAL, max(1.0, status.estimated_wait / 2)))
+            try:
+                status = await waiting_room.status(offer_id, token)
+            except WaitingRoomError:
+                return
+
+    return StreamingResponse(events(status), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-store"})
+
+# Routes relayées aux services, déclarées par la table de routage
+async def proxy_route(request: Request, path: str):
+    """Route relayée vers le service désigné par la table de routage"""
+    return await route_request(path, request)
+
+for mount, service in gateway_routes.mounts():
+    app.add_api_route(f"{mount}{{path:path}}", proxy_route, methods=list(METHODS), name=f"{service}_route")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    # Le journal d'accès est écrit par GatewayMiddleware
+    uvicorn.run(app, host="0.0.0.0", port=8080, access_log=False)
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import bisect
+import atexit
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bornes (en secondes) des histogrammes de latence
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type de contenu du format d'exposition texte de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class ThreadCells:
+    """
+    Cellules de comptage d'une métrique, propres à chaque thread.
+
+    Chaque thread (boucle d'événements, threads du pool des endpoints
+    synchrones) n'écrit que dans ses propres cellules : l'enregistrement se
+    fait sans verrou ni risque de perte de mise à jour. Les cellules de tous
+    les threads sont additionnées à la lecture, lors de l'export.
+    """
+
+    __slots__ = ("size", "local", "cells")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.local = threading.local()
+        self.cells: List[List[float]] = []
+
+    def get(self) -> List[float]:
+        cells = getattr(self.local, "cells", None)
+        if cells is None:
+            cells = self.local.cells = [0.0] * self.size
+            self.cells.append(cells)
+        return cells
+
+    def totals(self) -> List[float]:
+        totals = [0.0] * self.size
+        for cells in list(self.cells):
+            for index, value in enumerate(cells):
+                totals[index] += value
+        return totals
+
+
+class CounterChild:
+    __slots__ = ("cells",)
+
+    def __init__(self):
+        self.cells = ThreadCells(1)
+
+    def inc(self, amount: float = 1.0):
+        self.cells.get()[0] += amount
+
+    def samples(self, name: str, labels: str):
+        yield name, labels, self.cells.totals()[0]
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        self.cells.get()[0] -= amount
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "cells")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # Une cellule par borne, puis +Inf, la somme et le nombre d'observations
+        self.cells = ThreadCells(len(buckets) + 3)
+
+    def observe(self, value: float):
+        cells = self.cells.get()
+        cells[bisect.bisect_left(self.buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    def samples(self, name: str, labels: str):
+        totals = self.cells.totals()
+        separator = "," if labels else ""
+        cumulative = 0.0
+        for index, bound in enumerate(self.buckets):
+            cumulative += totals[index]
+            yield f"{name}_bucket", f'{labels}{separator}le="{bound}"', cumulative
+        yield f"{name}_bucket", f'{labels}{separator}le="+Inf"', cumulative + totals[len(self.buckets)]
+        yield f"{name}_sum", labels, totals[-2]
+        yield f"{name}_count", labels, totals[-1]
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """Métrique Prometheus, éventuellement déclinée par valeurs d'étiquettes."""
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str], factory,
+                 buckets: Optional[Sequence[float]] = None):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self.children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.children[()] = factory()
+
+    def labels(self, *values):
+        """Renvoie la déclinaison de la métrique pour des valeurs d'étiquettes."""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children.setdefault(key, self.factory())
+        return child
+
+    # Raccourcis pour les métriques sans étiquette
+    def inc(self, amount: float = 1.0):
+        self.children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.children[()].dec(amount)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self.children.items()):
+            labels = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, key))
+            for sample, sample_labels, value in child.samples(self.name, labels):
+                sample_labels = f"{{{sample_labels}}}" if sample_labels else ""
+                lines.append(f"{sample}{sample_labels} {format_value(value)}")
+        return lines
+
+    def snapshot(self) -> Dict[str, object]:
+        """Renvoie les valeurs de la métrique, sérialisables en JSON."""
+        return {
+            "kind": self.kind,
+            "documentation": self.documentation,
+            "labelnames": list(self.labelnames),
+            "buckets": list(self.buckets) if self.buckets is not None else None,
+            "series": [[list(key), child.cells.totals()] for key, child in list(self.children.items())],
+        }
+
+
+class Registry:
+    """Ensemble des métriques d'un processus, exportées au format texte de Prometheus."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        # Une métrique déjà déclarée est réutilisée (modules rechargés par les tests)
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("counter", name, documentation, labelnames, CounterChild))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("gauge", name, documentation, labelnames, GaugeChild))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        buckets = tuple(sorted(buckets))
+        return self._register(
+            Metric("histogram", name, documentation, labelnames, lambda: HistogramChild(buckets), buckets)
+        )
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Renvoie les valeurs de toutes les métriques, sérialisables en JSON."""
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+
+REGISTRY = Registry()
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict[str, object]]]) -> Registry:
+    """Additionne les valeurs de plusieurs instantanés (un par worker) dans un nouveau registre."""
+    merged = Registry()
+    for snapshot in snapshots:
+        for name, data in snapshot.items():
+            if data["kind"] == "counter":
+                metric = merged.counter(name, data["documentation"], data["labelnames"])
+            elif data["kind"] == "gauge":
+                metric = merged.gauge(name, data["documentation"], data["labelnames"])
+            else:
+                metric = merged.histogram(name, data["documentation"], data["labelnames"], data["buckets"])
+            for key, totals in data["series"]:
+                cells = metric.labels(*key).cells.get()
+                for index, value in enumerate(totals):
+                    cells[index] += value
+    return merged
+
+
+class MultiprocessMetrics:
+    """
+    Agrégation des métriques des workers d'un même hôte.
+
+    Chaque worker écrit périodiquement l'instantané de son registre dans un
+    fichier du répertoire partagé (un fichier par processus). L'export additionne
+    les instantanés de tous les workers, quel que soit celui qui reçoit la
+    requête de Prometheus. Les compteurs et histogrammes des workers arrêtés
+    restent comptés, pour que les totaux ne diminuent pas au redémarrage d'un
+    worker ; leurs jauges (valeurs instantanées) sont ignorées.
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float = 5.0):
+        """
+        Args:
+            registry: Le registre du worker
+            directory: Le répertoire partagé par les workers
+            interval: Intervalle d'écriture de l'instantané, en secondes
+        """
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def write(self):
+        """Écrit l'instantané du worker (remplacement atomique du fichier)."""
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as output:
+            json.dump(self.registry.snapshot(), output)
+        os.replace(f"{path}.tmp", path)
+
+    def start(self):
+        """Démarre l'écriture périodique de l'instantané."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Metrics snapshot failed: {str(e)}")
+
+    def stop(self):
+        """Arrête l'écriture périodique après un dernier instantané."""
+        if not self.stopped.is_set():
+            self.stopped.set()
+            self.write()
+
+    def render(self) -> str:
+        """Renvoie les métriques de tous les workers, au format texte de Prometheus."""
+        self.write()
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding="utf-8") as source:
+                    snapshot = json.load(source)
+            except (OSError, ValueError):
+                continue
+            if not process_alive(int(filename[:-len(".json")])):
+                snapshot = {name: data for name, data in snapshot.items() if data["kind"] != "gauge"}
+            snapshots.append(snapshot)
+        return merge_snapshots(snapshots).render()
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def build_multiprocess_metrics(registry: Registry = REGISTRY) -> Optional[MultiprocessMetrics]:
+    """Crée l'agrégation entre workers si METRICS_MULTIPROC_DIR est défini (None sinon)."""
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    if not directory:
+        return None
+    return MultiprocessMetrics(registry, directory, float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5")))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI mesurant les requêtes HTTP : nombre de requêtes en cours et
+    histogramme des durées par méthode, modèle de route (ex: /tickets/{ticket_id},
+    pour borner le nombre de séries) et code de statut. Le nombre de requêtes
+    est donné par le compteur `_count` de l'histogramme.
+    """
+
+    def __init__(self, app, registry: Registry = REGISTRY, prefix: str = "http"):
+        self.app = app
+        self.duration = registry.histogram(
+            f"{prefix}_request_duration_seconds", "Durée de traitement des requêtes HTTP",
+            ("method", "route", "status"),
+        )
+        self.in_flight = registry.gauge(f"{prefix}_requests_in_flight", "Requêtes HTTP en cours de traitement")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            self.duration.labels(scope["method"], template, status_code).observe(time.perf_counter() - started)
@@ -0,0 +1,165 @@
+import json
+import time
+import logging
+from typing import List, Optional, Tuple
+
+from access_log import AccessLogger
+from admission import PRIORITY_NAMES
+from metrics import REGISTRY
+from routes import RouteTable
+
+logger = logging.getLogger("api-gateway")
+
+# En-têtes de sécurité HTTP ajoutés à toutes les réponses
+SECURITY_HEADERS: List[Tuple[bytes, bytes]] = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (
+        b"content-security-policy",
+        b"default-src 'self'; img-src 'self' data: https://api.qrserver.com; "
+        b"style-src 'self' 'unsafe-inline'; script-src 'self' 'unsafe-inline'",
+    ),
+]
+
+AUTH_MESSAGE = "Trop de tentatives de connexion. Veuillez réessayer dans {} secondes."
+API_MESSAGE = "Trop de requêtes. Veuillez réessayer dans {} secondes."
+SHED_MESSAGE = "Service temporairement surchargé. Veuillez réessayer dans {} secondes."
+
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    "gateway_rate_limit_rejections_total", "Requêtes refusées par la limitation de débit", ("limiter",)
+)
+LOAD_SHED = REGISTRY.counter(
+    "gateway_load_shed_total", "Requêtes délestées par le contrôle d'admission", ("priority",)
+)
+
+
+class GatewayMiddleware:
+    """
+    Middleware ASGI de l'API Gateway : limitation de débit, contrôle d'admission
+    par priorité, en-têtes de sécurité et journal d'accès en un seul passage.
+
+    Contrairement aux middlewares `@app.middleware("http")`, qui reconstruisent
+    chacun une requête et une réponse Starlette et relaient le corps par une
+    file intermédiaire, ce middleware se contente de compléter le message
+    `http.response.start` : le corps de la réponse est transmis tel quel.
+    """
+
+    def __init__(self, app, auth_limiter, api_limiter, access_logger: Optional[AccessLogger] = None,
+                 admission=None, routes: Optional[RouteTable] = None, batch_path: Optional[str] = None):
+        """
+        Initialise le middleware.
+
+        Args:
+            app: L'application ASGI enveloppée
+            auth_limiter: Le limiteur des tentatives d'authentification
+            api_limiter: Le limiteur des requêtes API générales
+            access_logger: Le journal d'accès (toutes les requêtes journalisées par défaut)
+            admission: Le limiteur de concurrence adaptatif (aucun contrôle d'admission si None)
+            routes: La table de routage, qui désigne le limiteur de débit et la classe de
+                priorité de chaque route (limiteur API et aucun contrôle d'admission si None)
+            batch_path: Le chemin des requêtes groupées, dont la limitation de débit est
+                appliquée par l'endpoint selon le nombre de sous-requêtes
+        """
+        self.app = app
+        self.auth_limiter = auth_limiter
+        self.api_limiter = api_limiter
+        self.access_logger = access_logger or AccessLogger(logger)
+        self.admission = admission
+        self.routes = routes if routes is not None else RouteTable([])
+        self.batch_path = batch_path
+        self.security_header_names = {name for name, _ in SECURITY_HEADERS}
+        self.header_names = self.security_header_names | {
+            b"x-ratelimit-limit", b"x-ratelimit-remaining", b"x-ratelimit-reset",
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        path = scope["path"]
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
+        if path == self.batch_path:
+            await self._call(scope, receive, send, SECURITY_HEADERS, self.security_header_names,
+                             started, client_ip)
+            return
+
+        # Appliquer différentes limites selon le type de requête
+        route = self.routes.resolve(scope)
+        if route.rate_limit == "auth":
+            limiter, message, limiter_name = self.auth_limiter, AUTH_MESSAGE, "auth"
+        else:
+            limiter, message, limiter_name = self.api_limiter, API_MESSAGE, "api"
+
+        allowed, wait_time, remaining = await limiter.check(client_ip)
+        if not allowed:
+            RATE_LIMIT_REJECTIONS.labels(limiter_name).inc()
+            logger.warning("Rate limit exceeded for %s from %s", path, client_ip)
+            await self._reject(send, 429, message.format(wait_time), wait_time)
+            self._log(scope, 429, started, client_ip)
+            return
+
+        # Délester les requêtes les moins prioritaires lorsque la concurrence approche de la limite
+        priority = route.priority if self.admission is not None else None
+        if priority is not None and not self.admission.try_acquire(priority):
+            retry_after = self.admission.retry_after(priority)
+            LOAD_SHED.labels(PRIORITY_NAMES.get(priority, priority)).inc()
+            logger.warning("Load shed for %s (priority %s)", path, priority)
+            await self._reject(send, 503, SHED_MESSAGE.format(retry_after), retry_after)
+            self._log(scope, 503, started, client_ip)
+            return
+
+        # En-têtes ajoutés à la réponse : sécurité et information sur les limites
+        extra_headers = SECURITY_HEADERS + [
+            (b"x-ratelimit-limit", str(limiter.max_requests).encode()),
+            (b"x-ratelimit-remaining", str(remaining).encode()),
+            (b"x-ratelimit-reset", str(limiter.window_size).encode()),
+        ]
+        try:
+            await self._call(scope, receive, send, extra_headers, self.header_names, started, client_ip)
+        finally:
+            if priority is not None:
+                self.admission.release()
+
+    async def _call(self, scope, receive, send, extra_headers, replaced_names, started: float, client_ip: str):
+        """Appelle l'application en remplaçant les en-têtes ajoutés par le middleware."""
+        status_code = 500
+
+        async def send_with_headers(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in replaced_names
+                ]
+                message["headers"] = headers + extra_headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            self._log(scope, status_code, started, client_ip)
+
+    async def _reject(self, send, status_code: int, detail: str, wait_time: int):
+        body = json.dumps({"detail": detail}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(wait_time).encode()),
+            ] + SECURITY_HEADERS,
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _log(self, scope, status_code: int, started: float, client_ip: str):
+        self.access_logger.log(
+            scope["method"], scope["path"], status_code, time.perf_counter() - started, client_ip
+        )
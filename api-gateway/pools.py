@@ -0,0 +1,249 @@
+import os
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger("api-gateway")
+
+# Le support HTTP/2 de httpx dépend du paquet optionnel h2
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Événements httpcore marquant la fin de l'attente d'une connexion du pool
+CONNECTION_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "connection.connect_unix_socket.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class PoolConfig:
+    """
+    Paramètres du pool de connexions vers un service.
+
+    Attributes:
+        max_connections: Nombre maximum de connexions simultanées vers le service
+        max_keepalive_connections: Nombre maximum de connexions inactives conservées
+        keepalive_expiry: Durée (en secondes) de conservation d'une connexion inactive
+        connect_timeout: Délai maximum d'établissement d'une connexion
+        read_timeout: Délai maximum de lecture d'une réponse
+        write_timeout: Délai maximum d'envoi d'une requête
+        pool_timeout: Délai maximum d'attente d'une connexion libre dans le pool
+        http2: Active HTTP/2 vers le service (nécessite le paquet h2)
+    """
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, service: str) -> "PoolConfig":
+        """
+        Construit la configuration d'un service à partir des variables
+        d'environnement préfixées par le nom du service (ex: TICKETS_POOL_MAX_CONNECTIONS).
+
+        Args:
+            service: Le nom du service
+
+        Returns:
+            La configuration du pool
+        """
+        prefix = f"{service.upper()}_POOL_"
+        default = cls()
+        return cls(
+            max_connections=int(os.getenv(f"{prefix}MAX_CONNECTIONS", default.max_connections)),
+            max_keepalive_connections=int(
+                os.getenv(f"{prefix}MAX_KEEPALIVE", default.max_keepalive_connections)
+            ),
+            keepalive_expiry=float(os.getenv(f"{prefix}KEEPALIVE_EXPIRY", default.keepalive_expiry)),
+            connect_timeout=float(os.getenv(f"{prefix}CONNECT_TIMEOUT", default.connect_timeout)),
+            read_timeout=float(os.getenv(f"{prefix}READ_TIMEOUT", default.read_timeout)),
+            write_timeout=float(os.getenv(f"{prefix}WRITE_TIMEOUT", default.write_timeout)),
+            pool_timeout=float(os.getenv(f"{prefix}POOL_TIMEOUT", default.pool_timeout)),
+            http2=_env_bool(f"{prefix}HTTP2", default.http2),
+        )
+
+
+class ServicePool:
+    """
+    Pool de connexions HTTP dédié à un service.
+
+    Chaque service dispose de son propre client httpx, avec ses propres limites,
+    délais et protocole, afin qu'un service lent ne monopolise pas les connexions
+    des autres. Le pool mesure aussi les requêtes en cours et le temps d'attente
+    d'une connexion libre.
+    """
+
+    def __init__(self, name: str, config: Optional[PoolConfig] = None):
+        """
+        Initialise le pool. Le même pool sert toutes les instances du service.
+
+        Args:
+            name: Le nom du service
+            config: La configuration du pool (valeurs par défaut si absente)
+        """
+        self.name = name
+        self.config = config or PoolConfig()
+        self.client: Optional[httpx.AsyncClient] = None
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def build_client(self, transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+        """
+        Construit le client httpx correspondant à la configuration du pool.
+
+        Args:
+            transport: Transport httpx à utiliser à la place du transport réseau
+
+        Returns:
+            Le client httpx
+        """
+        config = self.config
+        http2 = config.http2 and HTTP2_AVAILABLE
+        if config.http2 and not HTTP2_AVAILABLE:
+            logger.warning(f"HTTP/2 requested for {self.name} but the h2 package is not installed")
+        return httpx.AsyncClient(
+            transport=transport,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=config.connect_timeout,
+                read=config.read_timeout,
+                write=config.write_timeout,
+                pool=config.pool_timeout,
+            ),
+        )
+
+    def open(self) -> httpx.AsyncClient:
+        """Ouvre le client du pool s'il ne l'est pas déjà et le renvoie."""
+        if self.client is None or self.client.is_closed:
+            self.client = self.build_client()
+        return self.client
+
+    async def close(self):
+        """Ferme le client du pool et toutes ses connexions."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def build_request(self, method: str, url: str, **kwargs) -> httpx.Request:
+        """Construit une requête vers le service avec le client du pool."""
+        return self.open().build_request(method, url, **kwargs)
+
+    async def send(self, request: httpx.Request) -> httpx.Response:
+        """
+        Envoie une requête en mode streaming en mesurant l'attente d'une connexion.
+
+        La réponse doit être libérée avec `release` une fois son corps consommé.
+
+        Args:
+            request: La requête à envoyer
+
+        Returns:
+            La réponse du service, dont le corps n'a pas encore été lu
+        """
+        client = self.open()
+        started = time.perf_counter()
+        acquired = False
+
+        async def trace(event_name: str, info: dict):
+            nonlocal acquired
+            if not acquired and event_name in CONNECTION_ACQUIRED_EVENTS:
+                acquired = True
+                self._record_wait(time.perf_counter() - started)
+
+        request.extensions["trace"] = trace
+        self.in_flight += 1
+        self.total_requests += 1
+        try:
+            return await client.send(request, stream=True)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+
+    async def release(self, response: httpx.Response):
+        """Ferme la réponse et rend sa connexion au pool."""
+        try:
+            await response.aclose()
+        finally:
+            self.in_flight -= 1
+
+    def _record_wait(self, wait_time: float):
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def _idle_connections(self) -> Optional[int]:
+        # httpx n'expose pas l'état de son pool : celui de httpcore est lu s'il est
+        # accessible, sinon (autre transport, autre version de httpx) l'état est inconnu
+        if self.client is None:
+            return 0
+        transport = getattr(self.client, "_transport", None)
+        connections = getattr(getattr(transport, "_pool", None), "connections", None)
+        if connections is None:
+            return None
+        try:
+            return sum(1 for connection in connections if connection.is_idle())
+        except (AttributeError, TypeError):
+            return None
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Renvoie les statistiques du pool.
+
+        Returns:
+            Un dictionnaire contenant la configuration et l'utilisation du pool :
+            requêtes en cours (in_flight) et connexions inactives (idle, None si
+            l'état du pool httpx n'est pas accessible)
+        """
+        average_wait = self.total_wait_time / self.total_requests if self.total_requests else 0.0
+        return {
+            "http2": self.config.http2 and HTTP2_AVAILABLE,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "in_flight": self.in_flight,
+            "idle": self._idle_connections(),
+            "total_requests": self.total_requests,
+            "avg_wait_ms": round(average_wait * 1000, 3),
+            "max_wait_ms": round(self.max_wait_time * 1000, 3),
+        }
+
+
+def build_pools(endpoints: Dict[str, object]) -> Dict[str, ServicePool]:
+    """
+    Crée un pool par service, configuré à partir des variables d'environnement.
+
+    Args:
+        endpoints: Dictionnaire dont les clés sont les noms des services
+
+    Returns:
+        Dictionnaire associant le nom de chaque service à son pool
+    """
+    return {
+        name: ServicePool(name, PoolConfig.from_env(name))
+        for name in endpoints
+    }
@@ -0,0 +1,280 @@
+import os
+import math
+import errno
+import mmap
+import time
+import fcntl
+import struct
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("api-gateway")
+
+# Le backend Redis dépend du paquet optionnel redis
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# Résultat d'une vérification : (autorisée, secondes d'attente, requêtes restantes)
+CheckResult = Tuple[bool, int, int]
+
+
+def gcra_decision(tat: Optional[float], now: float, interval: float, window: float,
+                  cost: int = 1) -> Tuple[Optional[float], CheckResult]:
+    """
+    Applique l'algorithme GCRA à l'état d'une clé.
+
+    Args:
+        tat: L'instant théorique d'arrivée enregistré (None si la clé est inconnue)
+        now: L'instant courant
+        interval: L'intervalle d'émission (fenêtre / nombre maximum de requêtes)
+        window: La taille de la fenêtre, qui borne la rafale autorisée
+        cost: Le nombre d'unités consommées par la requête
+
+    Returns:
+        Un tuple (nouvel instant à enregistrer ou None si la requête est refusée,
+        résultat de la vérification)
+    """
+    tat = max(tat if tat is not None else now, now)
+    new_tat = tat + interval * cost
+    if new_tat - now > window:
+        return None, (False, max(1, math.ceil(new_tat - window - now)), 0)
+    remaining = int((window - (new_tat - now)) / interval + 1e-9)
+    return new_tat, (True, 0, remaining)
+
+
+class SharedMemoryBackend:
+    """
+    État GCRA partagé entre les workers d'un même hôte via un fichier projeté en mémoire.
+
+    Le fichier contient une table de taille fixe de cases (empreinte de la clé, TAT),
+    regroupées par paquets de quatre. Une clé est rangée dans le paquet désigné par
+    son empreinte ; chaque paquet est protégé par un verrou fcntl sur sa plage
+    d'octets, ce qui permet à des processus indépendants (workers uvicorn) de le
+    mettre à jour sans verrou global. La mémoire est bornée par construction : une
+    case inactive est réutilisée, et à défaut celle dont l'état expire le plus tôt.
+
+    Le verrou est pris sans attente : si un autre worker détient le paquet, la
+    vérification est retentée après une courte pause (croissante) qui rend la main
+    à la boucle d'événements, au lieu de bloquer toutes les requêtes du worker.
+    """
+
+    SLOT = struct.Struct("<Qd")
+    BUCKET_SLOTS = 4
+
+    def __init__(self, path: Optional[str] = None, slots: int = 65536, lock_timeout: float = 0.05,
+                 retry_delay: float = 0.0005):
+        """
+        Initialise le backend, en créant le fichier partagé s'il n'existe pas.
+
+        Args:
+            path: Le chemin du fichier partagé (dans /dev/shm par défaut)
+            slots: Le nombre de cases de la table
+            lock_timeout: Attente maximum d'un paquet verrouillé par un autre worker, en secondes
+            retry_delay: Pause avant la première nouvelle tentative, en secondes (doublée ensuite)
+        """
+        self.lock_timeout = lock_timeout
+        self.retry_delay = retry_delay
+        if path is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(directory, "jo-gateway-ratelimit")
+        self.path = path
+        self.buckets = max(1, slots // self.BUCKET_SLOTS)
+        self.bucket_size = self.BUCKET_SLOTS * self.SLOT.size
+        size = self.buckets * self.bucket_size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.memory = mmap.mmap(self.fd, size)
+
+    @staticmethod
+    def _fingerprint(key: str) -> int:
+        # 0 est réservé aux cases vides
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def try_check(self, key: str, interval: float, window: float, cost: int = 1) -> Optional[CheckResult]:
+        """Vérifie une requête pour une clé, ou renvoie None si son paquet est verrouillé par un autre worker."""
+        fingerprint = self._fingerprint(key)
+        offset = (fingerprint % self.buckets) * self.bucket_size
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, self.bucket_size, offset)
+        except OSError as e:
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                return None
+            raise
+        try:
+            now = time.time()
+            slots = [
+                self.SLOT.unpack_from(self.memory, offset + i * self.SLOT.size)
+                for i in range(self.BUCKET_SLOTS)
+            ]
+            index, tat = self._find_slot(slots, fingerprint, now)
+            new_tat, result = gcra_decision(tat, now, interval, window, cost)
+            if new_tat is not None:
+                self.SLOT.pack_into(self.memory, offset + index * self.SLOT.size, fingerprint, new_tat)
+            return result
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.bucket_size, offset)
+
+    @staticmethod
+    def _find_slot(slots, fingerprint: int, now: float) -> Tuple[int, Optional[float]]:
+        for index, (slot_fingerprint, tat) in enumerate(slots):
+            if slot_fingerprint == fingerprint:
+                return index, tat
+        for index, (slot_fingerprint, tat) in enumerate(slots):
+            if slot_fingerprint == 0 or tat <= now:
+                return index, None
+        # Paquet plein de clés actives : on remplace celle qui expire le plus tôt
+        index = min(range(len(slots)), key=lambda i: slots[i][1])
+        return index, None
+
+    async def check(self, key: str, interval: float, window: float, cost: int = 1) -> CheckResult:
+        """
+        Vérifie une requête pour une clé.
+
+        Raises:
+            TimeoutError: Si le paquet de la clé reste verrouillé au-delà de `lock_timeout`
+        """
+        delay = self.retry_delay
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            result = self.try_check(key, interval, window, cost)
+            if result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Rate limit bucket of {key} is locked")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+    def stats(self) -> Dict[str, object]:
+        now = time.time()
+        tracked = 0
+        for offset in range(0, len(self.memory), self.SLOT.size):
+            fingerprint, tat = self.SLOT.unpack_from(self.memory, offset)
+            if fingerprint and tat > now:
+                tracked += 1
+        return {"backend": "shared_memory", "tracked_keys": tracked, "max_keys": self.buckets * self.BUCKET_SLOTS}
+
+    def close(self):
+        self.memory.close()
+        os.close(self.fd)
+
+
+# Script GCRA exécuté atomiquement par Redis pour un lot de clés.
+# ARGV contient, pour chaque clé, l'intervalle d'émission, la fenêtre (en secondes) et le coût.
+# Le résultat contient, pour chaque clé : autorisée (0/1), attente en ms, requêtes restantes.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local results = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[3 * i - 2])
+    local window = tonumber(ARGV[3 * i - 1])
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then tat = now end
+    local new_tat = tat + interval * tonumber(ARGV[3 * i])
+    local n = #results
+    if new_tat - now > window then
+        results[n + 1] = 0
+        results[n + 2] = math.ceil((new_tat - window - now) * 1000)
+        results[n + 3] = 0
+    else
+        redis.call('SET', key, string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+        results[n + 1] = 1
+        results[n + 2] = 0
+        results[n + 3] = math.floor((window - (new_tat - now)) / interval + 1e-9)
+    end
+end
+return results
+"""
+
+
+class RedisBackend:
+    """
+    État GCRA partagé entre plusieurs instances de l'API Gateway via Redis.
+
+    Chaque vérification est atomique (script Lua exécuté côté serveur, horloge de
+    Redis) et les clés expirent d'elles-mêmes. Les vérifications lancées dans la
+    même itération de la boucle d'événements sont regroupées en un seul appel du
+    script : sous forte charge, un aller-retour réseau sert de nombreuses requêtes.
+    Le script traite plusieurs clés par appel : il suppose un Redis non partitionné.
+    """
+
+    def __init__(self, url: str, max_batch: int = 256):
+        """
+        Initialise le backend.
+
+        Args:
+            url: L'URL du serveur Redis (ex: redis://localhost:6379/0)
+            max_batch: Nombre maximum de vérifications par appel du script
+        """
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for the redis rate limit backend")
+        self.url = url
+        self.client = aioredis.from_url(url)
+        self.script = self.client.register_script(GCRA_SCRIPT)
+        self.max_batch = max_batch
+        self.pending: List[Tuple[str, float, float, int, asyncio.Future]] = []
+        self.flush_scheduled = False
+        # Envois de lots en cours, attendus à la fermeture du backend
+        self.flushes: Set[asyncio.Task] = set()
+        self.round_trips = 0
+        self.checks = 0
+
+    async def check(self, key: str, interval: float, window: float, cost: int = 1) -> CheckResult:
+        """Vérifie une requête pour une clé, en la regroupant avec les vérifications simultanées."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((key, interval, window, cost, future))
+        if not self.flush_scheduled:
+            # L'envoi démarre à l'itération suivante de la boucle : les vérifications
+            # lancées d'ici là rejoignent le lot
+            self.flush_scheduled = True
+            task = loop.create_task(self._flush())
+            self.flushes.add(task)
+            task.add_done_callback(self.flushes.discard)
+        return await future
+
+    async def _flush(self):
+        batch, self.pending = self.pending, []
+        self.flush_scheduled = False
+        for start in range(0, len(batch), self.max_batch):
+            await self._run_batch(batch[start:start + self.max_batch])
+
+    async def _run_batch(self, batch):
+        keys = [key for key, *_ in batch]
+        args = []
+        for _, interval, window, cost, _ in batch:
+            args.extend([interval, window, cost])
+        self.round_trips += 1
+        self.checks += len(batch)
+        try:
+            values = await self.script(keys=keys, args=args)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (*_, future) in enumerate(batch):
+            allowed, wait_ms, remaining = (int(value) for value in values[3 * i:3 * i + 3])
+            if allowed:
+                result = (True, 0, remaining)
+            else:
+                result = (False, max(1, math.ceil(wait_ms / 1000)), 0)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": "redis", "checks": self.checks, "round_trips": self.round_trips}
+
+    async def close(self):
+        """Termine les envois de lots en cours puis ferme la connexion à Redis."""
+        if self.flushes:
+            await asyncio.gather(*self.flushes, return_exceptions=True)
+        # redis-py >= 5 expose aclose(), les versions antérieures close()
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
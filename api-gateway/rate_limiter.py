@@ -1,77 +1,406 @@
+import os
+import abc
 import time
-from collections import defaultdict
-from typing import Dict, List, Tuple
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from rate_limit_backends import RedisBackend, SharedMemoryBackend, gcra_decision
 
-class RateLimiter:
+logger = logging.getLogger("api-gateway")
+
+# Nombre maximum d'adresses IP suivies par limiteur
+DEFAULT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+class BoundedKeyState(abc.ABC):
+    """
+    État par adresse IP borné en mémoire, commun aux limiteurs de taux.
+
+    Les adresses sont conservées dans l'ordre de leur dernière requête autorisée :
+    les adresses inactives sont donc en tête et peuvent être évincées sans parcourir
+    tout l'état. Le nombre d'adresses suivies est plafonné ; au-delà, les adresses
+    inactives puis les moins récemment actives sont évincées.
+    """
+
+    def __init__(self, max_keys: int = DEFAULT_MAX_KEYS):
+        """
+        Initialise l'état.
+
+        Args:
+            max_keys: Nombre maximum d'adresses IP suivies
+        """
+        self.max_keys = max_keys
+        self.entries: "OrderedDict[str, object]" = OrderedDict()
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    @abc.abstractmethod
+    def _is_idle(self, value, current_time: float) -> bool:
+        """Indique si l'état d'une adresse n'a plus d'effet sur la limitation."""
+
+    def _store(self, ip_address: str, value, current_time: float, allowed: bool = True):
+        """
+        Enregistre l'état d'une adresse.
+
+        Args:
+            ip_address: L'adresse IP
+            value: Le nouvel état de l'adresse
+            current_time: L'instant de la requête
+            allowed: Faux pour une requête refusée : l'adresse garde son rang dans
+                l'ordre des dernières requêtes autorisées
+        """
+        if ip_address not in self.entries and len(self.entries) >= self.max_keys:
+            self.sweep(current_time)
+            while len(self.entries) >= self.max_keys:
+                self.entries.popitem(last=False)
+                self.evicted_capacity += 1
+        self.entries[ip_address] = value
+        if allowed:
+            self.entries.move_to_end(ip_address)
+
+    def sweep(self, current_time: Optional[float] = None) -> int:
+        """
+        Évince les adresses inactives situées en tête de l'état.
+
+        Args:
+            current_time: L'instant de référence (maintenant par défaut)
+
+        Returns:
+            Le nombre d'adresses évincées
+        """
+        current_time = time.time() if current_time is None else current_time
+        evicted = 0
+        while self.entries:
+            ip_address, value = next(iter(self.entries.items()))
+            if not self._is_idle(value, current_time):
+                break
+            del self.entries[ip_address]
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    async def check(self, ip_address: str, cost: int = 1) -> Tuple[bool, int, int]:
+        """
+        Vérifie une requête et renvoie le quota restant en un seul appel.
+
+        Args:
+            ip_address: L'adresse IP à vérifier
+            cost: Le nombre de requêtes décomptées (plusieurs pour une requête groupée)
+
+        Returns:
+            Tuple contenant:
+                - Un booléen indiquant si la requête est autorisée
+                - Le nombre de secondes avant que la prochaine requête soit autorisée
+                - Le nombre de requêtes restantes
+        """
+        allowed, wait_time = self.is_allowed(ip_address, cost)
+        return allowed, wait_time, self.get_remaining_requests(ip_address)
+
+    def tracked_keys(self) -> int:
+        """Renvoie le nombre d'adresses IP actuellement suivies."""
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Renvoie les compteurs de l'état du limiteur."""
+        return {
+            "tracked_keys": len(self.entries),
+            "max_keys": self.max_keys,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity,
+        }
+
+class RateLimiter(BoundedKeyState):
     """
     Classe simple de limitation de taux de requêtes basée sur l'adresse IP.
     Utilise un algorithme de fenêtre glissante pour limiter le nombre de requêtes
     dans une période donnée.
     """
-    
-    def __init__(self, max_requests: int = 10, window_size: int = 60):
+
+    def __init__(self, max_requests: int = 10, window_size: int = 60, max_keys: int = DEFAULT_MAX_KEYS):
         """
         Initialise le limiteur de taux.
-        
+
         Args:
             max_requests: Nombre maximum de requêtes autorisées dans la fenêtre de temps
             window_size: Taille de la fenêtre de temps en secondes
+            max_keys: Nombre maximum d'adresses IP suivies
         """
+        super().__init__(max_keys)
         self.max_requests = max_requests
         self.window_size = window_size
-        self.requests: Dict[str, List[float]] = defaultdict(list)
-    
-    def is_allowed(self, ip_address: str) -> Tuple[bool, int]:
+
+    @property
+    def requests(self) -> Dict[str, List[float]]:
+        """Horodatages des requêtes autorisées, par adresse IP."""
+        return self.entries
+
+    def _is_idle(self, timestamps: List[float], current_time: float) -> bool:
+        return not timestamps or current_time - timestamps[-1] >= self.window_size
+
+    def is_allowed(self, ip_address: str, cost: int = 1) -> Tuple[bool, int]:
         """
         Vérifie si une requête est autorisée pour une adresse IP donnée.
-        
+
         Args:
             ip_address: L'adresse IP à vérifier
-            
+            cost: Le nombre de requêtes décomptées
+
         Returns:
             Tuple contenant:
                 - Un booléen indiquant si la requête est autorisée
                 - Le nombre de secondes avant que la prochaine requête soit autorisée
         """
         current_time = time.time()
-        
+
         # Nettoyer les anciennes requêtes
-        self.requests[ip_address] = [
-            req_time for req_time in self.requests[ip_address]
+        timestamps = [
+            req_time for req_time in self.entries.get(ip_address, ())
             if current_time - req_time < self.window_size
         ]
-        
+
         # Vérifier si le nombre de requêtes dépasse la limite
-        if len(self.requests[ip_address]) >= self.max_requests:
-            # Calculer le temps d'attente
-            oldest_request = min(self.requests[ip_address])
+        if len(timestamps) + cost > self.max_requests:
+            # Les requêtes sorties de la fenêtre sont oubliées ; une adresse inconnue n'est pas enregistrée
+            if ip_address in self.entries:
+                self._store(ip_address, timestamps, current_time, allowed=False)
+            # Calculer le temps d'attente : les plus anciennes requêtes doivent sortir de la fenêtre
+            expiring = min(len(timestamps), len(timestamps) + cost - self.max_requests)
+            oldest_request = timestamps[expiring - 1] if expiring > 0 else current_time
             wait_time = int(self.window_size - (current_time - oldest_request))
             return False, wait_time
-        
+
         # Enregistrer cette requête
-        self.requests[ip_address].append(current_time)
+        timestamps.extend([current_time] * cost)
+        self._store(ip_address, timestamps, current_time)
         return True, 0
-    
+
     def get_remaining_requests(self, ip_address: str) -> int:
         """
         Renvoie le nombre de requêtes restantes pour une adresse IP donnée.
-        
+
         Args:
             ip_address: L'adresse IP à vérifier
-            
+
         Returns:
             Le nombre de requêtes restantes
         """
+        timestamps = self.entries.get(ip_address)
+        if not timestamps:
+            return self.max_requests
+
         current_time = time.time()
-        
-        # Nettoyer les anciennes requêtes
-        self.requests[ip_address] = [
-            req_time for req_time in self.requests[ip_address]
-            if current_time - req_time < self.window_size
-        ]
-        
-        return max(0, self.max_requests - len(self.requests[ip_address]))
+        recent = sum(1 for req_time in timestamps if current_time - req_time < self.window_size)
+        return max(0, self.max_requests - recent)
+
+class GCRARateLimiter(BoundedKeyState):
+    """
+    Limiteur de taux basé sur l'algorithme GCRA (Generic Cell Rate Algorithm).
+
+    Équivalent à un seau à jetons : au plus `max_requests` requêtes en rafale, puis
+    une requête toutes les `window_size / max_requests` secondes. Seul l'instant
+    théorique d'arrivée (TAT) de la prochaine requête est conservé par adresse IP,
+    ce qui rend chaque vérification en O(1) en temps et en mémoire.
+    Il expose la même interface que `RateLimiter`.
+    """
+
+    def __init__(self, max_requests: int = 10, window_size: int = 60, max_keys: int = DEFAULT_MAX_KEYS):
+        """
+        Initialise le limiteur de taux.
+
+        Args:
+            max_requests: Nombre maximum de requêtes autorisées dans la fenêtre de temps
+            window_size: Taille de la fenêtre de temps en secondes
+            max_keys: Nombre maximum d'adresses IP suivies
+        """
+        super().__init__(max_keys)
+        self.max_requests = max_requests
+        self.window_size = window_size
+        self.emission_interval = window_size / max_requests
+
+    @property
+    def tats(self) -> Dict[str, float]:
+        """Instant théorique d'arrivée de la prochaine requête, par adresse IP."""
+        return self.entries
+
+    def _is_idle(self, tat: float, current_time: float) -> bool:
+        return tat <= current_time
+
+    def is_allowed(self, ip_address: str, cost: int = 1) -> Tuple[bool, int]:
+        """
+        Vérifie si une requête est autorisée pour une adresse IP donnée.
+
+        Args:
+            ip_address: L'adresse IP à vérifier
+            cost: Le nombre de requêtes décomptées
+
+        Returns:
+            Tuple contenant:
+                - Un booléen indiquant si la requête est autorisée
+                - Le nombre de secondes avant que la prochaine requête soit autorisée
+        """
+        current_time = time.time()
+        new_tat, (allowed, wait_time, _) = gcra_decision(
+            self.entries.get(ip_address), current_time, self.emission_interval, self.window_size, cost
+        )
+
+        # La requête dépasserait la rafale autorisée
+        if not allowed:
+            return False, wait_time
+
+        self._store(ip_address, new_tat, current_time)
+        return True, 0
+
+    def get_remaining_requests(self, ip_address: str) -> int:
+        """
+        Renvoie le nombre de requêtes restantes pour une adresse IP donnée.
+
+        Args:
+            ip_address: L'adresse IP à vérifier
+
+        Returns:
+            Le nombre de requêtes restantes
+        """
+        tat = self.entries.get(ip_address)
+        if tat is None:
+            return self.max_requests
+
+        current_time = time.time()
+        used = max(0.0, tat - current_time)
+        return max(0, int((self.window_size - used) / self.emission_interval + 1e-9))
+
+class SharedRateLimiter:
+    """
+    Limiteur de taux GCRA dont l'état est conservé dans un backend partagé
+    (mémoire partagée entre les workers d'un hôte, ou Redis entre plusieurs hôtes),
+    afin que la limite configurée s'applique globalement et non par worker.
+
+    Si le backend est indisponible, la requête est autorisée (fail-open) : la
+    limitation de débit ne doit pas rendre la billetterie indisponible.
+    """
+
+    def __init__(self, max_requests: int, window_size: int, backend, prefix: str):
+        """
+        Initialise le limiteur de taux.
+
+        Args:
+            max_requests: Nombre maximum de requêtes autorisées dans la fenêtre de temps
+            window_size: Taille de la fenêtre de temps en secondes
+            backend: Le backend partagé (voir rate_limit_backends)
+            prefix: Le préfixe des clés de ce limiteur dans le backend
+        """
+        self.max_requests = max_requests
+        self.window_size = window_size
+        self.emission_interval = window_size / max_requests
+        self.backend = backend
+        self.prefix = prefix
+        self.backend_errors = 0
+
+    async def check(self, ip_address: str, cost: int = 1) -> Tuple[bool, int, int]:
+        """
+        Vérifie une requête et renvoie le quota restant en un seul appel au backend.
+
+        Args:
+            ip_address: L'adresse IP à vérifier
+            cost: Le nombre de requêtes décomptées
+
+        Returns:
+            Tuple (autorisée, secondes d'attente, requêtes restantes)
+        """
+        try:
+            return await self.backend.check(
+                f"{self.prefix}:{ip_address}", self.emission_interval, self.window_size, cost
+            )
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Rate limit backend unavailable, allowing request: {str(e)}")
+            return True, 0, self.max_requests
+
+    def sweep(self, current_time: Optional[float] = None) -> int:
+        """Les clés expirent d'elles-mêmes dans les backends partagés."""
+        return 0
+
+    def stats(self) -> Dict[str, object]:
+        """Renvoie les compteurs du backend."""
+        return {**self.backend.stats(), "backend_errors": self.backend_errors}
+
+async def sweep_periodically(limiters: Iterable[BoundedKeyState], interval: float):
+    """
+    Évince périodiquement les adresses inactives des limiteurs, afin que la mémoire
+    soit libérée même en l'absence de nouvelles requêtes.
+
+    Args:
+        limiters: Les limiteurs à nettoyer
+        interval: Intervalle entre deux nettoyages, en secondes
+    """
+    limiters = list(limiters)
+    while True:
+        await asyncio.sleep(interval)
+        evicted = sum(limiter.sweep() for limiter in limiters)
+        if evicted:
+            logger.debug(f"Rate limiter sweep evicted {evicted} idle keys")
+
+# Algorithmes de limitation disponibles
+LIMITER_ALGORITHMS = {
+    "sliding_window": RateLimiter,
+    "gcra": GCRARateLimiter,
+}
+
+def create_backend(name: str):
+    """
+    Crée le backend d'état partagé demandé.
+
+    Args:
+        name: "memory" (état propre à chaque processus), "shared_memory" ou "redis"
+
+    Returns:
+        Le backend, ou None pour l'état en mémoire du processus
+    """
+    if name == "memory":
+        return None
+    if name == "shared_memory":
+        return SharedMemoryBackend(
+            path=os.getenv("RATE_LIMIT_SHM_PATH") or None,
+            slots=int(os.getenv("RATE_LIMIT_SHM_SLOTS", "65536")),
+            lock_timeout=float(os.getenv("RATE_LIMIT_SHM_LOCK_TIMEOUT", "0.05")),
+        )
+    if name == "redis":
+        host = os.getenv("REDIS_HOST", "localhost")
+        port = os.getenv("REDIS_PORT", "6379")
+        return RedisBackend(os.getenv("REDIS_URL", f"redis://{host}:{port}/0"))
+    raise ValueError(f"Unknown rate limiting backend: {name}")
+
+def create_limiter(max_requests: int, window_size: int, algorithm: str = "sliding_window",
+                   max_keys: int = DEFAULT_MAX_KEYS, backend=None, prefix: str = "ratelimit"):
+    """
+    Crée un limiteur de taux selon l'algorithme et le backend demandés.
+
+    Args:
+        max_requests: Nombre maximum de requêtes autorisées dans la fenêtre de temps
+        window_size: Taille de la fenêtre de temps en secondes
+        algorithm: "sliding_window" (fenêtre glissante) ou "gcra"
+        max_keys: Nombre maximum d'adresses IP suivies
+        backend: Backend d'état partagé ; les backends partagés utilisent toujours GCRA
+        prefix: Le préfixe des clés du limiteur dans le backend partagé
+
+    Returns:
+        Le limiteur de taux
+    """
+    if backend is not None:
+        return SharedRateLimiter(max_requests, window_size, backend, prefix)
+    if algorithm not in LIMITER_ALGORITHMS:
+        raise ValueError(f"Unknown rate limiting algorithm: {algorithm}")
+    return LIMITER_ALGORITHMS[algorithm](max_requests=max_requests, window_size=window_size, max_keys=max_keys)
+
+# Algorithme utilisé par le middleware de l'API Gateway
+RATE_LIMIT_ALGORITHM = os.getenv("RATE_LIMIT_ALGORITHM", "sliding_window")
+
+# Intervalle de nettoyage des adresses inactives, en secondes
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "30"))
+
+# Backend de l'état des limiteurs : memory, shared_memory ou redis
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+rate_limit_backend = create_backend(RATE_LIMIT_BACKEND)
 
 # Créer des instances pour différents types de requêtes
-auth_limiter = RateLimiter(max_requests=10, window_size=60)  # 10 requêtes d'authentification par minute
-api_limiter = RateLimiter(max_requests=200, window_size=60)  # 200 requêtes API par minute
+auth_limiter = create_limiter(10, 60, RATE_LIMIT_ALGORITHM, backend=rate_limit_backend, prefix="auth")  # 10 requêtes d'authentification par minute
+api_limiter = create_limiter(200, 60, RATE_LIMIT_ALGORITHM, backend=rate_limit_backend, prefix="api")  # 200 requêtes API par minute
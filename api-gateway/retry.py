@@ -0,0 +1,176 @@
+import os
+import time
+import random
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class RetryBudget:
+    """
+    Budget de nouvelles tentatives partagé par tous les appels aux services.
+
+    Chaque requête initiale crédite le budget d'une fraction de tentative
+    (`ratio`) et le budget se reconstitue en outre d'un minimum par seconde ;
+    chaque nouvelle tentative ou requête de couverture (hedging) en consomme
+    une. Lors d'une panne, les tentatives supplémentaires restent ainsi
+    limitées à une fraction du trafic au lieu de le multiplier.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, capacity: float = 20.0):
+        """
+        Initialise le budget.
+
+        Args:
+            ratio: La fraction de tentative créditée par requête initiale
+            min_per_second: Le nombre de tentatives créditées chaque seconde, quel que soit le trafic
+            capacity: Le nombre maximum de tentatives accumulées
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.withdrawn = 0
+        self.exhausted = 0
+
+    def deposit(self):
+        """Crédite le budget pour une requête initiale."""
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """Consomme une tentative si le budget le permet."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+        if self.tokens < 1:
+            self.exhausted += 1
+            return False
+        self.tokens -= 1
+        self.withdrawn += 1
+        return True
+
+    def stats(self) -> Dict[str, object]:
+        """Renvoie l'état du budget pour l'endpoint de santé."""
+        return {
+            "tokens": round(self.tokens, 1),
+            "capacity": self.capacity,
+            "withdrawn": self.withdrawn,
+            "exhausted": self.exhausted,
+        }
+
+
+class RetryPolicy:
+    """
+    Nouvelles tentatives des lectures (GET) dont le service n'a pas pu être joint.
+
+    Seules les erreurs de connexion sont réessayées : la requête n'a alors pas
+    atteint le service et peut être renvoyée sans risque. L'attente entre deux
+    tentatives est tirée au hasard entre 0 et un plafond exponentiel ("full
+    jitter"), pour ne pas synchroniser les tentatives des différents clients.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.025, max_delay: float = 0.25):
+        """
+        Args:
+            max_attempts: Nombre maximum de tentatives, la première comprise
+            base_delay: Le plafond de l'attente avant la deuxième tentative, en secondes
+            max_delay: Le plafond maximum de l'attente, en secondes
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Renvoie l'attente avant la tentative suivant la tentative `attempt` (à partir de 1)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class LatencyQuantile:
+    """
+    Quantile glissant de la latence d'un service, calculé sur les derniers appels
+    réussis et recalculé tous les `refresh` échantillons seulement.
+    """
+
+    def __init__(self, quantile: float = 0.95, window: int = 512, min_samples: int = 50, refresh: int = 32):
+        self.quantile = quantile
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self.pending = 0
+        self.value: Optional[float] = None
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self.pending += 1
+        if self.pending >= self.refresh and len(self.samples) >= self.min_samples:
+            ordered = sorted(self.samples)
+            self.value = ordered[int(self.quantile * (len(ordered) - 1))]
+            self.pending = 0
+
+
+class HedgingPolicy:
+    """
+    Requêtes de couverture ("hedging") des lectures lentes.
+
+    Lorsqu'une lecture n'a pas reçu de réponse après le quantile p95 de la
+    latence du service, une seconde requête est envoyée à une autre instance et
+    la première réponse reçue est retenue. Une seule instance lente n'allonge
+    ainsi plus la latence perçue que d'environ le p95. Les services à une seule
+    instance, ou dont la latence n'est pas encore connue, ne sont pas couverts.
+    """
+
+    def __init__(self, quantile: float = 0.95, min_delay: float = 0.01, enabled: bool = True):
+        """
+        Args:
+            quantile: Le quantile de latence au-delà duquel une requête de couverture est envoyée
+            min_delay: Le délai minimum avant une requête de couverture, en secondes
+            enabled: Si faux, aucune requête de couverture n'est envoyée
+        """
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.enabled = enabled
+        self.latencies: Dict[str, LatencyQuantile] = {}
+
+    def record(self, service: str, latency: float):
+        """Enregistre la latence d'un appel réussi."""
+        tracker = self.latencies.get(service)
+        if tracker is None:
+            tracker = self.latencies[service] = LatencyQuantile(self.quantile)
+        tracker.record(latency)
+
+    def delay(self, service: str, replicas: int) -> Optional[float]:
+        """Renvoie le délai avant une requête de couverture, ou None si la lecture n'est pas couverte."""
+        tracker = self.latencies.get(service)
+        if not self.enabled or replicas < 2 or tracker is None or tracker.value is None:
+            return None
+        return max(self.min_delay, tracker.value)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "delays": {service: tracker.value for service, tracker in self.latencies.items()},
+        }
+
+
+def build_retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", "3")),
+        base_delay=float(os.getenv("RETRY_BASE_DELAY", "0.025")),
+        max_delay=float(os.getenv("RETRY_MAX_DELAY", "0.25")),
+    )
+
+
+def build_retry_budget() -> RetryBudget:
+    return RetryBudget(
+        ratio=float(os.getenv("RETRY_BUDGET_RATIO", "0.1")),
+        min_per_second=float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1")),
+        capacity=float(os.getenv("RETRY_BUDGET_CAPACITY", "20")),
+    )
+
+
+def build_hedging_policy() -> HedgingPolicy:
+    return HedgingPolicy(
+        quantile=float(os.getenv("HEDGE_QUANTILE", "0.95")),
+        min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.01")),
+        enabled=os.getenv("HEDGE_ENABLED", "true").lower() in ("1", "true", "yes", "on"),
+    )
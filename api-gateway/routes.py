@@ -0,0 +1,211 @@
+import os
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from admission import AUTH, BROWSE, PURCHASE, REPORTS, VALIDATION
+from coalescing import CoalesceRule
+from edge_auth import ADMIN, AUTHENTICATED, EMPLOYEE, PUBLIC
+
+# Méthodes relayées aux services ; les autres méthodes reçoivent les politiques
+# des routes valables pour toutes les méthodes
+METHODS = ("GET", "POST", "PUT", "DELETE")
+ANY_METHOD = "*"
+
+# Clé du scope ASGI où est conservée la route résolue d'une requête
+SCOPE_KEY = "gateway.route"
+
+# Modes de regroupement des lectures simultanées (voir CoalesceRule)
+COALESCE_MODES = ("public", "private")
+
+# Politiques héritées d'une route par les routes de préfixe plus long
+POLICY_FIELDS = ("access", "priority", "rate_limit", "timeout", "cache_ttl")
+
+
+@dataclass(frozen=True)
+class Route:
+    """
+    Déclaration d'une route de l'API Gateway.
+
+    Les politiques non renseignées (None) sont héritées de la route du plus long
+    préfixe englobant ; une route limitée à certaines méthodes complète, pour ces
+    méthodes, la route de même préfixe déclarée pour toutes les méthodes.
+
+    Attributes:
+        prefix: Le préfixe des chemins concernés, segment par segment (ex: /tickets/offers)
+        service: Le service vers lequel les requêtes sont relayées ; les chemins
+            transmis au service sont relatifs au préfixe de cette route
+        methods: Les méthodes concernées (toutes si None)
+        access: Le niveau d'accès requis (public, authenticated, employee, admin)
+        priority: La classe de priorité du contrôle d'admission (aucun contrôle si None)
+        rate_limit: Le limiteur de débit appliqué ("auth" ou "api")
+        timeout: Le temps alloué à la requête, en secondes
+        cache_ttl: La durée de vie en cache des lectures (GET), en secondes
+        coalesce: Le regroupement des lectures simultanées : "public" (tous les
+            clients) ou "private" (requêtes portant le même en-tête Authorization)
+    """
+    prefix: str
+    service: Optional[str] = None
+    methods: Optional[Tuple[str, ...]] = None
+    access: Optional[str] = None
+    priority: Optional[int] = None
+    rate_limit: Optional[str] = None
+    timeout: Optional[float] = None
+    cache_ttl: Optional[float] = None
+    coalesce: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """
+    Politiques résolues d'une route pour une méthode, calculées à la compilation
+    de la table de routage.
+
+    Attributes:
+        prefix: Le préfixe de la route la plus spécifique
+        service: Le service destinataire (None pour les endpoints de l'API Gateway)
+        mount: Le préfixe retiré des chemins transmis au service
+        coalesce: La règle de regroupement des lectures simultanées, ou None
+    """
+    prefix: str = ""
+    service: Optional[str] = None
+    mount: str = ""
+    access: Optional[str] = None
+    priority: Optional[int] = None
+    rate_limit: Optional[str] = None
+    timeout: Optional[float] = None
+    cache_ttl: Optional[float] = None
+    coalesce: Optional[CoalesceRule] = None
+
+    def upstream_path(self, path: str) -> str:
+        """Renvoie le chemin dans le service d'un chemin de l'API Gateway."""
+        return path[len(self.mount):]
+
+
+class _Node:
+    __slots__ = ("children", "routes", "policies")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.routes: List[Route] = []
+        self.policies: Dict[str, RoutePolicy] = {}
+
+
+def split_path(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+class RouteTable:
+    """
+    Table de routage précompilée de l'API Gateway.
+
+    Les routes sont rangées dans un arbre de préfixes par segment de chemin, et
+    les politiques de chaque nœud (héritage compris) sont calculées une fois pour
+    toutes à la construction, pour chaque méthode. La résolution d'une requête se
+    limite à descendre l'arbre le long de son chemin, quel que soit le nombre de
+    routes et de politiques déclarées.
+    """
+
+    def __init__(self, routes: Iterable[Route], methods: Iterable[str] = METHODS):
+        """
+        Compile la table de routage.
+
+        Args:
+            routes: Les routes déclarées
+            methods: Les méthodes dont les politiques sont précalculées
+
+        Raises:
+            ValueError: Si une route déclare un mode de regroupement inconnu, ou
+                un regroupement sans service destinataire
+        """
+        self.routes: List[Route] = list(routes)
+        self.methods = tuple(methods)
+        self.root = _Node()
+        for route in self.routes:
+            node = self.root
+            for segment in split_path(route.prefix):
+                node = node.children.setdefault(segment, _Node())
+            node.routes.append(route)
+            if route.coalesce is not None and route.coalesce not in COALESCE_MODES:
+                raise ValueError(f"Unknown coalescing mode {route.coalesce!r} for {route.prefix}")
+        root_policy = RoutePolicy()
+        self._compile(self.root, "", {method: root_policy for method in (*self.methods, ANY_METHOD)})
+
+    def _compile(self, node: _Node, prefix: str, inherited: Dict[str, RoutePolicy]):
+        # Les routes valables pour toutes les méthodes s'appliquent avant les routes propres à une méthode
+        routes = sorted(node.routes, key=lambda route: route.methods is not None)
+        for method, policy in inherited.items():
+            for route in routes:
+                if route.methods is None or method in route.methods:
+                    policy = self._apply(policy, route, prefix)
+            node.policies[method] = policy
+        for segment, child in node.children.items():
+            self._compile(child, f"{prefix}/{segment}", node.policies)
+
+    @staticmethod
+    def _apply(policy: RoutePolicy, route: Route, prefix: str) -> RoutePolicy:
+        changes = {name: getattr(route, name) for name in POLICY_FIELDS if getattr(route, name) is not None}
+        if route.service is not None:
+            changes.update(service=route.service, mount=prefix)
+        policy = replace(policy, prefix=prefix, **changes)
+        if route.coalesce is not None:
+            if policy.service is None:
+                raise ValueError(f"Route {route.prefix} coalesces reads but has no upstream service")
+            rule = CoalesceRule(policy.service, policy.upstream_path(prefix), public=route.coalesce == "public")
+            policy = replace(policy, coalesce=rule)
+        return policy
+
+    def match(self, method: str, path: str) -> RoutePolicy:
+        """
+        Renvoie les politiques d'une requête : celles de la route du plus long
+        préfixe correspondant à son chemin (la racine si aucune ne correspond).
+        """
+        node = self.root
+        for segment in path.split("/"):
+            if segment:
+                child = node.children.get(segment)
+                if child is None:
+                    break
+                node = child
+        policy = node.policies.get(method)
+        return policy if policy is not None else node.policies[ANY_METHOD]
+
+    def resolve(self, scope) -> RoutePolicy:
+        """Renvoie les politiques d'une requête ASGI, résolues au premier appel puis conservées dans son scope."""
+        policy = scope.get(SCOPE_KEY)
+        if policy is None:
+            policy = scope[SCOPE_KEY] = self.match(scope["method"], scope["path"])
+        return policy
+
+    def mounts(self) -> List[Tuple[str, str]]:
+        """Renvoie les couples (préfixe, service) des routes relayées, du préfixe le plus long au plus court."""
+        mounts = [(route.prefix.rstrip("/"), route.service) for route in self.routes if route.service is not None]
+        return sorted(mounts, key=lambda mount: len(split_path(mount[0])), reverse=True)
+
+
+# Routes de l'API Gateway : service destinataire et politiques de chaque préfixe.
+# La validation des billets à l'entrée des sites passe avant l'achat,
+# l'authentification, la consultation du catalogue et les rapports ; les
+# services d'administration et de validation sont réservés respectivement aux
+# administrateurs et aux employés, comme les métriques internes de chaque
+# service. Au-delà du temps alloué (DEADLINE_*), l'appel au service est annulé
+# et le client reçoit une réponse 504.
+gateway_routes = RouteTable([
+    Route("/", access=AUTHENTICATED, rate_limit="api", timeout=float(os.getenv("DEADLINE_DEFAULT", "10"))),
+    Route("/auth", service="auth", priority=AUTH, timeout=float(os.getenv("DEADLINE_AUTH", "5"))),
+    Route("/auth/token", access=PUBLIC, rate_limit="auth"),
+    Route("/auth/register", access=PUBLIC),
+    Route("/auth/metrics", access=ADMIN),
+    Route("/tickets", service="tickets", priority=BROWSE, timeout=float(os.getenv("DEADLINE_TICKETS", "8"))),
+    Route("/tickets/tickets", priority=PURCHASE),
+    Route("/tickets/offers", timeout=float(os.getenv("DEADLINE_OFFERS", "3"))),
+    Route("/tickets/metrics", access=ADMIN),
+    # Catalogue public, mis en cache et regroupé lors de l'ouverture d'une vente
+    Route("/tickets/offers", methods=("GET",), access=PUBLIC,
+          cache_ttl=float(os.getenv("OFFERS_CACHE_TTL", "30")), coalesce="public"),
+    Route("/admin", service="admin", access=ADMIN, priority=REPORTS,
+          timeout=float(os.getenv("DEADLINE_ADMIN", "30"))),
+    Route("/validation", service="validation", access=EMPLOYEE, priority=VALIDATION,
+          timeout=float(os.getenv("DEADLINE_VALIDATION", "2"))),
+    Route("/validation/metrics", access=ADMIN),
+    Route("/me", priority=BROWSE),
+])
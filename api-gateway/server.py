@@ -0,0 +1,253 @@
+"""
+Lancement de l'API Gateway en production : plusieurs workers (processus), pour
+que le débit de l'API Gateway ne soit pas limité à un seul cœur.
+
+    python server.py
+
+Le processus principal supervise les workers : il les relance s'ils s'arrêtent
+de façon inattendue et, à la réception de SIGTERM ou SIGINT, leur demande de
+terminer les requêtes en cours avant de s'arrêter (arrêt progressif).
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import logging
+import tempfile
+import importlib.util
+import multiprocessing
+import multiprocessing.connection
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("api-gateway.server")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+@dataclass
+class ServerConfig:
+    """
+    Paramètres du lancement de l'API Gateway.
+
+    Attributes:
+        host: L'adresse d'écoute
+        port: Le port d'écoute
+        workers: Le nombre de workers (un par cœur par défaut)
+        loop: La boucle d'événements : auto (uvloop si installé), uvloop ou asyncio
+        http: L'analyseur HTTP : auto (httptools si installé), httptools ou h11
+        reuse_port: Chaque worker ouvre sa propre socket d'écoute (SO_REUSEPORT) et le
+            noyau répartit les connexions ; sinon, les workers partagent une socket
+        graceful_timeout: Délai accordé aux requêtes en cours à l'arrêt, en secondes
+        backlog: La taille de la file des connexions en attente
+        metrics_dir: Le répertoire des instantanés de métriques des workers
+    """
+    host: str = "0.0.0.0"
+    port: int = 8080
+    workers: int = 1
+    loop: str = "auto"
+    http: str = "auto"
+    reuse_port: bool = True
+    graceful_timeout: float = 30.0
+    backlog: int = 2048
+    metrics_dir: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "ServerConfig":
+        """Construit la configuration à partir des variables d'environnement GATEWAY_*."""
+        return cls(
+            host=os.getenv("GATEWAY_HOST", "0.0.0.0"),
+            port=int(os.getenv("GATEWAY_PORT", "8080")),
+            workers=int(os.getenv("GATEWAY_WORKERS") or os.cpu_count() or 1),
+            loop=os.getenv("GATEWAY_LOOP", "auto"),
+            http=os.getenv("GATEWAY_HTTP", "auto"),
+            reuse_port=_env_bool("GATEWAY_REUSE_PORT", hasattr(socket, "SO_REUSEPORT")),
+            graceful_timeout=float(os.getenv("GATEWAY_GRACEFUL_TIMEOUT", "30")),
+            backlog=int(os.getenv("GATEWAY_BACKLOG", "2048")),
+            metrics_dir=os.getenv("METRICS_MULTIPROC_DIR") or None,
+        )
+
+    def event_loop(self) -> str:
+        if self.loop == "auto":
+            return "uvloop" if module_available("uvloop") else "asyncio"
+        return self.loop
+
+    def http_parser(self) -> str:
+        if self.http == "auto":
+            return "httptools" if module_available("httptools") else "h11"
+        return self.http
+
+
+def create_socket(host: str, port: int, reuse_port: bool, backlog: int) -> socket.socket:
+    """Ouvre une socket d'écoute TCP, éventuellement partagée entre processus par SO_REUSEPORT."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def prepare_shared_state(config: ServerConfig) -> Dict[str, str]:
+    """
+    Configure l'état partagé entre les workers, avant leur lancement.
+
+    Avec plusieurs workers, les limiteurs de débit utilisent par défaut la mémoire
+    partagée de l'hôte, le cache propage ses invalidations et les métriques sont
+    agrégées. La salle d'attente n'a pas d'état partagé local : elle exige Redis.
+
+    Returns:
+        Les variables d'environnement fixées pour les workers
+
+    Raises:
+        SystemExit: Si la configuration ne peut pas fonctionner avec plusieurs workers
+    """
+    defaults: Dict[str, str] = {}
+    if config.workers > 1:
+        defaults["RATE_LIMIT_BACKEND"] = "shared_memory"
+        defaults["GATEWAY_CACHE_SHARED_INVALIDATION"] = "true"
+        if os.getenv("RATE_LIMIT_BACKEND", "shared_memory") == "memory":
+            logger.warning("RATE_LIMIT_BACKEND=memory: each worker enforces its own rate limits")
+        if os.getenv("WAITING_ROOM_OFFERS") and os.getenv("WAITING_ROOM_BACKEND", "memory") == "memory":
+            raise SystemExit("WAITING_ROOM_BACKEND=redis is required to run the waiting room with several workers")
+        if config.metrics_dir is None:
+            config.metrics_dir = tempfile.mkdtemp(prefix="jo-gateway-metrics-")
+    if config.metrics_dir is not None:
+        # Les instantanés d'un lancement précédent ne doivent pas être additionnés
+        shutil.rmtree(config.metrics_dir, ignore_errors=True)
+        os.makedirs(config.metrics_dir)
+        defaults["METRICS_MULTIPROC_DIR"] = config.metrics_dir
+    applied = {}
+    for name, value in defaults.items():
+        applied[name] = os.environ.setdefault(name, value)
+    return applied
+
+
+def run_worker(config: ServerConfig, sock: Optional[socket.socket]):
+    """Point d'entrée d'un worker : sert l'application sur la socket partagée ou sur sa propre socket."""
+    import uvicorn
+
+    if sock is None:
+        sock = create_socket(config.host, config.port, reuse_port=True, backlog=config.backlog)
+    server = uvicorn.Server(uvicorn.Config(
+        "main:app",
+        loop=config.event_loop(),
+        http=config.http_parser(),
+        backlog=config.backlog,
+        # Le journal d'accès est écrit par GatewayMiddleware
+        access_log=False,
+        timeout_graceful_shutdown=config.graceful_timeout,
+    ))
+    # SIGTERM déclenche l'arrêt progressif d'uvicorn : plus de nouvelles connexions,
+    # fin des requêtes en cours, puis arrêt de l'application (lifespan)
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Lance les workers, les relance en cas d'arrêt inattendu et coordonne l'arrêt progressif."""
+
+    # Un worker arrêté moins de MIN_UPTIME secondes après son lancement est en échec
+    # de démarrage ; au-delà de MAX_FAST_FAILURES échecs consécutifs, le lancement est abandonné
+    MIN_UPTIME = 2.0
+    MAX_FAST_FAILURES = 5
+
+    def __init__(self, config: ServerConfig):
+        self.config = config
+        self.context = multiprocessing.get_context("spawn")
+        self.sock: Optional[socket.socket] = None
+        self.workers: List[Optional[multiprocessing.Process]] = [None] * config.workers
+        self.started_at: List[float] = [0.0] * config.workers
+        self.fast_failures = 0
+        self.stopping = False
+
+    def start_worker(self, index: int):
+        # Les workers importent l'application eux-mêmes (contexte spawn) : les threads
+        # de fond créés à l'import (journal, export des spans) ne survivraient pas à un fork
+        process = self.context.Process(
+            target=run_worker, args=(self.config, self.sock), name=f"gateway-worker-{index}", daemon=False
+        )
+        process.start()
+        self.workers[index] = process
+        self.started_at[index] = time.monotonic()
+
+    def handle_signal(self, signum, frame):
+        self.stopping = True
+
+    def run(self) -> int:
+        """Lance les workers et les supervise jusqu'à l'arrêt ; renvoie le code de sortie."""
+        config = self.config
+        if not config.reuse_port:
+            self.sock = create_socket(config.host, config.port, reuse_port=False, backlog=config.backlog)
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        logger.info(
+            f"Starting {config.workers} workers on {config.host}:{config.port} "
+            f"(loop={config.event_loop()}, http={config.http_parser()}, reuse_port={config.reuse_port})"
+        )
+        for index in range(config.workers):
+            self.start_worker(index)
+
+        exit_code = 0
+        while not self.stopping:
+            multiprocessing.connection.wait(
+                [process.sentinel for process in self.workers if process is not None], timeout=0.5
+            )
+            for index, process in enumerate(self.workers):
+                if self.stopping or process is None or process.is_alive():
+                    continue
+                uptime = time.monotonic() - self.started_at[index]
+                logger.warning(f"Worker {process.pid} exited with code {process.exitcode} after {uptime:.1f}s")
+                self.fast_failures = self.fast_failures + 1 if uptime < self.MIN_UPTIME else 0
+                if self.fast_failures >= self.MAX_FAST_FAILURES:
+                    logger.error("Workers keep failing at startup, giving up")
+                    self.stopping = True
+                    exit_code = 1
+                    break
+                self.start_worker(index)
+
+        self.drain()
+        return exit_code
+
+    def drain(self):
+        """Demande l'arrêt progressif aux workers, puis arrête ceux qui dépassent le délai."""
+        running = [process for process in self.workers if process is not None and process.is_alive()]
+        logger.info(f"Draining {len(running)} workers")
+        for process in running:
+            os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.config.graceful_timeout + 5
+        for process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {process.pid} did not stop in time, killing it")
+                process.kill()
+                process.join()
+        if self.sock is not None:
+            self.sock.close()
+
+
+def main() -> int:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    config = ServerConfig.from_env()
+    prepare_shared_state(config)
+    return Supervisor(config).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
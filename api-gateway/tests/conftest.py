@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import inspect
+import pytest
+import httpx
+
+# Ajouter le chemin de l'API Gateway au sys.path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.insert(0, parent_dir)
+
+import main
+from jose import jwt
+
+def make_token(sub="admin@jo2024.fr", is_admin=True, is_employee=True, expires_in=900, user_id=1):
+    """Crée un token signé avec la clé de l'API Gateway, comme le service d'authentification."""
+    claims = {"sub": sub, "is_admin": is_admin, "is_employee": is_employee}
+    if user_id is not None:
+        claims["user_id"] = user_id
+    if expires_in is not None:
+        claims["exp"] = int(time.time()) + expires_in
+    verifier = main.edge_auth.verifier
+    return jwt.encode(claims, verifier.secret_key, algorithm=verifier.algorithm)
+
+class StreamingMockTransport(httpx.AsyncBaseTransport):
+    """
+    Transport simulé qui, contrairement à `httpx.MockTransport`, ne lit pas le
+    corps de la réponse à l'avance, afin de pouvoir la relayer en streaming.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        response = self.handler(request)
+        if inspect.isawaitable(response):
+            response = await response
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=response.stream,
+        )
+
+# Fixture pour remplacer les services par un transport HTTP simulé
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    Simule les services en aval. Le test affecte `upstream.handler`, une fonction
+    (éventuellement asynchrone) recevant une `httpx.Request` et renvoyant une `httpx.Response`.
+    """
+    class Upstream:
+        handler = None
+        requests = []
+
+        def __call__(self, request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return self.handler(request)
+
+    fake = Upstream()
+    fake.requests = []
+    for pool in main.pools.values():
+        monkeypatch.setattr(pool, "client", pool.build_client(transport=StreamingMockTransport(fake)))
+    monkeypatch.setattr(main, "breakers", main.build_breakers(main.SERVICE_ENDPOINTS))
+    monkeypatch.setattr(main, "balancers", main.build_balancers(main.SERVICE_ENDPOINTS))
+    monkeypatch.setattr(main, "retry_budget", main.build_retry_budget())
+    monkeypatch.setattr(main, "hedging", main.build_hedging_policy())
+    main.response_cache.clear()
+    yield fake
+    main.response_cache.clear()
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """
+    Serveur Redis en mémoire (fakeredis) exécutant réellement les scripts Lua des
+    backends partagés (GCRA, salle d'attente). Les clients créés par
+    redis.asyncio.from_url pendant le test s'y connectent tous, quelle que soit l'URL.
+    Le test est ignoré si fakeredis ou son moteur Lua (lupa) n'est pas installé.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    server.url = "redis://fakeredis:6379/0"
+    monkeypatch.setattr(
+        redis.asyncio, "from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs)
+    )
+    return server
@@ -0,0 +1,759 @@
+import os
+import sys
+import gzip
+import time
+import asyncio
+import pytest
+import httpx
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+
+# Ajouter le répertoire parent au chemin pour pouvoir importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import app
+from conftest import make_token
+from rate_limiter import GCRARateLimiter
+from waiting_room import MemoryQueueStore, QueueTokenSigner, WaitingRoom
+
+# Les routes protégées exigent un token vérifié par l'API Gateway
+client = TestClient(app, headers={"Authorization": f"Bearer {make_token()}"})
+anonymous_client = TestClient(app)
+
+# Tests du relais en streaming
+class TestStreamingProxy:
+    def test_json_response_is_forwarded_verbatim(self, upstream):
+        """Vérifie que le corps JSON est relayé sans être ré-encodé"""
+        body = b'{"id": 1,   "name": "Finale 100m"}'
+        upstream.handler = lambda request: httpx.Response(
+            200, content=body, headers={"content-type": "application/json"}
+        )
+
+        response = client.get("/tickets/offers/1")
+
+        assert response.status_code == 200
+        assert response.content == body
+        assert str(upstream.requests[0].url) == "http://localhost:8001/offers/1"
+
+    def test_non_json_payload(self, upstream):
+        """Vérifie qu'un contenu non JSON est relayé sans erreur"""
+        upstream.handler = lambda request: httpx.Response(
+            200, content=b"\x89PNG\r\n", headers={"content-type": "image/png"}
+        )
+
+        response = client.get("/tickets/tickets/1/qrcode")
+
+        assert response.status_code == 200
+        assert response.content == b"\x89PNG\r\n"
+        assert response.headers["content-type"] == "image/png"
+
+    def test_compressed_payload_is_not_decoded(self, upstream):
+        """Vérifie qu'un corps compressé par le service est relayé tel quel"""
+        compressed = gzip.compress(b'{"ok": true}')
+        upstream.handler = lambda request: httpx.Response(
+            200, content=compressed,
+            headers={"content-encoding": "gzip", "content-type": "application/json"},
+        )
+
+        response = client.get("/tickets/offers/")
+
+        assert response.json() == {"ok": True}
+        assert response.headers["content-encoding"] == "gzip"
+
+    def test_compressed_payload_is_not_recompressed(self, upstream):
+        """Vérifie qu'un corps déjà compressé par le service n'est pas compressé une seconde fois"""
+        compressed = gzip.compress(b'[' + b'{"id": 1},' * 500 + b'{"id": 1}]')
+        upstream.handler = lambda request: httpx.Response(
+            200, content=compressed,
+            headers={"content-encoding": "gzip", "content-type": "application/json"},
+        )
+
+        response = client.get("/tickets/tickets/user/1", headers={"Accept-Encoding": "gzip, br, zstd"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()) == 501
+
+    def test_large_json_list_is_compressed(self, upstream):
+        """Vérifie la compression des listes JSON relayées par l'API Gateway"""
+        tickets = [{"id": i, "offer_id": 1, "qr_code": "x" * 64} for i in range(100)]
+        upstream.handler = lambda request: httpx.Response(200, json=tickets)
+
+        response = client.get("/tickets/tickets/user/1", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == tickets
+
+    def test_query_string_and_body_are_forwarded(self, upstream):
+        """Vérifie la transmission de la query string et du corps de la requête"""
+        upstream.handler = lambda request: httpx.Response(201, json={"received": request.content.decode()})
+
+        response = client.post("/tickets/tickets/?a=1&a=2", content=b'{"offer_id": 3}')
+
+        assert response.status_code == 201
+        assert response.json() == {"received": '{"offer_id": 3}'}
+        assert upstream.requests[0].url.query == b"a=1&a=2"
+
+    def test_upstream_error_status_is_preserved(self, upstream):
+        """Vérifie que le code d'erreur du service est conservé"""
+        upstream.handler = lambda request: httpx.Response(404, json={"detail": "Offer not found"})
+
+        response = client.get("/tickets/offers/999")
+
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Offer not found"}
+
+    def test_unavailable_service(self, upstream):
+        """Vérifie qu'une erreur de connexion renvoie une erreur 503"""
+        def handler(request):
+            raise httpx.ConnectError("connection refused", request=request)
+        upstream.handler = handler
+
+        response = client.get("/tickets/offers/")
+
+        assert response.status_code == 503
+
+# Tests des pools de connexions
+class TestConnectionPools:
+    def test_one_pool_per_service(self):
+        """Vérifie qu'un pool est créé pour chaque service"""
+        from main import pools, SERVICE_ENDPOINTS
+        assert set(pools) == set(SERVICE_ENDPOINTS)
+        assert SERVICE_ENDPOINTS["tickets"] == ["http://localhost:8001"]
+
+    def test_pool_stats_endpoint(self, upstream):
+        """Vérifie l'exposition des statistiques des pools"""
+        upstream.handler = lambda request: httpx.Response(200, json=[])
+        client.get("/tickets/offers/")
+
+        response = client.get("/health/pools")
+
+        assert response.status_code == 200
+        stats = response.json()["tickets"]
+        assert stats["total_requests"] >= 1
+        assert stats["in_flight"] == 0
+        assert {"idle", "avg_wait_ms", "max_wait_ms", "max_connections"} <= set(stats)
+
+# Tests du cache des offres
+class TestOffersCache:
+    def test_offers_are_served_from_cache(self, upstream):
+        """Vérifie que la deuxième lecture du catalogue est servie par le cache"""
+        upstream.handler = lambda request: httpx.Response(200, json=[{"id": 1}])
+
+        first = client.get("/tickets/offers/")
+        second = client.get("/tickets/offers/")
+
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.json() == [{"id": 1}]
+        assert len(upstream.requests) == 1
+
+    def test_cache_key_varies_on_query_params(self, upstream):
+        """Vérifie que la pagination fait varier la clé de cache"""
+        upstream.handler = lambda request: httpx.Response(200, json={"query": request.url.query.decode()})
+
+        client.get("/tickets/offers/?skip=0&limit=10")
+        response = client.get("/tickets/offers/?limit=10&skip=0")
+        client.get("/tickets/offers/?skip=10&limit=10")
+
+        assert response.headers["x-cache"] == "HIT"
+        assert len(upstream.requests) == 2
+
+    def test_expired_entry_is_revalidated_with_etag(self, upstream):
+        """Vérifie qu'une entrée expirée est revalidée auprès du service avec son ETag"""
+        def handler(request):
+            if request.headers.get("if-none-match") == '"v1"':
+                return httpx.Response(304, headers={"etag": '"v1"'})
+            return httpx.Response(200, json=[{"id": 1}], headers={"etag": '"v1"'})
+        upstream.handler = handler
+
+        client.get("/tickets/offers/")
+        for entry in main.response_cache.entries.values():
+            entry.expires_at = 0
+        response = client.get("/tickets/offers/")
+
+        assert response.status_code == 200
+        assert response.headers["x-cache"] == "REVALIDATED"
+        assert response.json() == [{"id": 1}]
+        assert upstream.requests[1].headers["if-none-match"] == '"v1"'
+        assert client.get("/tickets/offers/").headers["x-cache"] == "HIT"
+
+    def test_client_etag_gets_not_modified(self, upstream):
+        """Vérifie que l'API Gateway répond 304 à un client dont la copie est à jour"""
+        upstream.handler = lambda request: httpx.Response(200, json=[{"id": 1}], headers={"etag": '"v1"'})
+
+        client.get("/tickets/offers/")
+        response = client.get("/tickets/offers/", headers={"If-None-Match": 'W/"v1"'})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == '"v1"'
+        # La condition du client n'est pas transmise au service (réponse partagée)
+        assert "if-none-match" not in upstream.requests[0].headers
+
+    def test_errors_are_not_cached(self, upstream):
+        """Vérifie que les réponses en erreur ne sont pas mises en cache"""
+        upstream.handler = lambda request: httpx.Response(404, json={"detail": "Offer not found"})
+
+        client.get("/tickets/offers/42")
+        client.get("/tickets/offers/42")
+
+        assert len(upstream.requests) == 2
+
+    def test_admin_write_invalidates_offers(self, upstream):
+        """Vérifie qu'une modification d'offre par l'administration invalide le cache"""
+        upstream.handler = lambda request: httpx.Response(200, json={"id": 1})
+
+        client.get("/tickets/offers/1")
+        client.put("/admin/offers/1", json={"price": 10})
+        response = client.get("/tickets/offers/1")
+
+        assert response.headers["x-cache"] == "MISS"
+        assert len(upstream.requests) == 3
+
+    def test_cache_stats_endpoint(self, upstream):
+        """Vérifie l'exposition des compteurs du cache"""
+        response = client.get("/health/cache")
+
+        assert response.status_code == 200
+        assert {"hits", "misses", "entries"} <= set(response.json())
+
+# Tests du disjoncteur
+class TestCircuitBreaker:
+    def test_open_circuit_fails_fast(self, upstream):
+        """Vérifie qu'un service au disjoncteur ouvert est rejeté sans appel réseau"""
+        import main
+        main.breakers["tickets"].record_probe(False)
+        upstream.handler = lambda request: httpx.Response(200, json=[])
+
+        response = client.get("/tickets/tickets/1")
+
+        assert response.status_code == 503
+        assert "retry-after" in response.headers
+        assert upstream.requests == []
+
+    def test_repeated_failures_open_the_circuit(self, upstream):
+        """Vérifie que des erreurs serveur répétées ouvrent le disjoncteur"""
+        import main
+        upstream.handler = lambda request: httpx.Response(500, json={"detail": "boom"})
+
+        for _ in range(main.breakers["validation"].minimum_calls):
+            client.get("/validation/validations/")
+
+        assert main.breakers["validation"].state == "open"
+        assert client.get("/validation/validations/").status_code == 503
+
+    def test_health_reports_circuits(self, upstream):
+        """Vérifie que l'état des disjoncteurs apparaît dans /health"""
+        import main
+        main.breakers["admin"].record_probe(False)
+
+        response = client.get("/health")
+
+        body = response.json()
+        assert body["status"] == "degraded"
+        assert body["circuits"]["admin"]["state"] == "open"
+        assert body["circuits"]["tickets"]["state"] == "closed"
+
+# Tests de la répartition de charge
+class TestLoadBalancing:
+    def test_requests_are_spread_across_replicas(self, upstream, monkeypatch):
+        """Vérifie la répartition des requêtes entre plusieurs instances"""
+        import main
+        from load_balancer import LoadBalancer
+        monkeypatch.setitem(
+            main.balancers, "tickets",
+            LoadBalancer("tickets", ["http://tickets-1:8001", "http://tickets-2:8001"]),
+        )
+        upstream.handler = lambda request: httpx.Response(200, json={"host": request.url.host})
+
+        hosts = [client.get("/tickets/tickets/1").json()["host"] for _ in range(4)]
+
+        assert hosts == ["tickets-1", "tickets-2", "tickets-1", "tickets-2"]
+
+    def test_failing_replica_is_ejected(self, upstream, monkeypatch):
+        """Vérifie que l'instance en échec est éjectée et que le trafic bascule"""
+        import main
+        from load_balancer import LoadBalancer
+        balancer = LoadBalancer("tickets", ["http://tickets-1:8001", "http://tickets-2:8001"], eject_after=1)
+        monkeypatch.setitem(main.balancers, "tickets", balancer)
+
+        def handler(request):
+            if request.url.host == "tickets-1":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200, json={"host": request.url.host})
+        upstream.handler = handler
+
+        # La lecture en échec est renvoyée à l'autre instance
+        assert client.get("/tickets/tickets/1").json()["host"] == "tickets-2"
+        assert [request.url.host for request in upstream.requests] == ["tickets-1", "tickets-2"]
+        responses = [client.get("/tickets/tickets/1") for _ in range(3)]
+
+        assert all(response.json()["host"] == "tickets-2" for response in responses)
+        assert balancer.healthy_count() == 1
+        assert all(replica.outstanding == 0 for replica in balancer.replicas)
+
+# Tests des nouvelles tentatives et des requêtes de couverture
+class TestRetries:
+    def replicas(self, monkeypatch):
+        import main
+        from load_balancer import LoadBalancer
+        balancer = LoadBalancer("tickets", ["http://tickets-1:8001", "http://tickets-2:8001"])
+        monkeypatch.setitem(main.balancers, "tickets", balancer)
+        return balancer
+
+    def test_writes_are_not_retried(self, upstream, monkeypatch):
+        """Vérifie qu'une écriture n'est jamais renvoyée, même sur erreur de connexion"""
+        self.replicas(monkeypatch)
+
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+        upstream.handler = handler
+
+        assert client.post("/tickets/tickets/", json={"offer_id": 1}).status_code == 503
+        assert len(upstream.requests) == 1
+
+    def test_retries_stop_when_budget_is_exhausted(self, upstream, monkeypatch):
+        """Vérifie qu'aucune nouvelle tentative n'est envoyée sans budget"""
+        import main
+        from retry import RetryBudget
+        self.replicas(monkeypatch)
+        monkeypatch.setattr(main, "retry_budget", RetryBudget(ratio=0, min_per_second=0, capacity=0))
+
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+        upstream.handler = handler
+
+        assert client.get("/tickets/tickets/1").status_code == 503
+        assert len(upstream.requests) == 1
+        assert main.retry_budget.stats()["exhausted"] == 1
+
+    def test_slow_read_is_hedged(self, upstream, monkeypatch):
+        """Vérifie qu'une lecture lente est couverte par une requête à l'autre instance"""
+        import main
+        balancer = self.replicas(monkeypatch)
+        for _ in range(64):
+            main.hedging.record("tickets", 0.02)
+
+        async def handler(request):
+            if request.url.host == "tickets-1":
+                await asyncio.sleep(2)
+            return httpx.Response(200, json={"host": request.url.host})
+        upstream.handler = handler
+
+        started = time.monotonic()
+        response = client.get("/tickets/tickets/1")
+
+        assert response.json()["host"] == "tickets-2"
+        assert time.monotonic() - started < 1
+        assert [request.url.host for request in upstream.requests] == ["tickets-1", "tickets-2"]
+        assert all(replica.outstanding == 0 for replica in balancer.replicas)
+
+# Tests de la vérification des tokens à l'entrée de l'API Gateway
+class TestEdgeAuth:
+    def test_missing_token_is_rejected_without_upstream_call(self, upstream):
+        """Vérifie qu'une requête sans token est rejetée sans appeler le service"""
+        response = anonymous_client.get("/tickets/tickets/1")
+
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
+        assert upstream.requests == []
+
+    def test_invalid_and_expired_tokens_are_rejected(self, upstream):
+        """Vérifie le rejet des tokens falsifiés ou expirés"""
+        forged = make_token()[:-2] + "xx"
+        expired = make_token(expires_in=-10)
+
+        for token in (forged, expired, "not-a-jwt"):
+            response = anonymous_client.get("/tickets/tickets/1", headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 401
+        assert upstream.requests == []
+
+    def test_public_routes_need_no_token(self, upstream):
+        """Vérifie que le catalogue et la connexion restent accessibles sans token"""
+        upstream.handler = lambda request: httpx.Response(200, json=[])
+
+        assert anonymous_client.get("/tickets/offers/").status_code == 200
+        assert anonymous_client.post("/auth/token", data={"username": "a", "password": "b"}).status_code == 200
+        assert anonymous_client.post("/tickets/offers/").status_code == 401
+
+    def test_identity_headers_are_forwarded(self, upstream):
+        """Vérifie la transmission de l'identité vérifiée, et non de celle envoyée par le client"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+        token = make_token(sub="user@example.com", is_admin=False, is_employee=False)
+
+        anonymous_client.get("/tickets/tickets/1", headers={
+            "Authorization": f"Bearer {token}",
+            "X-User-Is-Admin": "true",
+        })
+
+        forwarded = upstream.requests[0].headers
+        assert forwarded["x-user-sub"] == "user@example.com"
+        assert forwarded["x-user-is-admin"] == "false"
+        assert forwarded["x-user-is-employee"] == "false"
+
+    def test_roles_are_enforced(self, upstream):
+        """Vérifie que l'administration et la validation sont réservées aux rôles concernés"""
+        upstream.handler = lambda request: httpx.Response(200, json=[])
+        user = {"Authorization": f"Bearer {make_token(sub='user@example.com', is_admin=False, is_employee=False)}"}
+        employee = {"Authorization": f"Bearer {make_token(sub='staff@jo2024.fr', is_admin=False, is_employee=True)}"}
+
+        assert anonymous_client.get("/admin/sales/", headers=user).status_code == 403
+        assert anonymous_client.get("/validation/validations/", headers=user).status_code == 403
+        assert anonymous_client.get("/admin/sales/", headers=employee).status_code == 403
+        assert anonymous_client.get("/validation/validations/", headers=employee).status_code == 200
+
+    def test_service_metrics_are_reserved_to_admins(self, upstream):
+        """Vérifie que les métriques internes des services ne sont pas accessibles aux utilisateurs"""
+        upstream.handler = lambda request: httpx.Response(200, text="# TYPE http_requests_in_flight gauge\n")
+        user = {"Authorization": f"Bearer {make_token(sub='user@example.com', is_admin=False, is_employee=False)}"}
+        employee = {"Authorization": f"Bearer {make_token(sub='staff@jo2024.fr', is_admin=False, is_employee=True)}"}
+
+        for service in ("auth", "tickets", "validation", "admin"):
+            assert anonymous_client.get(f"/{service}/metrics", headers=user).status_code == 403
+            assert anonymous_client.get(f"/{service}/metrics", headers=employee).status_code == 403
+        assert upstream.requests == []
+        assert client.get("/tickets/metrics").status_code == 200
+
+    def test_verified_tokens_are_cached(self, upstream):
+        """Vérifie qu'un token n'est décodé qu'une fois tant qu'il n'a pas expiré"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+        token = make_token(sub="cached@example.com", is_admin=False, is_employee=False)
+        before = client.get("/health/auth").json()
+
+        for _ in range(3):
+            anonymous_client.get("/tickets/tickets/1", headers={"Authorization": f"Bearer {token}"})
+
+        after = client.get("/health/auth").json()
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 2
+
+# Tests de la salle d'attente virtuelle
+class TestWaitingRoom:
+    @pytest.fixture
+    def room(self, monkeypatch):
+        room = WaitingRoom(QueueTokenSigner("test-secret"), MemoryQueueStore(), {12: 0.001}, burst=1.0)
+        monkeypatch.setattr(main, "waiting_room", room)
+        return room
+
+    def user(self, sub):
+        return {"Authorization": f"Bearer {make_token(sub=sub, is_admin=False, is_employee=False)}"}
+
+    def test_purchase_requires_admitted_queue_token(self, upstream, room):
+        """Vérifie qu'un achat d'une offre en salle d'attente n'est relayé qu'avec un jeton admis"""
+        upstream.handler = lambda request: httpx.Response(200, json={"id": 1})
+        first = anonymous_client.post("/waiting-room/12/join", headers=self.user("first@example.com")).json()
+        second = anonymous_client.post("/waiting-room/12/join", headers=self.user("second@example.com")).json()
+        purchase = {"user_id": 1, "offer_id": 12}
+
+        without_token = anonymous_client.post("/tickets/tickets/", json=purchase, headers=self.user("first@example.com"))
+        not_admitted = anonymous_client.post("/tickets/tickets/", json=purchase, headers={
+            **self.user("second@example.com"), "X-Queue-Token": second["token"],
+        })
+        admitted = anonymous_client.post("/tickets/tickets/", json=purchase, headers={
+            **self.user("first@example.com"), "X-Queue-Token": first["token"],
+        })
+
+        assert first["admitted"] and second["position"] == 1
+        assert without_token.status_code == 403
+        assert not_admitted.status_code == 429
+        assert "retry-after" in not_admitted.headers
+        assert admitted.status_code == 200
+        assert len(upstream.requests) == 1
+        assert upstream.requests[0].content == admitted.request.content
+
+    def test_offer_id_is_coerced_like_the_service(self, upstream, room):
+        """Vérifie qu'une offre envoyée sous forme de texte ou de flottant passe par la salle d'attente"""
+        upstream.handler = lambda request: httpx.Response(200, json={"id": 1})
+        anonymous_client.post("/waiting-room/12/join", headers=self.user("first@example.com"))
+
+        as_string = client.post("/tickets/tickets/", json={"user_id": 1, "offer_id": "12"})
+        as_float = client.post("/tickets/tickets/", json={"user_id": 1, "offer_id": 12.0})
+        invalid = client.post("/tickets/tickets/", json={"user_id": 1, "offer_id": "12.5"})
+
+        assert as_string.status_code == 403
+        assert as_float.status_code == 403
+        assert invalid.status_code == 422
+        assert upstream.requests == []
+
+    def test_queue_token_is_used_once(self, upstream, room):
+        """Vérifie qu'un jeton admis ne sert qu'à un achat réussi"""
+        statuses = iter([500, 200, 200])
+        upstream.handler = lambda request: httpx.Response(next(statuses), json={})
+        token = anonymous_client.post("/waiting-room/12/join", headers=self.user("first@example.com")).json()["token"]
+        headers = {**self.user("first@example.com"), "X-Queue-Token": token}
+
+        purchases = [
+            anonymous_client.post("/tickets/tickets/", json={"user_id": 1, "offer_id": 12}, headers=headers)
+            for _ in range(3)
+        ]
+
+        assert [purchase.status_code for purchase in purchases] == [500, 200, 403]
+        assert len(upstream.requests) == 2
+
+    def test_other_offers_are_not_queued(self, upstream, room):
+        """Vérifie que les achats des autres offres sont relayés sans jeton"""
+        upstream.handler = lambda request: httpx.Response(200, json={"id": 1})
+
+        response = client.post("/tickets/tickets/", json={"user_id": 1, "offer_id": 3})
+
+        assert response.status_code == 200
+        assert anonymous_client.post("/waiting-room/3/join", headers=self.user("a@example.com")).status_code == 404
+
+    def test_status_polling_and_events(self, room):
+        """Vérifie les endpoints de position, par requête simple et en Server-Sent Events"""
+        token = anonymous_client.post("/waiting-room/12/join", headers=self.user("first@example.com")).json()["token"]
+
+        status = anonymous_client.get("/waiting-room/12/status", headers={"X-Queue-Token": token})
+        forged = anonymous_client.get("/waiting-room/12/status", headers={"X-Queue-Token": token + "x"})
+        events = anonymous_client.get(f"/waiting-room/12/events?token={token}", headers={"Accept-Encoding": "gzip"})
+
+        assert status.json() == {"position": 0, "admitted": True, "estimated_wait": 0}
+        assert forged.status_code == 403
+        assert events.headers["content-type"].startswith("text/event-stream")
+        assert "content-encoding" not in events.headers
+        assert events.text.startswith("event: admitted\ndata: ")
+
+# Tests des requêtes groupées
+class TestBatch:
+    def test_subrequests_run_concurrently_in_one_response(self, upstream):
+        """Vérifie que les sous-requêtes sont relayées et leurs résultats renvoyés dans l'ordre"""
+        upstream.handler = lambda request: httpx.Response(200, json={"path": request.url.path})
+
+        response = client.post("/batch", json={"requests": [
+            {"id": "tickets", "path": "/tickets/tickets/user/1"},
+            {"path": "/tickets/offers/2"},
+            {"path": "/tickets/offers/3"},
+        ]})
+
+        assert response.status_code == 200
+        results = response.json()["responses"]
+        assert [result["body"] for result in results] == [
+            {"path": "/tickets/user/1"}, {"path": "/offers/2"}, {"path": "/offers/3"},
+        ]
+        assert results[0]["id"] == "tickets"
+        assert results[1]["headers"]["x-cache"] == "MISS"
+        assert len(upstream.requests) == 3
+
+    def test_subrequests_are_authenticated(self, upstream):
+        """Vérifie que l'authentification s'applique à chaque sous-requête"""
+        upstream.handler = lambda request: httpx.Response(200, json=[])
+
+        response = anonymous_client.post("/batch", json={"requests": [
+            {"path": "/tickets/offers/"},
+            {"path": "/tickets/tickets/user/1"},
+        ]})
+
+        assert [result["status"] for result in response.json()["responses"]] == [200, 401]
+        assert len(upstream.requests) == 1
+
+    def test_subrequest_errors_keep_their_status(self, upstream):
+        """Vérifie que l'erreur HTTP d'une sous-requête est renvoyée avec son code et son détail"""
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+        upstream.handler = handler
+
+        response = client.post("/batch", json={"requests": [{"path": "/tickets/tickets/1"}]})
+
+        result = response.json()["responses"][0]
+        assert result["status"] == 503
+        assert result["body"] == {"detail": "Service tickets unavailable"}
+
+    def test_gateway_endpoints_cannot_be_batched(self, upstream):
+        """Vérifie le refus des sous-requêtes vers les flux de la salle d'attente"""
+        response = client.post("/batch", json={"requests": [{"path": "/waiting-room/12/events"}]})
+
+        assert response.status_code == 400
+
+    def test_batch_is_one_weighted_rate_limit_unit(self, upstream, monkeypatch):
+        """Vérifie le décompte de la requête groupée par la limitation de débit"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+        limiter = GCRARateLimiter(max_requests=10, window_size=60)
+        monkeypatch.setattr(main, "api_limiter", limiter)
+        batch = {"requests": [{"path": f"/tickets/offers/{i}"} for i in range(10)]}
+
+        statuses = [client.post("/batch", json=batch).status_code for _ in range(6)]
+
+        assert statuses == [200] * 5 + [429]
+
+    def test_invalid_batch(self, upstream):
+        """Vérifie le rejet d'une requête groupée invalide"""
+        response = client.post("/batch", json={"requests": [{"method": "DELETE", "path": "/tickets/tickets/1"}]})
+
+        assert response.status_code == 400
+        assert upstream.requests == []
+
+# Tests de l'endpoint de métriques
+class TestMetrics:
+    def test_metrics_endpoint(self, upstream):
+        """Vérifie l'export des latences par route et par service, et des refus de débit"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+        client.get("/tickets/tickets/1")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert 'gateway_http_request_duration_seconds_count{method="GET",route="/tickets{path:path}",status="200"}' in body
+        assert 'gateway_upstream_request_duration_seconds_count{service="tickets",outcome="success"}' in body
+        assert "gateway_http_requests_in_flight 1" in body
+        assert "# TYPE gateway_rate_limit_rejections_total counter" in body
+
+# Tests de la propagation du contexte de trace
+class TestTracing:
+    def test_trace_context_is_propagated_to_services(self, upstream, monkeypatch):
+        """Vérifie que le service reçoit un traceparent enfant du span de l'API Gateway"""
+        spans = []
+        monkeypatch.setattr(main.tracer, "processor", SimpleNamespace(on_end=spans.append))
+        monkeypatch.setattr(main.tracer, "enabled", True)
+        monkeypatch.setattr(main.tracer, "sample_ratio", 1.0)
+        upstream.handler = lambda request: httpx.Response(200, json={})
+
+        client.get("/tickets/tickets/1")
+
+        by_name = {span.name: span for span in spans}
+        assert set(by_name) == {"GET /tickets{path:path}", "edge_auth", "GET tickets"}
+        server, upstream_call = by_name["GET /tickets{path:path}"], by_name["GET tickets"]
+        assert upstream.requests[0].headers["traceparent"] == upstream_call.context.traceparent()
+        assert upstream_call.parent_id == server.context.span_id
+        assert server.parent_id is None
+
+    def test_client_cannot_force_sampling(self, upstream, monkeypatch):
+        """Vérifie que la décision d'échantillonnage du client est ignorée à l'entrée"""
+        spans = []
+        monkeypatch.setattr(main.tracer, "processor", SimpleNamespace(on_end=spans.append))
+        monkeypatch.setattr(main.tracer, "enabled", True)
+        monkeypatch.setattr(main.tracer, "sample_ratio", 0.0)
+        upstream.handler = lambda request: httpx.Response(200, json={})
+
+        client.get(
+            "/tickets/tickets/1", headers={"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"}
+        )
+
+        forwarded = upstream.requests[0].headers["traceparent"]
+        assert not forwarded.startswith("00-4bf92f3577b34da6a3ce929d0e0e4736-")
+        assert forwarded.endswith("-00")
+        assert spans == []
+
+# Tests des échéances transmises aux services
+class TestDeadlines:
+    def test_remaining_budget_is_forwarded(self, upstream):
+        """Vérifie que le service reçoit le temps restant, borné par le temps alloué à la route"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+
+        client.get("/validation/validate/1")
+        client.get("/admin/offers/", headers={"x-request-timeout-ms": "1500"})
+
+        assert 0 < int(upstream.requests[0].headers["x-request-timeout-ms"]) <= 2000
+        assert 0 < int(upstream.requests[1].headers["x-request-timeout-ms"]) <= 1500
+
+    def test_slow_upstream_is_cancelled(self, upstream):
+        """Vérifie que l'appel est annulé une fois l'échéance atteinte"""
+        cancelled = []
+
+        async def slow(request):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(request)
+                raise
+            return httpx.Response(200, json={})
+
+        upstream.handler = slow
+
+        started = time.monotonic()
+        response = client.get("/tickets/tickets/1", headers={"x-request-timeout-ms": "100"})
+
+        assert response.status_code == 504
+        assert time.monotonic() - started < 2
+        assert len(cancelled) == 1
+        assert main.pools["tickets"].in_flight == 0
+
+    def test_expired_request_is_not_forwarded(self, upstream):
+        """Vérifie qu'une requête arrivée après son échéance n'est pas transmise"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+
+        response = client.get("/tickets/tickets/1", headers={"x-request-timeout-ms": "0"})
+
+        assert response.status_code == 504
+        assert upstream.requests == []
+
+    def test_expired_request_keeps_half_open_trials(self, upstream):
+        """Vérifie qu'une requête arrivée après son échéance ne consomme pas de requête d'essai"""
+        upstream.handler = lambda request: httpx.Response(200, json={})
+        breaker = main.breakers["tickets"]
+        breaker.record_probe(False)
+        breaker.record_probe(True)
+
+        for _ in range(breaker.half_open_max_calls + 1):
+            assert client.get("/tickets/tickets/1", headers={"x-request-timeout-ms": "0"}).status_code == 504
+
+        assert breaker.half_open_calls == 0
+        assert client.get("/tickets/tickets/1").status_code == 200
+
+    def test_cancelled_trial_call_is_released(self, upstream):
+        """Vérifie qu'une requête d'essai annulée avant la réponse du service est rendue au disjoncteur"""
+        async def slow(request):
+            await asyncio.sleep(5)
+            return httpx.Response(200, json={})
+
+        upstream.handler = slow
+        breaker = main.breakers["tickets"]
+        breaker.half_open_max_calls = 1
+        breaker.record_probe(False)
+        breaker.record_probe(True)
+
+        async def cancel_trial():
+            task = asyncio.ensure_future(main.send_upstream("tickets", "POST", "/tickets/1", {}))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+
+        assert breaker.state == "half_open"
+        assert breaker.allow_request()
+
+# Tests de la page « Mes billets » composée par l'API Gateway
+class TestMyTickets:
+    def test_composed_document(self, upstream):
+        """Vérifie la composition des billets, des offres et des QR codes en une réponse"""
+        def handler(request):
+            path = request.url.path
+            if path == "/tickets/user/1":
+                return httpx.Response(200, json=[{"id": 5, "offer_id": 2}, {"id": 6, "offer_id": 2}])
+            if path == "/offers/2":
+                return httpx.Response(200, json={"id": 2, "name": "Finale 100m"})
+            if path == "/tickets/6/qrcode":
+                return httpx.Response(500, json={"detail": "Internal server error"})
+            return httpx.Response(200, json={"qr_code": "data:image/png;base64,AA=="})
+
+        upstream.handler = handler
+
+        response = client.get("/me/tickets/full")
+
+        assert response.status_code == 200
+        document = response.json()
+        assert [item["ticket"]["id"] for item in document["tickets"]] == [5, 6]
+        assert document["tickets"][0]["offer"] == {"id": 2, "name": "Finale 100m"}
+        assert document["tickets"][1]["qr_code"] is None
+        assert document["errors"] == [{"resource": "qr_code", "id": 6, "status": 500}]
+        assert sorted(request.url.path for request in upstream.requests).count("/offers/2") == 1
+        assert upstream.requests[0].headers["x-user-id"] == "1"
+
+    def test_token_without_user_id_is_rejected(self, upstream):
+        """Vérifie le refus d'un token ne portant pas l'identifiant de l'utilisateur"""
+        response = anonymous_client.get(
+            "/me/tickets/full", headers={"Authorization": f"Bearer {make_token(user_id=None)}"}
+        )
+
+        assert response.status_code == 401
+        assert upstream.requests == []
+
+    def test_tickets_unavailable(self, upstream):
+        """Vérifie l'erreur renvoyée quand les billets ne peuvent pas être lus"""
+        upstream.handler = lambda request: httpx.Response(503, json={})
+
+        assert client.get("/me/tickets/full").status_code == 503
@@ -0,0 +1,1595 @@
+import pytest
+import sys
+import os
+import time
+import io
+import json
+import queue
+import asyncio
+import logging
+import logging.handlers
+import threading
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Ajouter le répertoire parent au chemin pour pouvoir importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import BoundedKeyState, RateLimiter, GCRARateLimiter, SharedRateLimiter, create_limiter, sweep_periodically
+from rate_limit_backends import RedisBackend, SharedMemoryBackend, aioredis
+from pools import PoolConfig, ServicePool, build_pools
+from cache import ResponseCache, SharedEpochs, etag_matches, invalidate_after_write
+from circuit_breaker import CircuitBreaker, HealthProber, CLOSED, OPEN, HALF_OPEN
+from load_balancer import LoadBalancer, build_balancers, parse_replicas
+from coalescing import CoalesceRule, SingleFlight, coalescing_key
+from middleware import GatewayMiddleware
+from admission import AdaptiveConcurrencyLimiter, VALIDATION, PURCHASE, AUTH, BROWSE, REPORTS
+from compression import CompressionMiddleware, negotiate, parse_accept_encoding, brotli, zstandard
+from edge_auth import EdgeAuthenticator, EdgeAuthError, TokenVerifier, ADMIN, AUTHENTICATED, PUBLIC
+from access_log import AccessLogger, DroppingQueueHandler, JsonFormatter, LoggingPipeline
+from aggregation import AggregationError, compose_my_tickets
+from batch import BatchError, batch_cost, encode_body, parse_batch
+from metrics import MetricsMiddleware, MultiprocessMetrics, Registry, merge_snapshots
+import deadline
+from deadline import DeadlineMiddleware
+import server
+from tracing import BatchSpanProcessor, FileSpanExporter, Tracer, TracingMiddleware, parse_traceparent
+from retry import HedgingPolicy, RetryBudget, RetryPolicy
+from routes import Route, RouteTable, gateway_routes
+from waiting_room import (
+    MemoryQueueStore, QueueTokenSigner, RedisQueueStore, WaitingRoom, WaitingRoomError, coerce_offer_id,
+    parse_offer_rates,
+)
+
+# Tests pour la configuration des pools de connexions
+class TestPoolConfig:
+    def test_config_from_env(self, monkeypatch):
+        """Vérifie la lecture de la configuration d'un pool depuis l'environnement"""
+        monkeypatch.setenv("TICKETS_POOL_MAX_CONNECTIONS", "500")
+        monkeypatch.setenv("TICKETS_POOL_READ_TIMEOUT", "2.5")
+        monkeypatch.setenv("TICKETS_POOL_HTTP2", "true")
+
+        config = PoolConfig.from_env("tickets")
+
+        assert config.max_connections == 500
+        assert config.read_timeout == 2.5
+        assert config.http2 is True
+        assert PoolConfig.from_env("auth").max_connections == PoolConfig().max_connections
+
+    def test_client_limits(self):
+        """Vérifie que le client du pool applique les limites configurées"""
+        pool = ServicePool("tickets", PoolConfig(max_connections=7, read_timeout=3))
+        client = pool.build_client()
+
+        assert client.timeout.read == 3
+        assert pool.stats()["max_connections"] == 7
+
+    def test_idle_connections_of_the_network_pool(self):
+        """Vérifie la lecture des connexions inactives, et l'état inconnu sans pool httpcore"""
+        pool = ServicePool("tickets")
+        assert pool.stats()["idle"] == 0
+
+        pool.open()
+        assert pool.stats()["idle"] == 0
+
+        pool.client = pool.build_client(httpx.MockTransport(lambda request: httpx.Response(200)))
+        assert pool.stats()["idle"] is None
+
+    def test_build_pools(self):
+        """Vérifie la création d'un pool par service"""
+        pools = build_pools({"auth": "http://auth", "tickets": "http://tickets"})
+        assert set(pools) == {"auth", "tickets"}
+        assert pools["auth"].client is None
+
+# Tests pour le cache de réponses
+class TestResponseCache:
+    def test_expired_entry_with_etag_is_kept_for_revalidation(self, monkeypatch):
+        """Vérifie qu'une entrée expirée portant un ETag reste disponible pour revalidation"""
+        cache = ResponseCache()
+        key = cache.make_key("tickets", "/offers/", [])
+        cache.set(key, 200, {"etag": '"v1"'}, b"[]", ttl=10)
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+
+        assert cache.get(key) is None
+        stale = cache.get_stale(key)
+        assert stale.body == b"[]"
+
+        cache.revalidate(key, stale, ttl=10)
+        assert cache.get(key) is stale
+        assert cache.stats()["revalidations"] == 1
+
+    def test_etag_matches(self):
+        """Vérifie la comparaison faible des ETag"""
+        assert etag_matches('"v1"', '"v1"')
+        assert etag_matches('W/"v1", "v2"', '"v1"')
+        assert etag_matches("*", '"v1"')
+        assert not etag_matches('"v2"', '"v1"')
+        assert not etag_matches(None, '"v1"')
+
+    def test_expiration(self, monkeypatch):
+        """Vérifie qu'une entrée expirée n'est plus servie"""
+        cache = ResponseCache()
+        key = cache.make_key("tickets", "/offers/", [])
+        cache.set(key, 200, {}, b"[]", ttl=10)
+        assert cache.get(key) is not None
+
+        real_monotonic = time.monotonic
+        monkeypatch.setattr(time, "monotonic", lambda: real_monotonic() + 11)
+        assert cache.get(key) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_lru_eviction(self):
+        """Vérifie l'éviction de l'entrée la moins récemment utilisée"""
+        cache = ResponseCache(max_entries=2)
+        keys = [cache.make_key("tickets", f"/offers/{i}", []) for i in range(3)]
+        cache.set(keys[0], 200, {}, b"0", ttl=60)
+        cache.set(keys[1], 200, {}, b"1", ttl=60)
+        cache.get(keys[0])
+        cache.set(keys[2], 200, {}, b"2", ttl=60)
+
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate_after_write(self):
+        """Vérifie l'invalidation des offres après une écriture de l'administration"""
+        cache = ResponseCache()
+        cache.set(cache.make_key("tickets", "/offers/", []), 200, {}, b"[]", ttl=60)
+        cache.set(cache.make_key("tickets", "/tickets/1", []), 200, {}, b"{}", ttl=60)
+
+        assert invalidate_after_write(cache, "admin", "/offers/3") == 1
+        assert cache.stats()["entries"] == 1
+
+# Tests pour le regroupement des requêtes simultanées
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        """Vérifie que des appels simultanés de même clé n'exécutent le travail qu'une fois"""
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "offers"
+
+        async def scenario():
+            return await asyncio.gather(*[flight.do("key", fetch) for _ in range(50)])
+
+        results = asyncio.run(scenario())
+
+        assert results == ["offers"] * 50
+        assert len(calls) == 1
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 49}
+
+    def test_errors_are_shared(self):
+        """Vérifie que l'erreur du premier appel est transmise à tous les appelants"""
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        async def scenario():
+            return await asyncio.gather(
+                *[flight.do("key", fetch) for _ in range(3)], return_exceptions=True
+            )
+
+        results = asyncio.run(scenario())
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.stats()["leaders"] == 1
+
+    def test_sequential_calls_are_not_coalesced(self):
+        """Vérifie qu'un appel terminé n'est pas réutilisé"""
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            return len(calls)
+
+        async def scenario():
+            first = await flight.do("key", fetch)
+            await asyncio.sleep(0)
+            second = await flight.do("key", fetch)
+            return first, second
+
+        assert asyncio.run(scenario()) == (1, 2)
+
+    def test_coalescing_key_scope(self):
+        """Vérifie la portée d'authentification de la clé de regroupement"""
+        public = CoalesceRule("tickets", "/offers", public=True)
+        private = CoalesceRule("tickets", "/tickets", public=False)
+
+        assert coalescing_key(public, "GET", "/offers/", [("limit", "10")], "Bearer a") == \
+            coalescing_key(public, "GET", "/offers/", [("limit", "10")], "Bearer b")
+        assert coalescing_key(private, "GET", "/tickets/user/1", [], "Bearer a") != \
+            coalescing_key(private, "GET", "/tickets/user/1", [], "Bearer b")
+        assert "Bearer a" not in coalescing_key(private, "GET", "/tickets/user/1", [], "Bearer a")
+
+# Tests pour le disjoncteur
+class TestCircuitBreaker:
+    def test_opens_on_failure_rate(self):
+        """Vérifie l'ouverture lorsque le taux d'échec dépasse le seuil"""
+        breaker = CircuitBreaker("tickets", failure_rate_threshold=0.5, minimum_calls=4)
+        breaker.record_success(0.01)
+        breaker.record_failure()
+        breaker.record_success(0.01)
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        assert breaker.allow_request() is False
+        assert breaker.snapshot()["rejected"] == 1
+
+    def test_slow_calls_count_as_failures(self):
+        """Vérifie que les appels trop lents sont pris en compte"""
+        breaker = CircuitBreaker("tickets", slow_call_duration=1.0, minimum_calls=2)
+        breaker.record_success(1.5)
+        breaker.record_success(2.0)
+
+        assert breaker.state == OPEN
+
+    def test_half_open_recovery(self, monkeypatch):
+        """Vérifie le passage en semi-ouvert puis la refermeture après des essais réussis"""
+        breaker = CircuitBreaker("tickets", open_duration=10, half_open_max_calls=2)
+        breaker.record_probe(False)
+        assert breaker.retry_after() > 0
+
+        real_monotonic = time.monotonic
+        monkeypatch.setattr(time, "monotonic", lambda: real_monotonic() + 11)
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request() and breaker.allow_request()
+        assert breaker.allow_request() is False
+        breaker.record_success(0.01)
+        breaker.record_success(0.01)
+
+        assert breaker.state == CLOSED
+
+    def test_half_open_failure_reopens(self):
+        """Vérifie qu'un échec en semi-ouvert rouvre le disjoncteur"""
+        breaker = CircuitBreaker("tickets")
+        breaker.record_probe(False)
+        breaker.record_probe(True)
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+
+    def test_released_trial_is_available_again(self):
+        """Vérifie qu'une requête d'essai rendue sans résultat peut être réutilisée"""
+        breaker = CircuitBreaker("tickets", half_open_max_calls=1)
+        breaker.record_probe(False)
+        breaker.record_probe(True)
+        assert breaker.allow_request()
+        assert breaker.allow_request() is False
+
+        breaker.release()
+
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request()
+
+    def test_healthy_probe_frees_half_open_trials(self):
+        """Vérifie qu'une sonde réussie rend les requêtes d'essai restées réservées"""
+        breaker = CircuitBreaker("tickets", half_open_max_calls=2)
+        breaker.record_probe(False)
+        breaker.record_probe(True)
+        assert breaker.allow_request() and breaker.allow_request()
+
+        breaker.record_probe(True)
+
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow_request()
+
+    def test_prober_updates_breakers(self):
+        """Vérifie que la sonde active ouvre le disjoncteur d'un service injoignable"""
+        def handler(request):
+            if request.url.host == "down":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200, json={"status": "healthy"})
+
+        endpoints = {"up": ["http://up"], "down": ["http://down"], "mixed": ["http://up", "http://down"]}
+        pools = build_pools(endpoints)
+        for pool in pools.values():
+            pool.client = pool.build_client(transport=httpx.MockTransport(handler))
+        breakers = {name: CircuitBreaker(name) for name in pools}
+        balancers = build_balancers(endpoints)
+
+        asyncio.run(HealthProber(pools, breakers, balancers).probe_all())
+
+        assert breakers["up"].state == CLOSED
+        assert breakers["down"].state == OPEN
+        assert breakers["mixed"].state == CLOSED
+        assert balancers["mixed"].healthy_count() == 1
+
+# Tests pour la répartition de charge
+class TestLoadBalancer:
+    def test_parse_replicas(self):
+        """Vérifie la lecture d'une liste d'instances"""
+        assert parse_replicas("http://a:8001/, http://b:8001") == ["http://a:8001", "http://b:8001"]
+        assert parse_replicas("http://a:8001") == ["http://a:8001"]
+
+    def test_round_robin(self):
+        """Vérifie la sélection à tour de rôle"""
+        balancer = LoadBalancer("tickets", ["http://a", "http://b", "http://c"])
+        assert [balancer.choose().url for _ in range(4)] == ["http://a", "http://b", "http://c", "http://a"]
+
+    def test_least_outstanding(self):
+        """Vérifie la sélection de l'instance la moins chargée"""
+        balancer = LoadBalancer("tickets", ["http://a", "http://b"], strategy="least_outstanding")
+        first = balancer.choose()
+        balancer.acquire(first)
+        second = balancer.choose()
+
+        assert first.url == "http://a"
+        assert second.url == "http://b"
+
+    def test_power_of_two_prefers_less_loaded(self):
+        """Vérifie que la stratégie des deux choix évite l'instance surchargée"""
+        balancer = LoadBalancer("tickets", ["http://a", "http://b"], strategy="power_of_two")
+        for _ in range(10):
+            balancer.acquire(balancer.replicas[0])
+
+        assert all(balancer.choose().url == "http://b" for _ in range(20))
+
+    def test_ejection_and_restore(self):
+        """Vérifie l'éjection après des échecs consécutifs puis le rétablissement"""
+        balancer = LoadBalancer("tickets", ["http://a", "http://b"], eject_after=2)
+        replica = balancer.replicas[0]
+        balancer.record(replica, False)
+        assert balancer.healthy_count() == 2
+        balancer.record(replica, False)
+
+        assert balancer.healthy_count() == 1
+        assert all(balancer.choose().url == "http://b" for _ in range(4))
+        balancer.restore(replica)
+        assert balancer.healthy_count() == 2
+
+    def test_all_ejected_falls_back_to_all(self):
+        """Vérifie que toutes les instances restent utilisables si toutes sont éjectées"""
+        balancer = LoadBalancer("tickets", ["http://a"])
+        balancer.eject(balancer.replicas[0])
+        assert balancer.choose().url == "http://a"
+
+    def test_unknown_strategy(self):
+        """Vérifie le rejet d'une stratégie inconnue"""
+        with pytest.raises(ValueError):
+            LoadBalancer("tickets", ["http://a"], strategy="random")
+
+# Tests pour les limiteurs de taux
+class TestRateLimiters:
+    @pytest.mark.parametrize("limiter_class", [RateLimiter, GCRARateLimiter])
+    def test_burst_then_deny(self, limiter_class):
+        """Vérifie qu'une rafale est autorisée jusqu'à la limite puis refusée"""
+        limiter = limiter_class(max_requests=5, window_size=60)
+
+        results = [limiter.is_allowed("1.2.3.4") for _ in range(6)]
+
+        assert [allowed for allowed, _ in results] == [True] * 5 + [False]
+        assert results[-1][1] > 0
+        assert limiter.get_remaining_requests("1.2.3.4") == 0
+        assert limiter.get_remaining_requests("5.6.7.8") == 5
+
+    def test_gcra_refills_progressively(self, monkeypatch):
+        """Vérifie que GCRA rend une requête par intervalle d'émission"""
+        limiter = GCRARateLimiter(max_requests=6, window_size=60)
+        now = 1000.0
+        monkeypatch.setattr(time, "time", lambda: now)
+        for _ in range(6):
+            limiter.is_allowed("ip")
+
+        allowed, wait_time = limiter.is_allowed("ip")
+        assert not allowed
+        assert wait_time == 10
+
+        now += 10
+        assert limiter.get_remaining_requests("ip") == 1
+        assert limiter.is_allowed("ip") == (True, 0)
+        assert limiter.is_allowed("ip")[0] is False
+
+    def test_gcra_keeps_one_number_per_key(self):
+        """Vérifie que GCRA ne conserve qu'une valeur par adresse IP"""
+        limiter = GCRARateLimiter(max_requests=200, window_size=60)
+        for _ in range(200):
+            limiter.is_allowed("ip")
+        limiter.get_remaining_requests("unknown")
+
+        assert isinstance(limiter.tats["ip"], float)
+        assert "unknown" not in limiter.tats
+
+    @pytest.mark.parametrize("limiter_class", [RateLimiter, GCRARateLimiter])
+    def test_weighted_check(self, limiter_class):
+        """Vérifie qu'une requête peut décompter plusieurs unités du quota"""
+        limiter = limiter_class(max_requests=5, window_size=60)
+
+        first = asyncio.run(limiter.check("ip", cost=3))
+        second = asyncio.run(limiter.check("ip", cost=3))
+
+        assert first == (True, 0, 2)
+        assert second[0] is False and second[1] > 0
+        assert asyncio.run(limiter.check("ip", cost=2))[0] is True
+
+    def test_create_limiter(self):
+        """Vérifie le choix de l'algorithme"""
+        assert isinstance(create_limiter(10, 60, "gcra"), GCRARateLimiter)
+        assert isinstance(create_limiter(10, 60), RateLimiter)
+        with pytest.raises(ValueError):
+            create_limiter(10, 60, "leaky")
+
+# Tests pour la mémoire bornée des limiteurs de taux
+class TestRateLimiterEviction:
+    @pytest.mark.parametrize("limiter_class", [RateLimiter, GCRARateLimiter])
+    def test_unknown_ip_is_not_tracked(self, limiter_class):
+        """Vérifie que la consultation du quota n'enregistre pas d'adresse inconnue"""
+        limiter = limiter_class(max_requests=10, window_size=60)
+
+        assert limiter.get_remaining_requests("9.9.9.9") == 10
+        assert limiter.tracked_keys() == 0
+
+    @pytest.mark.parametrize("limiter_class", [RateLimiter, GCRARateLimiter])
+    def test_idle_keys_are_swept(self, limiter_class, monkeypatch):
+        """Vérifie l'éviction des adresses inactives depuis plus d'une fenêtre"""
+        limiter = limiter_class(max_requests=10, window_size=60)
+        now = 1000.0
+        monkeypatch.setattr(time, "time", lambda: now)
+        limiter.is_allowed("old")
+        now += 30
+        for _ in range(10):
+            limiter.is_allowed("recent")
+
+        now += 40
+        assert limiter.sweep() == 1
+        assert limiter.tracked_keys() == 1
+        assert "recent" in limiter.entries
+        assert limiter.stats()["evicted_idle"] == 1
+
+    @pytest.mark.parametrize("limiter_class", [RateLimiter, GCRARateLimiter])
+    def test_hard_key_cap(self, limiter_class):
+        """Vérifie que le nombre d'adresses suivies ne dépasse pas le plafond"""
+        limiter = limiter_class(max_requests=10, window_size=60, max_keys=100)
+
+        for i in range(1000):
+            limiter.is_allowed(f"10.0.{i // 256}.{i % 256}")
+
+        assert limiter.tracked_keys() == 100
+        assert limiter.stats()["evicted_capacity"] == 900
+        assert "10.0.3.231" in limiter.entries  # la dernière adresse est conservée
+
+    def test_rejected_requests_keep_the_key_order(self, monkeypatch):
+        """Vérifie qu'une requête refusée n'enregistre pas d'adresse inconnue ni ne change le rang de l'adresse"""
+        limiter = RateLimiter(max_requests=2, window_size=60, max_keys=2)
+        now = 1000.0
+        monkeypatch.setattr(time, "time", lambda: now)
+        limiter.is_allowed("first", cost=2)
+        now += 10
+        limiter.is_allowed("second")
+
+        assert limiter.is_allowed("first")[0] is False
+        assert limiter.is_allowed("new", cost=3)[0] is False
+        assert list(limiter.entries) == ["first", "second"]
+        assert limiter.entries["first"] == [1000.0, 1000.0]
+
+    def test_key_state_requires_idle_check(self):
+        """Vérifie qu'un état par adresse doit définir son critère d'inactivité"""
+        with pytest.raises(TypeError):
+            BoundedKeyState()
+
+    def test_periodic_sweeper(self, monkeypatch):
+        """Vérifie que le nettoyage périodique libère les adresses inactives"""
+        limiter = GCRARateLimiter(max_requests=10, window_size=1)
+        limiter.is_allowed("ip")
+
+        async def scenario():
+            task = asyncio.ensure_future(sweep_periodically([limiter], 0.01))
+            await asyncio.sleep(0.15)
+            task.cancel()
+
+        real_time = time.time
+        monkeypatch.setattr(time, "time", lambda: real_time() + 5)
+        asyncio.run(scenario())
+
+        assert limiter.tracked_keys() == 0
+
+# Tests pour les backends partagés de limitation de taux
+def _count_allowed_in_child(path, queue):
+    backend = SharedMemoryBackend(path=path, slots=64)
+    limiter = SharedRateLimiter(10, 60, backend, prefix="api")
+    results = [asyncio.run(limiter.check("1.2.3.4")) for _ in range(10)]
+    queue.put(sum(1 for allowed, _, _ in results if allowed))
+
+def _hold_lock_in_child(path, locked, release):
+    import fcntl
+    fd = os.open(path, os.O_RDWR)
+    fcntl.lockf(fd, fcntl.LOCK_EX)
+    locked.set()
+    release.wait(10)
+    os.close(fd)
+
+class TestSharedRateLimiters:
+    def test_in_process_check(self):
+        """Vérifie que check renvoie la décision et le quota restant en un appel"""
+        limiter = GCRARateLimiter(max_requests=3, window_size=60)
+        results = [asyncio.run(limiter.check("ip")) for _ in range(4)]
+
+        assert results[:3] == [(True, 0, 2), (True, 0, 1), (True, 0, 0)]
+        assert results[3][0] is False
+
+    def test_shared_memory_is_shared_between_workers(self, tmp_path):
+        """Vérifie que deux workers d'un même hôte partagent la même limite"""
+        import multiprocessing
+        path = str(tmp_path / "ratelimit")
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        workers = [context.Process(target=_count_allowed_in_child, args=(path, queue)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(10)
+
+        assert queue.get() + queue.get() == 10
+
+    def test_shared_memory_lock_does_not_block_the_loop(self, tmp_path):
+        """Vérifie qu'un paquet verrouillé par un autre worker est attendu sans bloquer la boucle d'événements"""
+        import multiprocessing
+        backend = SharedMemoryBackend(path=str(tmp_path / "ratelimit"), slots=16, lock_timeout=5)
+        context = multiprocessing.get_context("fork")
+        locked, release = context.Event(), context.Event()
+        holder = context.Process(target=_hold_lock_in_child, args=(backend.path, locked, release))
+        holder.start()
+        locked.wait(10)
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.005)
+
+            ticking = asyncio.ensure_future(ticker())
+            check = asyncio.ensure_future(backend.check("api:1.2.3.4", 6, 60))
+            await asyncio.sleep(0.1)
+            waiting = not check.done()
+            release.set()
+            result = await check
+            ticking.cancel()
+            return waiting, ticks, result
+
+        waiting, ticks, result = asyncio.run(scenario())
+        holder.join(10)
+
+        assert waiting and ticks >= 5
+        assert result == (True, 0, 9)
+
+    def test_shared_memory_lock_timeout_fails_open(self, tmp_path):
+        """Vérifie qu'un paquet verrouillé trop longtemps laisse passer la requête"""
+        import multiprocessing
+        backend = SharedMemoryBackend(path=str(tmp_path / "ratelimit"), slots=16, lock_timeout=0.02)
+        limiter = SharedRateLimiter(10, 60, backend, prefix="api")
+        context = multiprocessing.get_context("fork")
+        locked, release = context.Event(), context.Event()
+        holder = context.Process(target=_hold_lock_in_child, args=(backend.path, locked, release))
+        holder.start()
+        locked.wait(10)
+        try:
+            result = asyncio.run(limiter.check("1.2.3.4"))
+        finally:
+            release.set()
+            holder.join(10)
+
+        assert result == (True, 0, 10)
+        assert limiter.stats()["backend_errors"] == 1
+
+    def test_shared_memory_is_bounded(self, tmp_path):
+        """Vérifie que la table partagée garde une taille fixe"""
+        backend = SharedMemoryBackend(path=str(tmp_path / "ratelimit"), slots=16)
+        limiter = SharedRateLimiter(10, 60, backend, prefix="api")
+        for i in range(500):
+            asyncio.run(limiter.check(f"10.0.0.{i}"))
+
+        assert os.path.getsize(backend.path) == 16 * backend.SLOT.size
+        assert limiter.stats()["tracked_keys"] <= 16
+
+    @pytest.mark.skipif(aioredis is None, reason="redis package not installed")
+    def test_redis_backend_batches_concurrent_checks(self, redis_server):
+        """Vérifie que les vérifications simultanées partagent un aller-retour Redis"""
+        async def scenario():
+            backend = RedisBackend(redis_server.url)
+            limiter = SharedRateLimiter(10, 60, backend, prefix="api")
+            results = await asyncio.gather(*[limiter.check("1.2.3.4") for _ in range(100)])
+            await backend.close()
+            return backend, results
+
+        backend, results = asyncio.run(scenario())
+
+        assert sum(1 for allowed, _, _ in results if allowed) == 10
+        assert all(wait > 0 for allowed, wait, _ in results if not allowed)
+        assert backend.round_trips == 1
+        assert backend.checks == 100
+
+    @pytest.mark.skipif(aioredis is None, reason="redis package not installed")
+    def test_redis_limit_is_global_across_instances(self, redis_server):
+        """Vérifie que deux instances de l'API Gateway partagent la même limite"""
+        async def scenario():
+            gateways = [SharedRateLimiter(5, 60, RedisBackend(redis_server.url), prefix="auth") for _ in range(2)]
+            results = []
+            for _ in range(5):
+                for limiter in gateways:
+                    results.append(await limiter.check("1.2.3.4"))
+            for limiter in gateways:
+                await limiter.backend.close()
+            return results
+
+        results = asyncio.run(scenario())
+
+        assert [allowed for allowed, _, _ in results] == [True] * 5 + [False] * 5
+
+    @pytest.mark.skipif(aioredis is None, reason="redis package not installed")
+    def test_redis_close_completes_pending_checks(self, redis_server):
+        """Vérifie que la fermeture du backend attend l'envoi du lot en cours"""
+        async def scenario():
+            backend = RedisBackend(redis_server.url)
+            check = asyncio.ensure_future(backend.check("api:1.2.3.4", 6, 60))
+            await asyncio.sleep(0)
+            pending = len(backend.flushes)
+            await backend.close()
+            return pending, backend, await check
+
+        pending, backend, result = asyncio.run(scenario())
+
+        assert pending == 1
+        assert not backend.flushes
+        assert result == (True, 0, 9)
+
+    @pytest.mark.skipif(aioredis is None, reason="redis package not installed")
+    def test_redis_unavailable_fails_open(self):
+        """Vérifie qu'une indisponibilité de Redis n'empêche pas les requêtes"""
+        async def scenario():
+            limiter = SharedRateLimiter(5, 60, RedisBackend("redis://127.0.0.1:1/0"), prefix="api")
+            result = await limiter.check("1.2.3.4")
+            await limiter.backend.close()
+            return limiter, result
+
+        limiter, result = asyncio.run(scenario())
+
+        assert result == (True, 0, 5)
+        assert limiter.stats()["backend_errors"] == 1
+
+# Tests pour le middleware ASGI de l'API Gateway
+async def _echo_app(scope, receive, send):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/plain"), (b"x-frame-options", b"SAMEORIGIN")],
+    })
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def _middleware_client(auth_requests=2, api_requests=5):
+    from fastapi.testclient import TestClient
+    middleware = GatewayMiddleware(
+        _echo_app,
+        auth_limiter=GCRARateLimiter(max_requests=auth_requests, window_size=60),
+        api_limiter=GCRARateLimiter(max_requests=api_requests, window_size=60),
+        routes=gateway_routes,
+    )
+    return TestClient(middleware)
+
+class TestGatewayMiddleware:
+    def test_adds_security_and_rate_limit_headers(self):
+        """Vérifie l'ajout des en-têtes de sécurité et de limitation en un passage"""
+        response = _middleware_client().get("/tickets/offers")
+
+        assert response.status_code == 200
+        assert response.text == "ok"
+        assert response.headers["x-content-type-options"] == "nosniff"
+        assert response.headers["x-ratelimit-limit"] == "5"
+        assert response.headers["x-ratelimit-remaining"] == "4"
+        assert response.headers["x-ratelimit-reset"] == "60"
+
+    def test_security_headers_override_upstream(self):
+        """Vérifie que les en-têtes de sécurité remplacent ceux de la réponse"""
+        response = _middleware_client().get("/tickets/offers")
+
+        assert response.headers.get_list("x-frame-options") == ["DENY"]
+
+    def test_auth_limit_rejects_with_retry_after(self):
+        """Vérifie le rejet des tentatives d'authentification au-delà de la limite"""
+        client = _middleware_client(auth_requests=2)
+        statuses = [client.post("/auth/token").status_code for _ in range(3)]
+        rejected = client.post("/auth/token")
+
+        assert statuses == [200, 200, 429]
+        assert rejected.status_code == 429
+        assert int(rejected.headers["retry-after"]) > 0
+        assert rejected.headers["x-content-type-options"] == "nosniff"
+        assert "Trop de tentatives de connexion" in rejected.json()["detail"]
+        # Les autres routes utilisent leur propre limite
+        assert client.get("/tickets/offers").status_code == 200
+
+    def test_access_log(self, caplog):
+        """Vérifie qu'une seule ligne de journal est écrite par requête"""
+        with caplog.at_level("INFO", logger="api-gateway"):
+            _middleware_client().get("/tickets/offers")
+
+        records = [record.getMessage() for record in caplog.records if record.name == "api-gateway"]
+        assert len(records) == 1
+        assert records[0].startswith("GET /tickets/offers 200 ")
+
+# Tests pour la journalisation non bloquante
+def _isolated_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+class TestAccessLog:
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Vérifie qu'une file pleine abandonne les enregistrements et les compte"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        logger = _isolated_logger("test-access-drop", handler)
+
+        for i in range(5):
+            logger.info("record %s", i)
+
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_pipeline_writes_json_access_records(self):
+        """Vérifie que le thread d'écriture produit des lignes JSON structurées"""
+        output = io.StringIO()
+        stream = logging.StreamHandler(output)
+        stream.setFormatter(JsonFormatter())
+        handler = DroppingQueueHandler(queue.Queue(maxsize=100))
+        logger = _isolated_logger("test-access-json", handler)
+        pipeline = LoggingPipeline(
+            handler, logging.handlers.QueueListener(handler.queue, stream), AccessLogger(logger)
+        )
+        pipeline.start()
+
+        pipeline.access_logger.log("GET", "/tickets/offers", 200, 0.0123, "1.2.3.4")
+        pipeline.stop()
+
+        record = json.loads(output.getvalue().strip())
+        assert record["message"] == "GET /tickets/offers 200 12.3ms"
+        assert record["status"] == 200
+        assert record["duration_ms"] == 12.3
+        assert record["client"] == "1.2.3.4"
+        assert record["level"] == "INFO"
+
+    def test_successful_requests_are_sampled(self):
+        """Vérifie que seules les requêtes réussies sont échantillonnées"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=100))
+        access_logger = AccessLogger(_isolated_logger("test-access-sampling", handler), sample_rate=0.0)
+
+        for _ in range(10):
+            access_logger.log("GET", "/tickets/offers", 200, 0.001)
+        access_logger.log("GET", "/tickets/offers", 502, 0.001)
+        access_logger.log("POST", "/auth/token", 429, 0.001)
+
+        assert access_logger.sampled_out == 10
+        assert [handler.queue.get_nowait().access["status"] for _ in range(2)] == [502, 429]
+
+# Tests pour la vérification des tokens à l'entrée
+class TestEdgeAuth:
+    def _token(self, secret="secret", **claims):
+        from jose import jwt
+        claims.setdefault("sub", "user@example.com")
+        claims.setdefault("exp", int(time.time()) + 60)
+        return jwt.encode(claims, secret, algorithm="HS256")
+
+    def test_cache_is_bounded(self):
+        """Vérifie que le cache des tokens vérifiés est borné (LRU)"""
+        verifier = TokenVerifier("secret", max_entries=2)
+        tokens = [self._token(sub=f"user{i}@example.com") for i in range(3)]
+        for token in tokens:
+            verifier.verify(token)
+
+        assert len(verifier.entries) == 2
+        assert tokens[0] not in verifier.entries
+
+    def test_cached_token_expires(self, monkeypatch):
+        """Vérifie qu'un token en cache n'est plus servi par le cache après son expiration"""
+        verifier = TokenVerifier("secret")
+        token = self._token(exp=int(time.time()) + 5)
+        verifier.verify(token)
+        verifier.verify(token)
+        assert (verifier.hits, verifier.misses) == (1, 1)
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 10)
+        verifier.verify(token)
+
+        assert (verifier.hits, verifier.misses) == (1, 2)
+
+    def test_wrong_key_is_rejected(self):
+        """Vérifie le rejet d'un token signé avec une autre clé"""
+        verifier = TokenVerifier("secret")
+
+        assert verifier.verify(self._token(secret="other")) is None
+        assert verifier.rejected == 1
+
+    def test_check_access_levels(self):
+        """Vérifie le contrôle d'une requête selon le niveau d'accès de sa route"""
+        authenticator = EdgeAuthenticator(TokenVerifier("secret"))
+
+        assert authenticator.check(PUBLIC, None) is None
+        with pytest.raises(EdgeAuthError) as error:
+            authenticator.check(AUTHENTICATED, None)
+        assert error.value.status_code == 401
+        identity = authenticator.check(AUTHENTICATED, f"Bearer {self._token()}")
+        assert identity.subject == "user@example.com"
+        with pytest.raises(EdgeAuthError) as error:
+            authenticator.check(ADMIN, f"Bearer {self._token()}")
+        assert error.value.status_code == 403
+
+    def test_disabled(self):
+        """Vérifie qu'aucune requête n'est rejetée lorsque le contrôle est désactivé"""
+        authenticator = EdgeAuthenticator(TokenVerifier("secret"), enabled=False)
+
+        assert authenticator.check(ADMIN, None) is None
+
+# Tests pour la compression des réponses
+def _compression_client(chunks, headers, minimum_size=100):
+    from fastapi.testclient import TestClient
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    return TestClient(CompressionMiddleware(app, minimum_size=minimum_size))
+
+JSON_HEADERS = [(b"content-type", b"application/json")]
+
+class TestCompression:
+    def test_parse_accept_encoding(self):
+        """Vérifie la lecture des poids de l'en-tête Accept-Encoding"""
+        assert parse_accept_encoding("gzip;q=0.5, br, zstd;q=0") == {"gzip": 0.5, "br": 1.0, "zstd": 0.0}
+
+    def test_negotiate(self):
+        """Vérifie le choix de l'encodage selon le client puis la préférence du serveur"""
+        encoders = ["zstd", "br", "gzip"]
+
+        assert negotiate("gzip, br", encoders) == "br"
+        assert negotiate("gzip;q=1.0, br;q=0.5", encoders) == "gzip"
+        assert negotiate("*", encoders) == "zstd"
+        assert negotiate("gzip;q=0", encoders) is None
+        assert negotiate("deflate", encoders) is None
+
+    def test_large_json_is_compressed(self):
+        """Vérifie la compression d'une réponse JSON au-delà du seuil"""
+        body = b'{"items": [' + b",".join(b'{"id": %d}' % i for i in range(200)) + b"]}"
+        client = _compression_client([body], JSON_HEADERS + [(b"content-length", str(len(body)).encode())])
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert int(response.headers["content-length"]) < len(body)
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == body
+
+    def test_small_or_binary_bodies_are_not_compressed(self):
+        """Vérifie que les petites réponses et les contenus binaires ne sont pas compressés"""
+        small = _compression_client([b'{"ok": true}'], JSON_HEADERS)
+        image = _compression_client([b"\x89PNG" * 100], [(b"content-type", b"image/png")])
+
+        assert "content-encoding" not in small.get("/", headers={"Accept-Encoding": "gzip"}).headers
+        assert "content-encoding" not in image.get("/", headers={"Accept-Encoding": "gzip"}).headers
+
+    def test_streamed_body_is_compressed_chunk_by_chunk(self):
+        """Vérifie la compression au fil de l'eau d'une réponse relayée en flux"""
+        chunks = [b'{"id": %d, "name": "Finale"}\n' % i * 10 for i in range(20)]
+        client = _compression_client(chunks, JSON_HEADERS)
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.content == b"".join(chunks)
+
+    def test_short_stream_is_sent_as_is(self):
+        """Vérifie qu'une réponse en flux restée sous le seuil est envoyée sans compression"""
+        client = _compression_client([b"[", b"1", b"]"], JSON_HEADERS)
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+        assert response.content == b"[1]"
+
+    def test_strong_etag_becomes_weak(self):
+        """Vérifie que l'ETag d'une réponse compressée devient faible"""
+        client = _compression_client([b"x" * 500], [(b"content-type", b"text/plain"), (b"etag", b'"abc"')])
+
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["etag"] == 'W/"abc"'
+
+    @pytest.mark.parametrize("encoding", ["br", "zstd"])
+    def test_brotli_and_zstd(self, encoding):
+        """Vérifie la compression brotli et zstd, en une fois et en flux"""
+        module = {"br": brotli, "zstd": zstandard}[encoding]
+        if module is None:
+            pytest.skip(f"{encoding} package not installed")
+        chunks = [b'{"id": %d, "name": "Finale"}\n' % i * 10 for i in range(20)]
+
+        for body_chunks in ([b"".join(chunks)], chunks):
+            client = _compression_client(body_chunks, JSON_HEADERS)
+            with client.stream("GET", "/", headers={"Accept-Encoding": encoding}) as response:
+                raw = b"".join(response.iter_raw())
+            assert response.headers["content-encoding"] == encoding
+            if encoding == "br":
+                decoded = brotli.decompress(raw)
+            else:
+                decoded = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+            assert decoded == b"".join(chunks)
+
+# Tests pour le contrôle d'admission par priorité
+class TestAdmission:
+    def test_route_priorities(self):
+        """Vérifie la classe de priorité attribuée à chaque route"""
+        assert gateway_routes.match("POST", "/validation/validate").priority == VALIDATION
+        assert gateway_routes.match("POST", "/tickets/tickets/").priority == PURCHASE
+        assert gateway_routes.match("GET", "/tickets/offers/").priority == BROWSE
+        assert gateway_routes.match("GET", "/admin/sales/").priority == REPORTS
+        assert gateway_routes.match("GET", "/health").priority is None
+
+    def test_low_priority_is_shed_first(self):
+        """Vérifie que la consultation est délestée avant la validation"""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=1)
+
+        browse = [limiter.try_acquire(BROWSE) for _ in range(10)]
+        validation = [limiter.try_acquire(VALIDATION) for _ in range(5)]
+
+        assert browse.count(True) == 7
+        assert validation.count(True) == 3
+        assert limiter.snapshot()["classes"]["browse"]["shed"] == 3
+
+    def test_limit_decreases_once_per_congestion_episode(self):
+        """Vérifie la réduction multiplicative de la limite en cas de latence élevée"""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=100, min_limit=1, backoff=0.5)
+        for _ in range(10):
+            limiter.record("tickets", 0.01)
+
+        limiter.record("tickets", 0.5)
+        # Appel lent commencé avant la réduction : même épisode de congestion
+        limiter.record("tickets", 0.5)
+
+        assert limiter.limit == pytest.approx(50, rel=0.01)
+
+    def test_failures_decrease_the_limit(self):
+        """Vérifie qu'une erreur du service réduit la limite"""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=100, min_limit=1, backoff=0.5)
+
+        limiter.record("tickets", 0.01, success=False)
+
+        assert limiter.limit == 50
+
+    def test_limit_grows_only_when_used(self):
+        """Vérifie l'augmentation additive de la limite lorsqu'elle est sollicitée"""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=1)
+        limiter.record("tickets", 0.01)
+        assert limiter.limit == 10
+
+        for _ in range(8):
+            limiter.try_acquire(VALIDATION)
+        for _ in range(10):
+            limiter.record("tickets", 0.01)
+
+        assert limiter.limit == pytest.approx(11, abs=0.1)
+
+    def test_middleware_sheds_with_retry_after(self):
+        """Vérifie le rejet 503 avec Retry-After des requêtes délestées"""
+        from fastapi.testclient import TestClient
+        admission = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=1)
+        middleware = GatewayMiddleware(
+            _echo_app,
+            auth_limiter=GCRARateLimiter(max_requests=100, window_size=60),
+            api_limiter=GCRARateLimiter(max_requests=100, window_size=60),
+            admission=admission,
+            routes=gateway_routes,
+        )
+        client = TestClient(middleware)
+        admission.in_flight = 8
+
+        shed = client.get("/admin/sales/")
+        admitted = client.post("/validation/validate")
+
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == str(1 + REPORTS)
+        assert admitted.status_code == 200
+        assert client.get("/health").status_code == 200
+        assert admission.in_flight == 8
+
+# Tests de la salle d'attente virtuelle
+class TestWaitingRoom:
+    def make_room(self, rate=1.0, burst=1.0):
+        return WaitingRoom(QueueTokenSigner("test-secret"), MemoryQueueStore(), {12: rate}, burst=burst)
+
+    def test_token_signature(self):
+        """Vérifie qu'un jeton falsifié ou expiré est refusé"""
+        signer = QueueTokenSigner("test-secret", ttl=60)
+        token = signer.issue(12, 3, "abcd")
+
+        assert signer.verify(token).sequence == 3
+        assert signer.verify(token.replace("12.3.", "12.0.", 1)) is None
+        assert QueueTokenSigner("other-secret").verify(token) is None
+        assert QueueTokenSigner("test-secret", ttl=-1).verify(token) is None
+        assert signer.verify("garbage") is None
+
+    def test_users_are_admitted_in_order(self):
+        """Vérifie l'ordre d'admission et la position dans la file"""
+        room = self.make_room(rate=0.001, burst=2.0)
+
+        async def scenario():
+            return [await room.join(12, f"user{i}@example.com") for i in range(5)]
+
+        joined = asyncio.run(scenario())
+
+        assert [status.admitted for _, status in joined] == [True, True, False, False, False]
+        assert [status.position for _, status in joined] == [0, 0, 1, 2, 3]
+
+    def test_join_is_idempotent(self):
+        """Vérifie qu'un utilisateur garde sa place en rejoignant la file une seconde fois"""
+        room = self.make_room(rate=0.001)
+
+        async def scenario():
+            await room.join(12, "first@example.com")
+            await room.join(12, "second@example.com")
+            return await room.join(12, "second@example.com")
+
+        _, status = asyncio.run(scenario())
+
+        assert status.position == 1
+        assert room.store.queues[12].issued == 2
+
+    def test_frontier_advances_with_time(self, monkeypatch):
+        """Vérifie que le front d'admission avance au débit de l'offre"""
+        room = self.make_room(rate=2.0, burst=0.0)
+        now = [1000.0]
+        monkeypatch.setattr("waiting_room.time.monotonic", lambda: now[0])
+
+        async def scenario():
+            token, first = await room.join(12, "user@example.com")
+            now[0] += 0.6
+            return first, await room.status(12, token)
+
+        first, later = asyncio.run(scenario())
+
+        assert not first.admitted
+        assert first.estimated_wait == 1
+        assert later.admitted
+
+    def test_purchase_checks(self):
+        """Vérifie le contrôle des achats : jeton requis, lié à l'utilisateur et admis"""
+        room = self.make_room(rate=0.001, burst=1.0)
+
+        async def scenario():
+            admitted, _ = await room.join(12, "first@example.com")
+            waiting, _ = await room.join(12, "second@example.com")
+            errors = []
+            for member, token in (("first@example.com", None), ("other@example.com", admitted),
+                                  ("second@example.com", waiting)):
+                try:
+                    await room.check_purchase(12, member, token)
+                except WaitingRoomError as e:
+                    errors.append(e.status_code)
+            await room.check_purchase(12, "first@example.com", admitted)
+            await room.check_purchase(99, "anyone@example.com", None)
+            return errors
+
+        assert asyncio.run(scenario()) == [403, 403, 429]
+        assert room.rejected == 3
+
+    def test_admitted_token_is_used_once(self):
+        """Vérifie qu'un jeton admis n'est réservé qu'une fois, sauf s'il est libéré"""
+        room = self.make_room(rate=0.001, burst=1.0)
+
+        async def scenario():
+            token, _ = await room.join(12, "first@example.com")
+            claimed = await room.check_purchase(12, "first@example.com", token)
+            try:
+                await room.check_purchase(12, "first@example.com", token)
+            except WaitingRoomError as e:
+                replayed = e.status_code
+            await room.release(claimed)
+            return claimed, replayed, await room.check_purchase(12, "first@example.com", token)
+
+        claimed, replayed, reclaimed = asyncio.run(scenario())
+
+        assert claimed.sequence == 0 and replayed == 403
+        assert reclaimed == claimed
+
+    def test_expired_members_are_pruned(self, monkeypatch):
+        """Vérifie que les utilisateurs dont le jeton a expiré sont oubliés"""
+        room = WaitingRoom(QueueTokenSigner("test-secret"), MemoryQueueStore(ttl=60), {12: 0.001}, burst=1.0)
+        now = [1000.0]
+        monkeypatch.setattr("waiting_room.time.monotonic", lambda: now[0])
+
+        async def scenario():
+            token, _ = await room.join(12, "first@example.com")
+            await room.check_purchase(12, "first@example.com", token)
+            await room.join(12, "second@example.com")
+            now[0] += 45
+            await room.join(12, "second@example.com")
+            now[0] += 30
+            await room.join(12, "third@example.com")
+
+        asyncio.run(scenario())
+        queue = room.store.queues[12]
+
+        assert [sequence for sequence, _ in queue.members.values()] == [1, 2]
+        assert queue.used == set()
+
+    def test_coerce_offer_id(self):
+        """Vérifie la conversion de l'offre d'un achat, alignée sur la validation du service"""
+        assert [coerce_offer_id(value) for value in (12, "12", " 12 ", 12.0, "12.0")] == [12] * 5
+        for value in (12.5, "12.5", "douze", [12], {"id": 12}):
+            with pytest.raises(ValueError):
+                coerce_offer_id(value)
+
+    @pytest.mark.skipif(aioredis is None, reason="redis package not installed")
+    def test_redis_store(self, redis_server):
+        """Vérifie les scripts de la file partagée par Redis : ordre, front d'admission et réservation"""
+        async def scenario():
+            store = RedisQueueStore(redis_server.url, ttl=60)
+            room = WaitingRoom(QueueTokenSigner("test-secret"), store, {12: 0.001}, burst=2.0)
+            joined = [await room.join(12, f"user{i}@example.com") for i in range(3)]
+            _, rejoined = await room.join(12, "user2@example.com")
+            token = joined[0][0]
+            claimed = await room.check_purchase(12, "user0@example.com", token)
+            try:
+                await room.check_purchase(12, "user0@example.com", token)
+            except WaitingRoomError as e:
+                replayed = e.status_code
+            await room.release(claimed)
+            reclaimed = await room.check_purchase(12, "user0@example.com", token)
+            # Une file dont les clés ont expiré n'est pas recréée sans durée de conservation
+            await store.client.delete(*store._keys(12))
+            await room.status(12, token)
+            ttl = await store.client.ttl(store._keys(12)[1])
+            await store.close()
+            return [status for _, status in joined], rejoined, replayed, reclaimed, ttl
+
+        statuses, rejoined, replayed, reclaimed, ttl = asyncio.run(scenario())
+
+        assert [status.admitted for status in statuses] == [True, True, False]
+        assert rejoined.position == statuses[2].position == 1
+        assert replayed == 403
+        assert reclaimed.sequence == 0
+        assert 0 < ttl <= 60
+
+    def test_parse_offer_rates(self, monkeypatch):
+        """Vérifie la lecture de la liste des offres en salle d'attente"""
+        monkeypatch.setenv("WAITING_ROOM_DEFAULT_RATE", "5")
+
+        assert parse_offer_rates("12:50, 14") == {12: 50.0, 14: 5.0}
+        assert parse_offer_rates("") == {}
+
+# Tests des requêtes groupées
+class TestBatch:
+    def test_parse_batch(self):
+        """Vérifie l'analyse des sous-requêtes et de leur query string"""
+        body = json.dumps({"requests": [
+            {"path": "/tickets/offers/1"},
+            {"id": "mine", "method": "get", "path": "/tickets/tickets/user/1?limit=5", "headers": {"If-None-Match": "x"}},
+        ]})
+
+        first, second = parse_batch(body.encode(), max_requests=5, routes=gateway_routes)
+
+        assert (first.method, first.path, first.query) == ("GET", "/tickets/offers/1", "")
+        assert (second.id, second.path, second.query) == ("mine", "/tickets/tickets/user/1", "limit=5")
+        assert second.headers == {"if-none-match": "x"}
+
+    @pytest.mark.parametrize("payload", [
+        b"not json",
+        b'{"requests": []}',
+        b'{"requests": [{"method": "POST", "path": "/tickets/tickets/"}]}',
+        b'{"requests": [{"path": "/batch"}]}',
+        b'{"requests": [{"path": "tickets/offers"}]}',
+        b'{"requests": [{"path": "/waiting-room/12/events"}]}',
+        json.dumps({"requests": [{"path": "/tickets/offers/"}] * 6}).encode(),
+    ])
+    def test_invalid_batches(self, payload):
+        """Vérifie le rejet des requêtes groupées invalides, imbriquées, trop grandes ou hors des services"""
+        with pytest.raises(BatchError):
+            parse_batch(payload, max_requests=5, routes=gateway_routes)
+
+    def test_batch_cost(self):
+        """Vérifie le décompte d'une unité par tranche de sous-requêtes"""
+        assert [batch_cost(count, 5) for count in (1, 5, 6, 20)] == [1, 1, 2, 4]
+
+    def test_encode_body(self):
+        """Vérifie l'intégration des corps JSON, texte et binaires"""
+        assert encode_body("application/json", b'{"id": 1}') == ({"id": 1}, None)
+        assert encode_body("text/plain; charset=utf-8", "Réservé".encode()) == ("Réservé", None)
+        assert encode_body("image/png", b"\x89PNG") == ("iVBORw==", "base64")
+
+# Tests des métriques Prometheus
+class TestMetrics:
+    def test_render_counter_and_histogram(self):
+        """Vérifie le format d'exposition des compteurs et des histogrammes"""
+        registry = Registry()
+        rejections = registry.counter("rejections_total", "Refus", ("limiter",))
+        duration = registry.histogram("duration_seconds", "Durée", buckets=(0.1, 1.0))
+
+        rejections.labels("api").inc()
+        rejections.labels("api").inc(2)
+        for value in (0.05, 0.1, 0.5, 3):
+            duration.observe(value)
+
+        lines = registry.render().splitlines()
+        assert "# TYPE rejections_total counter" in lines
+        assert 'rejections_total{limiter="api"} 3' in lines
+        assert 'duration_seconds_bucket{le="0.1"} 2' in lines
+        assert 'duration_seconds_bucket{le="1.0"} 3' in lines
+        assert 'duration_seconds_bucket{le="+Inf"} 4' in lines
+        assert "duration_seconds_sum 3.65" in lines
+        assert "duration_seconds_count 4" in lines
+
+    def test_threads_record_without_losing_updates(self):
+        """Vérifie que chaque thread écrit dans ses propres cellules, additionnées à l'export"""
+        registry = Registry()
+        counter = registry.counter("events_total", "Événements")
+
+        def work():
+            for _ in range(10000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert "events_total 40000" in registry.render()
+        assert len(counter.children[()].cells.cells) == 4
+
+    def test_middleware_uses_route_templates(self):
+        """Vérifie l'étiquetage des requêtes par modèle de route plutôt que par chemin"""
+        registry = Registry()
+        app = FastAPI()
+
+        @app.get("/tickets/{ticket_id}")
+        async def ticket(ticket_id: int):
+            return {"id": ticket_id}
+
+        app.add_middleware(MetricsMiddleware, registry=registry)
+        test_client = TestClient(app)
+        for ticket_id in (1, 2):
+            test_client.get(f"/tickets/{ticket_id}")
+        test_client.get("/unknown")
+
+        text = registry.render()
+        assert 'http_request_duration_seconds_count{method="GET",route="/tickets/{ticket_id}",status="200"} 2' in text
+        assert 'route="unmatched",status="404"' in text
+        assert "http_requests_in_flight 0" in text
+
+class RecordingProcessor:
+    """Processeur de spans conservant les spans terminés en mémoire."""
+
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+# Tests du traçage distribué
+class TestTracing:
+    def test_parse_traceparent(self):
+        """Vérifie l'analyse de l'en-tête traceparent et le rejet des valeurs invalides"""
+        context = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+        assert context.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert context.span_id == "00f067aa0ba902b7"
+        assert context.sampled
+        assert context.traceparent() == "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+        assert not parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00").sampled
+        for value in (None, "", "garbage", "00-0" * 4, "00-00000000000000000000000000000000-00f067aa0ba902b7-01",
+                      "ff-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"):
+            assert parse_traceparent(value) is None
+
+    def test_child_spans_and_propagation(self):
+        """Vérifie la filiation des spans et le contexte injecté dans les en-têtes"""
+        processor = RecordingProcessor()
+        tracer = Tracer("test", processor, sample_ratio=1.0)
+
+        with tracer.start_span("parent", kind="server") as parent:
+            with tracer.start_span("child") as child:
+                headers = tracer.inject({"accept": "*/*"})
+
+        assert [span.name for span in processor.spans] == ["child", "parent"]
+        assert child.context.trace_id == parent.context.trace_id
+        assert child.parent_id == parent.context.span_id
+        assert headers["traceparent"] == child.context.traceparent()
+        assert child.end_time >= child.start > 0
+
+    def test_head_sampling_decision_is_propagated(self):
+        """Vérifie qu'une trace non échantillonnée ne produit aucun span mais propage sa décision"""
+        processor = RecordingProcessor()
+        tracer = Tracer("test", processor, sample_ratio=0.0)
+
+        with tracer.start_span("request", kind="server") as root:
+            assert not root.recording
+            with tracer.start_span("db SELECT") as child:
+                assert not child.recording
+            headers = tracer.inject({})
+
+        assert processor.spans == []
+        assert headers["traceparent"].endswith("-00")
+        # Une trace échantillonnée en amont l'est aussi en aval, quel que soit le ratio local
+        upstream = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+        with tracer.start_span("request", kind="server", parent=upstream):
+            with tracer.start_span("generate_qr_code"):
+                pass
+        assert [span.parent_id for span in processor.spans][-1] == "00f067aa0ba902b7"
+        assert len(processor.spans) == 2
+
+    def test_file_exporter_writes_otlp_json(self, tmp_path):
+        """Vérifie l'export par lots au format OTLP/JSON"""
+        path = tmp_path / "traces.jsonl"
+        processor = BatchSpanProcessor("tickets-service", FileSpanExporter(str(path)), interval=0.05)
+        tracer = Tracer("tickets-service", processor)
+
+        with tracer.start_span("generate_qr_code", attributes={"ticket.id": 7}):
+            pass
+        processor.shutdown()
+
+        payload = json.loads(path.read_text().splitlines()[0])
+        resource_spans = payload["resourceSpans"][0]
+        assert resource_spans["resource"]["attributes"][0]["value"] == {"stringValue": "tickets-service"}
+        span = resource_spans["scopeSpans"][0]["spans"][0]
+        assert span["name"] == "generate_qr_code"
+        assert span["attributes"] == [{"key": "ticket.id", "value": {"intValue": "7"}}]
+        assert processor.stats()["exported"] == 1
+
+    def test_middleware_names_server_spans_by_route(self):
+        """Vérifie que le span serveur poursuit la trace reçue et porte le modèle de route"""
+        processor = RecordingProcessor()
+        tracer = Tracer("test", processor, sample_ratio=0.0)
+        app = FastAPI()
+
+        @app.get("/tickets/{ticket_id}")
+        async def ticket(ticket_id: int):
+            return {"traceparent": tracer.inject({})["traceparent"]}
+
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+        response = TestClient(app).get(
+            "/tickets/3", headers={"traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"}
+        )
+
+        span = processor.spans[0]
+        assert span.name == "GET /tickets/{ticket_id}"
+        assert span.parent_id == "00f067aa0ba902b7"
+        assert span.attributes["http.status_code"] == 200
+        assert response.json()["traceparent"] == span.context.traceparent()
+
+# Tests des échéances
+class TestDeadline:
+    def test_parse_timeout(self):
+        """Vérifie l'analyse de l'en-tête de délai"""
+        assert deadline.parse_timeout("1500") == 1.5
+        assert deadline.parse_timeout("-5") == 0
+        assert deadline.parse_timeout("abc") is None
+
+    def test_middleware_sets_shortest_deadline(self):
+        """Vérifie que l'échéance retenue est la plus courte, et le refus des requêtes expirées"""
+        app = FastAPI()
+
+        @app.get("/remaining")
+        async def remaining():
+            return {"headers": deadline.inject({})}
+
+        app.add_middleware(DeadlineMiddleware, budget_for=lambda scope: 2.0)
+        test_client = TestClient(app)
+
+        assert 1500 < int(test_client.get("/remaining").json()["headers"]["x-request-timeout-ms"]) <= 2000
+        forwarded = test_client.get("/remaining", headers={"x-request-timeout-ms": "300"}).json()["headers"]
+        assert 0 < int(forwarded["x-request-timeout-ms"]) <= 300
+        assert test_client.get("/remaining", headers={"x-request-timeout-ms": "0"}).status_code == 504
+        assert deadline.remaining() is None
+
+# Tests de la composition de la page « Mes billets »
+class TestMyTicketsAggregation:
+    def test_offers_are_deduplicated_and_failures_degrade(self):
+        """Vérifie la lecture unique de chaque offre et le document partiel en cas d'échec"""
+        calls = []
+
+        async def fetch(path):
+            calls.append(path)
+            if path == "/tickets/user/7":
+                return 200, [{"id": 1, "offer_id": 10}, {"id": 2, "offer_id": 10}, {"id": 3, "offer_id": 11}]
+            if path == "/offers/10":
+                return 200, {"id": 10, "name": "Finale 100m"}
+            if path == "/offers/11":
+                return 503, None
+            if path == "/tickets/2/qrcode":
+                raise RuntimeError("boom")
+            return 200, {"qr_code": f"data:{path}"}
+
+        document = asyncio.run(compose_my_tickets(fetch, 7))
+
+        assert sorted(calls).count("/offers/10") == 1
+        assert [item["offer"] for item in document["tickets"]] == [{"id": 10, "name": "Finale 100m"}] * 2 + [None]
+        assert [item["qr_code"] for item in document["tickets"]] == ["data:/tickets/1/qrcode", None, "data:/tickets/3/qrcode"]
+        assert document["partial"]
+        assert document["errors"] == [
+            {"resource": "offer", "id": 11, "status": 503},
+            {"resource": "qr_code", "id": 2, "status": 500},
+        ]
+
+    def test_qr_codes_are_bounded(self):
+        """Vérifie la limite du nombre de QR codes demandés simultanément"""
+        active = peak = 0
+
+        async def fetch(path):
+            nonlocal active, peak
+            if path.startswith("/tickets/user"):
+                return 200, [{"id": ticket_id, "offer_id": 1} for ticket_id in range(10)]
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return 200, {"qr_code": "data:"}
+
+        document = asyncio.run(compose_my_tickets(fetch, 1, max_concurrency=3))
+
+        assert not document["partial"]
+        assert peak <= 4  # 3 QR codes et la lecture de l'offre
+
+    def test_tickets_failure_is_an_error(self):
+        """Vérifie qu'un échec de lecture des billets fait échouer la composition"""
+        async def fetch(path):
+            return 503, None
+
+        with pytest.raises(AggregationError) as error:
+            asyncio.run(compose_my_tickets(fetch, 1))
+        assert error.value.status_code == 503
+
+# Tests de l'état partagé entre les workers
+class TestMultipleWorkers:
+    def test_invalidation_reaches_other_workers(self, tmp_path):
+        """Vérifie qu'une écriture reçue par un worker invalide le cache des autres"""
+        path = str(tmp_path / "epochs")
+        worker_1 = ResponseCache(epochs=SharedEpochs(path))
+        worker_2 = ResponseCache(epochs=SharedEpochs(path))
+        key = ResponseCache.make_key("tickets", "/offers/1", [])
+        worker_2.set(key, 200, {"etag": '"v1"'}, b"{}", 30)
+
+        worker_1.invalidate("tickets", "/offers")
+
+        assert worker_2.get(key) is None
+        assert worker_2.get_stale(key) is None
+        worker_2.set(key, 200, {}, b"{}", 30)
+        assert worker_2.get(key) is not None
+
+    def test_metrics_are_summed_across_workers(self, tmp_path):
+        """Vérifie l'addition des instantanés des workers, sans les jauges des workers arrêtés"""
+        registries = [Registry(), Registry()]
+        for registry, count in zip(registries, (2, 3)):
+            requests = registry.counter("requests_total", "Requêtes", ("route",))
+            duration = registry.histogram("duration_seconds", "Durée", buckets=(0.1, 1.0))
+            in_flight = registry.gauge("in_flight", "En cours")
+            requests.labels("/offers").inc(count)
+            duration.observe(0.05 * count)
+            in_flight.inc()
+
+        text = merge_snapshots(registry.snapshot() for registry in registries).render()
+        assert 'requests_total{route="/offers"} 5' in text
+        assert 'duration_seconds_bucket{le="0.1"} 1' in text
+        assert "duration_seconds_count 2" in text
+        assert "in_flight 2" in text
+
+        # Instantané d'un worker arrêté (pid inexistant) : seuls ses compteurs restent
+        (tmp_path / "999999999.json").write_text(json.dumps(registries[1].snapshot()))
+        text = MultiprocessMetrics(registries[0], str(tmp_path)).render()
+        assert 'requests_total{route="/offers"} 5' in text
+        assert "in_flight 1" in text
+
+    def test_runner_shares_state_between_workers(self, monkeypatch, tmp_path):
+        """Vérifie la configuration de l'état partagé lancée avec plusieurs workers"""
+        monkeypatch.setattr(os, "environ", {})
+        config = server.ServerConfig(workers=4, metrics_dir=str(tmp_path / "metrics"))
+
+        applied = server.prepare_shared_state(config)
+
+        assert applied == {
+            "RATE_LIMIT_BACKEND": "shared_memory",
+            "GATEWAY_CACHE_SHARED_INVALIDATION": "true",
+            "METRICS_MULTIPROC_DIR": str(tmp_path / "metrics"),
+        }
+        assert os.environ["RATE_LIMIT_BACKEND"] == "shared_memory"
+        os.environ["WAITING_ROOM_OFFERS"] = "12:50"
+        with pytest.raises(SystemExit):
+            server.prepare_shared_state(config)
+
+# Tests de la table de routage
+class TestRouteTable:
+    def test_longest_prefix_and_inheritance(self):
+        """Vérifie la route du plus long préfixe et l'héritage des politiques"""
+        table = RouteTable([
+            Route("/", access="authenticated", timeout=10),
+            Route("/tickets", service="tickets", priority=BROWSE, timeout=8),
+            Route("/tickets/tickets", priority=PURCHASE),
+        ])
+
+        route = table.match("POST", "/tickets/tickets/")
+        assert (route.service, route.priority, route.timeout, route.access) == ("tickets", PURCHASE, 8, "authenticated")
+        assert route.upstream_path("/tickets/tickets/") == "/tickets/"
+        assert table.match("GET", "/tickets/offers/3").priority == BROWSE
+        # Les préfixes sont comparés segment par segment
+        assert table.match("GET", "/ticketsfoo").service is None
+        assert table.match("GET", "/health").timeout == 10
+
+    def test_method_specific_policies(self):
+        """Vérifie les politiques propres à une méthode, et celles des méthodes non déclarées"""
+        route = gateway_routes.match("GET", "/tickets/offers/3")
+        assert (route.access, route.cache_ttl, route.timeout) == (PUBLIC, 30, 3)
+        assert route.coalesce == CoalesceRule("tickets", "/offers", public=True)
+
+        write = gateway_routes.match("POST", "/tickets/offers/")
+        assert (write.access, write.cache_ttl, write.coalesce) == ("authenticated", None, None)
+        assert gateway_routes.match("OPTIONS", "/tickets/offers/").access == "authenticated"
+        assert gateway_routes.match("POST", "/auth/token").rate_limit == "auth"
+        assert gateway_routes.match("GET", "/auth/users/me").rate_limit == "api"
+        assert gateway_routes.match("GET", "/admin/sales/").priority == REPORTS
+        assert gateway_routes.match("GET", "/auth/users/me").priority == AUTH
+
+    def test_resolved_once_per_request(self):
+        """Vérifie que la route est conservée dans le scope après la première résolution"""
+        scope = {"method": "GET", "path": "/validation/validate"}
+
+        route = gateway_routes.resolve(scope)
+        scope["path"] = "/tickets/offers/"
+
+        assert gateway_routes.resolve(scope) is route
+        assert route.priority == VALIDATION
+
+    def test_mounts_and_invalid_routes(self):
+        """Vérifie les services relayés et le refus d'une déclaration incohérente"""
+        assert gateway_routes.mounts() == [
+            ("/auth", "auth"), ("/tickets", "tickets"), ("/admin", "admin"), ("/validation", "validation"),
+        ]
+        with pytest.raises(ValueError):
+            RouteTable([Route("/me", coalesce="public")])
+        with pytest.raises(ValueError):
+            RouteTable([Route("/tickets", service="tickets", coalesce="shared")])
+
+# Tests des nouvelles tentatives et de la couverture des lectures
+class TestRetryPolicy:
+    def test_budget_limits_retries_to_a_fraction_of_traffic(self):
+        """Vérifie que le budget n'autorise qu'une fraction de tentatives supplémentaires"""
+        budget = RetryBudget(ratio=0.25, min_per_second=0, capacity=2)
+        assert [budget.try_withdraw() for _ in range(3)] == [True, True, False]
+
+        for _ in range(4):
+            budget.deposit()
+
+        assert budget.try_withdraw() is True
+        assert budget.try_withdraw() is False
+        assert budget.stats()["exhausted"] == 2
+
+    def test_backoff_is_jittered_and_capped(self):
+        """Vérifie que l'attente est tirée sous un plafond exponentiel borné"""
+        policy = RetryPolicy(base_delay=0.1, max_delay=0.3)
+
+        assert all(0 <= policy.backoff(1) <= 0.1 for _ in range(50))
+        assert all(0 <= policy.backoff(5) <= 0.3 for _ in range(50))
+        assert len({policy.backoff(2) for _ in range(10)}) > 1
+
+    def test_hedge_delay_follows_p95(self):
+        """Vérifie le délai de couverture : p95 de la latence, avec plusieurs instances seulement"""
+        hedging = HedgingPolicy(min_delay=0.01)
+        assert hedging.delay("tickets", 2) is None
+
+        # Quelques appels très lents (moins de 5 %) ne repoussent pas le délai
+        for i in range(50):
+            hedging.record("tickets", 1.0 if i % 20 == 0 else 0.02)
+
+        assert hedging.delay("tickets", 2) == 0.02
+        assert hedging.delay("tickets", 1) is None
+        assert HedgingPolicy(enabled=False).delay("tickets", 2) is None
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import functools
+import threading
+import contextvars
+import urllib.request
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# En-tête de propagation du contexte de trace (W3C Trace Context)
+TRACEPARENT = "traceparent"
+
+# Types de span et codes de statut du format OTLP
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """Identifiants d'un span propagés entre services."""
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Analyse un en-tête traceparent ; renvoie None s'il est absent ou invalide."""
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    _, trace_id, span_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        if int(trace_id, 16) == 0 or int(span_id, 16) == 0:
+            return None
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    return SpanContext(trace_id, span_id, sampled)
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    Opération chronométrée d'une trace. Un span non échantillonné ne porte que
+    son contexte, pour la propagation : il n'est ni horodaté ni exporté.
+    """
+
+    __slots__ = ("tracer", "context", "parent_id", "name", "kind", "start", "end_time",
+                 "attributes", "status", "message", "token")
+
+    def __init__(self, tracer: "Tracer", context: SpanContext, parent_id: Optional[str], name: str,
+                 kind: str, attributes: Optional[Dict[str, object]]):
+        self.tracer = tracer
+        self.context = context
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns() if context.sampled else 0
+        self.end_time = 0
+        self.attributes = dict(attributes) if attributes and context.sampled else {}
+        self.status = 0
+        self.message = ""
+        self.token = None
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value):
+        if self.context.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, message: str):
+        if self.context.sampled:
+            self.status, self.message = STATUS_ERROR, message
+
+    def end(self):
+        if self.context.sampled and not self.end_time:
+            self.end_time = time.time_ns()
+            self.tracer.processor.on_end(self)
+
+    def __enter__(self) -> "Span":
+        self.token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+        _current_span.reset(self.token)
+
+
+class NoopSpan:
+    """Span sans effet, utilisé quand le traçage est désactivé ou la trace non échantillonnée."""
+
+    context = None
+    recording = False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    """
+    Traceur d'un service, avec échantillonnage en tête de trace.
+
+    La décision d'échantillonnage est prise une seule fois, au premier service
+    traversé, puis propagée avec le contexte (drapeau de l'en-tête traceparent) :
+    une trace est conservée entière ou pas du tout, et seule une proportion
+    bornée des requêtes produit des spans, quelle que soit la charge.
+    """
+
+    def __init__(self, service_name: str, processor=None, sample_ratio: float = 1.0):
+        """
+        Args:
+            service_name: Le nom du service (attribut service.name des spans exportés)
+            processor: Le processeur d'export des spans (traçage désactivé si None)
+            sample_ratio: Proportion des traces échantillonnées
+        """
+        self.service_name = service_name
+        self.processor = processor
+        self.sample_ratio = sample_ratio
+        self.enabled = processor is not None
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[SpanContext] = None,
+                   attributes: Optional[Dict[str, object]] = None):
+        """
+        Crée un span, enfant du span courant ou du contexte fourni.
+
+        Les spans internes et clients d'une trace non échantillonnée sont sans
+        effet ; le span serveur est toujours créé, pour propager la décision.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            span = _current_span.get()
+            parent = span.context if span is not None else None
+        if parent is None:
+            context = SpanContext(f"{random.getrandbits(128):032x}", f"{random.getrandbits(64):016x}",
+                                  random.random() < self.sample_ratio)
+            return Span(self, context, None, name, kind, attributes)
+        if not parent.sampled and kind != "server":
+            return NOOP_SPAN
+        context = SpanContext(parent.trace_id, f"{random.getrandbits(64):016x}", parent.sampled)
+        return Span(self, context, parent.span_id, name, kind, attributes)
+
+    def inject(self, headers: Dict[str, str], span=None) -> Dict[str, str]:
+        """Renvoie les en-têtes complétés du contexte du span (ou du span courant) à propager."""
+        context = getattr(span, "context", None)
+        if context is None:
+            current = _current_span.get()
+            context = current.context if current is not None else None
+        if context is None:
+            return headers
+        return {**headers, TRACEPARENT: context.traceparent()}
+
+    def traced(self, name: str):
+        """Décorateur créant un span autour de chaque appel de la fonction."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.start_span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+def span_to_otlp(span: Span) -> Dict[str, object]:
+    otlp = {
+        "traceId": span.context.trace_id,
+        "spanId": span.context.span_id,
+        "name": span.name,
+        "kind": SPAN_KINDS.get(span.kind, 1),
+        "startTimeUnixNano": str(span.start),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": [otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": span.status, "message": span.message} if span.status else {"code": 0},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+def otlp_attribute(key: str, value) -> Dict[str, object]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_payload(service_name: str, spans: List[Span]) -> Dict[str, object]:
+    """Construit une requête d'export OTLP/JSON (ExportTraceServiceRequest)."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [otlp_attribute("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": "billetterie-jo"}, "spans": [span_to_otlp(span) for span in spans]}],
+    }]}
+
+
+class FileSpanExporter:
+    """Écrit chaque lot de spans sur une ligne OTLP/JSON (format du file exporter d'OpenTelemetry)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, payload: Dict[str, object]):
+        with open(self.path, "a", encoding="utf-8") as output:
+            output.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OtlpHttpExporter:
+    """Envoie chaque lot de spans à un collecteur OTLP/HTTP (encodage JSON)."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, payload: Dict[str, object]):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+
+class BatchSpanProcessor:
+    """
+    Exporte les spans terminés par lots, depuis un thread dédié.
+
+    Les spans sont déposés dans une file bornée sans jamais bloquer la requête
+    en cours : si l'export prend du retard, les spans en excès sont abandonnés
+    et comptés.
+    """
+
+    def __init__(self, service_name: str, exporter, queue_size: int = 2048, batch_size: int = 256,
+                 interval: float = 1.0):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self.exported = 0
+        self.thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def on_end(self, span: Span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    running = False
+                    break
+                batch.append(span)
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(otlp_payload(self.service_name, batch))
+            self.exported += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.warning(f"Span export failed: {str(e)}")
+
+    def shutdown(self):
+        """Exporte les spans en attente puis arrête le thread d'export."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, object]:
+        return {"queued": self.queue.qsize(), "exported": self.exported, "dropped": self.dropped}
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI créant le span serveur de chaque requête, enfant du contexte
+    reçu dans l'en-tête traceparent. Le span est nommé d'après le modèle de route
+    (ex: GET /tickets/{ticket_id}).
+    """
+
+    def __init__(self, app, tracer: Tracer, trust_parent: bool = True):
+        """
+        Args:
+            app: L'application ASGI
+            tracer: Le traceur du service
+            trust_parent: False pour ignorer le contexte reçu (point d'entrée public :
+                un client ne doit pas pouvoir imposer l'échantillonnage de ses requêtes)
+        """
+        self.app = app
+        self.tracer = tracer
+        self.trust_parent = trust_parent
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for name, value in scope["headers"] if self.trust_parent else ():
+            if name == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        span = self.tracer.start_span(scope["method"], kind="server", parent=parent)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.set_error(f"HTTP {message['status']}")
+            await send(message)
+
+        with span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if span.recording:
+                    span.name = f"{scope['method']} {route or scope['path']}"
+                    span.set_attribute("http.method", scope["method"])
+                    span.set_attribute("http.target", scope["path"])
+                    if route:
+                        span.set_attribute("http.route", route)
+
+
+def build_tracer(service_name: str) -> Tracer:
+    """
+    Crée le traceur configuré par l'environnement :
+    TRACE_EXPORTER (none, file ou otlp), TRACE_FILE, OTEL_EXPORTER_OTLP_ENDPOINT
+    et TRACE_SAMPLE_RATIO.
+    """
+    exporter_name = os.getenv("TRACE_EXPORTER", "none").lower()
+    if exporter_name == "none":
+        return Tracer(service_name)
+    if exporter_name == "file":
+        exporter = FileSpanExporter(os.getenv("TRACE_FILE", f"traces-{service_name}.jsonl"))
+    elif exporter_name == "otlp":
+        exporter = OtlpHttpExporter(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"))
+    else:
+        raise ValueError(f"Unknown trace exporter: {exporter_name}")
+    return Tracer(
+        service_name,
+        BatchSpanProcessor(service_name, exporter),
+        sample_ratio=float(os.getenv("TRACE_SAMPLE_RATIO", "0.05")),
+    )
@@ -0,0 +1,448 @@
+import os
+import hmac
+import math
+import time
+import base64
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+# Le backend Redis dépend du paquet optionnel redis
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+class WaitingRoomError(Exception):
+    """Requête d'achat refusée par la salle d'attente."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+@dataclass
+class QueueToken:
+    """Contenu d'un jeton de file d'attente vérifié."""
+    offer_id: int
+    sequence: int
+    member: str
+    issued_at: int
+
+
+@dataclass
+class QueueStatus:
+    """Position d'un jeton dans la file d'une offre."""
+    position: int
+    admitted: bool
+    estimated_wait: int
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"position": self.position, "admitted": self.admitted, "estimated_wait": self.estimated_wait}
+
+
+def coerce_offer_id(value) -> int:
+    """
+    Convertit l'offre d'un achat en entier comme la validation du service de
+    billetterie : les flottants entiers (12.0) et les textes numériques ("12")
+    désignent la même offre que l'entier.
+
+    Raises:
+        ValueError: Si la valeur ne désigne pas un entier
+    """
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            value = float(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(f"Invalid offer id: {value!r}")
+
+
+def member_fingerprint(member: str) -> str:
+    """Empreinte courte de l'utilisateur, stockée dans la file et dans le jeton."""
+    return hashlib.blake2b(member.encode(), digest_size=8).hexdigest()
+
+
+class QueueTokenSigner:
+    """
+    Signe et vérifie les jetons de file d'attente (HMAC-SHA256).
+
+    Un jeton contient l'offre, le numéro d'ordre dans la file, l'empreinte de
+    l'utilisateur et sa date d'émission : la position se déduit du numéro
+    d'ordre, sans état par jeton côté API Gateway.
+    """
+
+    def __init__(self, secret_key: str, ttl: int = 7200):
+        """
+        Args:
+            secret_key: La clé de signature
+            ttl: Durée de validité d'un jeton en secondes
+        """
+        self.key = secret_key.encode()
+        self.ttl = ttl
+
+    def _sign(self, payload: bytes) -> str:
+        digest = hmac.new(self.key, payload, hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def issue(self, offer_id: int, sequence: int, member: str) -> str:
+        payload = f"{offer_id}.{sequence}.{member}.{int(time.time())}"
+        return f"{payload}.{self._sign(payload.encode())}"
+
+    def verify(self, token: str) -> Optional[QueueToken]:
+        """Renvoie le contenu du jeton, ou None s'il est mal formé, falsifié ou expiré."""
+        payload, _, signature = (token or "").rpartition(".")
+        if not payload or not hmac.compare_digest(self._sign(payload.encode()), signature):
+            return None
+        try:
+            offer_id, sequence, member, issued_at = payload.split(".")
+            parsed = QueueToken(int(offer_id), int(sequence), member, int(issued_at))
+        except ValueError:
+            return None
+        if parsed.issued_at + self.ttl < time.time():
+            return None
+        return parsed
+
+
+class OfferQueue:
+    """
+    File d'attente d'une offre : un compteur de jetons émis, un front d'admission,
+    les numéros d'ordre attribués (indexés par empreinte d'utilisateur, avec la
+    date de leur dernier jeton) et les numéros d'ordre ayant servi à un achat.
+
+    Le front avance au débit d'admission de l'offre ; le jeton de numéro d'ordre
+    n est admis dès que le front atteint n + 1. Quand la file est vide, le front
+    ne peut prendre qu'une avance limitée (`burst`) sur les jetons émis.
+    """
+
+    __slots__ = ("issued", "frontier", "updated_at", "members", "used")
+
+    def __init__(self):
+        self.issued = 0
+        self.frontier = 0.0
+        self.updated_at: Optional[float] = None
+        self.members: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.used: Set[int] = set()
+
+    def advance(self, now: float, rate: float, burst: float) -> float:
+        if self.updated_at is None:
+            # Salle jusqu'ici inoccupée : l'avance maximum est déjà acquise
+            self.frontier = self.issued + burst
+        else:
+            self.frontier = min(self.frontier + (now - self.updated_at) * rate, self.issued + burst)
+        self.updated_at = now
+        return self.frontier
+
+
+class MemoryQueueStore:
+    """
+    État des files d'attente propre au processus.
+
+    Un utilisateur est oublié une fois son dernier jeton expiré (`ttl`) : la
+    mémoire occupée par une file reste proportionnelle aux jetons encore valides.
+    """
+
+    def __init__(self, ttl: int = 7200):
+        """
+        Args:
+            ttl: Durée de validité des jetons en secondes
+        """
+        self.ttl = ttl
+        self.queues: Dict[int, OfferQueue] = {}
+
+    def _queue(self, offer_id: int) -> OfferQueue:
+        queue = self.queues.get(offer_id)
+        if queue is None:
+            queue = self.queues[offer_id] = OfferQueue()
+        return queue
+
+    def _prune(self, queue: OfferQueue, now: float):
+        # Les utilisateurs sont rangés par date de leur dernier jeton : seuls les
+        # premiers peuvent avoir expiré
+        while queue.members:
+            member, (sequence, joined_at) = next(iter(queue.members.items()))
+            if now - joined_at <= self.ttl:
+                break
+            del queue.members[member]
+            queue.used.discard(sequence)
+
+    async def join(self, offer_id: int, member: str) -> int:
+        """Attribue un numéro d'ordre à l'utilisateur (le même s'il est déjà dans la file)."""
+        queue = self._queue(offer_id)
+        now = time.monotonic()
+        self._prune(queue, now)
+        entry = queue.members.pop(member, None)
+        sequence = entry[0] if entry is not None else queue.issued
+        if entry is None:
+            queue.issued += 1
+        # Un nouveau jeton est émis : l'utilisateur est conservé jusqu'à son expiration
+        queue.members[member] = (sequence, now)
+        return sequence
+
+    async def claim(self, offer_id: int, sequence: int) -> bool:
+        """Réserve un numéro d'ordre pour un achat ; renvoie False s'il a déjà servi."""
+        queue = self._queue(offer_id)
+        self._prune(queue, time.monotonic())
+        if sequence in queue.used:
+            return False
+        queue.used.add(sequence)
+        return True
+
+    async def release(self, offer_id: int, sequence: int):
+        """Libère un numéro d'ordre dont l'achat a échoué."""
+        self._queue(offer_id).used.discard(sequence)
+
+    async def frontier(self, offer_id: int, rate: float, burst: float) -> Tuple[float, int]:
+        """Fait avancer le front d'admission et renvoie (front, nombre de jetons émis)."""
+        queue = self._queue(offer_id)
+        return queue.advance(time.monotonic(), rate, burst), queue.issued
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": "memory",
+            "offers": {
+                str(offer_id): {"issued": queue.issued, "admitted": min(queue.issued, int(queue.frontier))}
+                for offer_id, queue in self.queues.items()
+            },
+        }
+
+
+# Attribution d'un numéro d'ordre : KEYS = (utilisateurs de la file, état de la file),
+# ARGV = (empreinte de l'utilisateur, durée de conservation en secondes)
+JOIN_SCRIPT = """
+local sequence = redis.call('HGET', KEYS[1], ARGV[1])
+if not sequence then
+    sequence = redis.call('HINCRBY', KEYS[2], 'issued', 1) - 1
+    redis.call('HSET', KEYS[1], ARGV[1], sequence)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return tonumber(sequence)
+"""
+
+# Réservation d'un numéro d'ordre pour un achat : KEYS = (numéros d'ordre utilisés),
+# ARGV = (numéro d'ordre, durée de conservation en secondes)
+CLAIM_SCRIPT = """
+local added = redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return added
+"""
+
+# Avancée du front d'admission : KEYS = (état de la file),
+# ARGV = (débit, avance maximum, durée de conservation en secondes).
+# Le front est renvoyé sous forme de texte, Redis tronquant les nombres en entiers.
+FRONTIER_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'issued', 'frontier', 'updated_at')
+local issued = tonumber(state[1]) or 0
+local frontier = issued + tonumber(ARGV[2])
+local updated_at = tonumber(state[3])
+if updated_at then
+    frontier = math.min(tonumber(state[2]) + (now - updated_at) * tonumber(ARGV[1]), frontier)
+end
+redis.call('HSET', KEYS[1], 'frontier', string.format('%.6f', frontier), 'updated_at', string.format('%.6f', now))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {string.format('%.6f', frontier), issued}
+"""
+
+
+class RedisQueueStore:
+    """
+    État des files d'attente partagé entre les instances de l'API Gateway via Redis.
+
+    Chaque opération est un script Lua atomique ; les clés d'une file expirent
+    après la durée de validité des jetons.
+    """
+
+    def __init__(self, url: str, ttl: int = 7200, prefix: str = "waitingroom"):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for the redis waiting room backend")
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+        self.client = aioredis.from_url(url)
+        self.join_script = self.client.register_script(JOIN_SCRIPT)
+        self.frontier_script = self.client.register_script(FRONTIER_SCRIPT)
+        self.claim_script = self.client.register_script(CLAIM_SCRIPT)
+
+    def _keys(self, offer_id: int) -> Tuple[str, str]:
+        return f"{self.prefix}:{offer_id}:members", f"{self.prefix}:{offer_id}:state"
+
+    async def join(self, offer_id: int, member: str) -> int:
+        return int(await self.join_script(keys=list(self._keys(offer_id)), args=[member, self.ttl]))
+
+    async def frontier(self, offer_id: int, rate: float, burst: float) -> Tuple[float, int]:
+        frontier, issued = await self.frontier_script(keys=[self._keys(offer_id)[1]], args=[rate, burst, self.ttl])
+        return float(frontier), int(issued)
+
+    async def claim(self, offer_id: int, sequence: int) -> bool:
+        return int(await self.claim_script(keys=[f"{self.prefix}:{offer_id}:used"], args=[sequence, self.ttl])) == 1
+
+    async def release(self, offer_id: int, sequence: int):
+        await self.client.srem(f"{self.prefix}:{offer_id}:used", sequence)
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": "redis"}
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+class WaitingRoom:
+    """
+    Salle d'attente virtuelle des ouvertures de vente à forte demande.
+
+    Pour les offres configurées, un achat n'est relayé au service de billetterie
+    que sur présentation d'un jeton de file d'attente signé et admis ; les
+    utilisateurs sont admis dans l'ordre d'arrivée, au débit configuré pour
+    l'offre (admissions par seconde).
+    """
+
+    def __init__(self, signer: QueueTokenSigner, store, rates: Dict[int, float],
+                 burst: Optional[float] = None):
+        """
+        Args:
+            signer: Le signataire des jetons
+            store: L'état des files (MemoryQueueStore ou RedisQueueStore)
+            rates: Le débit d'admission (par seconde) de chaque offre en salle d'attente
+            burst: Avance maximum du front sur une file vide (une seconde de débit par défaut)
+        """
+        self.signer = signer
+        self.store = store
+        self.rates = dict(rates)
+        self.burst = burst
+        self.rejected = 0
+
+    def is_active(self, offer_id: int) -> bool:
+        return offer_id in self.rates
+
+    def _burst(self, offer_id: int) -> float:
+        return self.burst if self.burst is not None else max(1.0, self.rates[offer_id])
+
+    async def join(self, offer_id: int, member: str) -> Tuple[str, QueueStatus]:
+        """
+        Place un utilisateur dans la file d'une offre.
+
+        Returns:
+            Un tuple (jeton signé, position dans la file)
+        """
+        fingerprint = member_fingerprint(member)
+        # Le front est avancé avant l'arrivée : une file vide admet `burst` utilisateurs sans attente
+        await self.store.frontier(offer_id, self.rates[offer_id], self._burst(offer_id))
+        sequence = await self.store.join(offer_id, fingerprint)
+        token = self.signer.issue(offer_id, sequence, fingerprint)
+        return token, await self._status(offer_id, sequence)
+
+    async def status(self, offer_id: int, token: Optional[str]) -> QueueStatus:
+        """
+        Renvoie la position d'un jeton dans la file d'une offre.
+
+        Raises:
+            WaitingRoomError: Si l'offre n'a pas de salle d'attente (404) ou si le jeton est invalide (403)
+        """
+        if not self.is_active(offer_id):
+            raise WaitingRoomError(404, "No waiting room for this offer")
+        parsed = self.signer.verify(token)
+        if parsed is None or parsed.offer_id != offer_id:
+            raise WaitingRoomError(403, "Invalid queue token")
+        return await self._status(offer_id, parsed.sequence)
+
+    async def _status(self, offer_id: int, sequence: int) -> QueueStatus:
+        rate = self.rates[offer_id]
+        frontier, _ = await self.store.frontier(offer_id, rate, self._burst(offer_id))
+        # Un jeton est admis quand le front a dépassé sa place entière
+        missing = sequence + 1 - frontier
+        if missing <= 0:
+            return QueueStatus(position=0, admitted=True, estimated_wait=0)
+        return QueueStatus(position=math.ceil(missing), admitted=False, estimated_wait=math.ceil(missing / rate))
+
+    async def check_purchase(self, offer_id: int, member: str, token: Optional[str]) -> Optional[QueueToken]:
+        """
+        Vérifie qu'un achat peut être relayé au service de billetterie et réserve
+        le jeton : un jeton admis ne sert qu'à un seul achat.
+
+        Returns:
+            Le jeton réservé, à libérer par `release` si l'achat échoue (None si
+            l'offre n'a pas de salle d'attente)
+
+        Raises:
+            WaitingRoomError: Si le jeton est absent, invalide, émis pour un autre
+                utilisateur ou déjà utilisé (403), ou si l'utilisateur n'est pas
+                encore admis (429)
+        """
+        if not self.is_active(offer_id):
+            return None
+        parsed = self.signer.verify(token)
+        if parsed is None or parsed.offer_id != offer_id or parsed.member != member_fingerprint(member):
+            self.rejected += 1
+            raise WaitingRoomError(403, "A valid queue token is required for this offer")
+        status = await self._status(offer_id, parsed.sequence)
+        if not status.admitted:
+            self.rejected += 1
+            raise WaitingRoomError(429, "Not admitted yet", retry_after=max(1, status.estimated_wait))
+        if not await self.store.claim(offer_id, parsed.sequence):
+            self.rejected += 1
+            raise WaitingRoomError(403, "Queue token already used")
+        return parsed
+
+    async def release(self, token: QueueToken):
+        """Rend un jeton réservé par `check_purchase` utilisable pour un nouvel achat."""
+        await self.store.release(token.offer_id, token.sequence)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "rates": {str(offer_id): rate for offer_id, rate in self.rates.items()},
+            "rejected_purchases": self.rejected,
+            **self.store.stats(),
+        }
+
+
+def parse_offer_rates(value: str) -> Dict[int, float]:
+    """
+    Analyse la liste des offres en salle d'attente.
+
+    Args:
+        value: Liste "offre:débit" séparée par des virgules (ex: "12:50,14:20")
+
+    Returns:
+        Le débit d'admission par seconde de chaque offre
+    """
+    rates = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        offer_id, _, rate = item.partition(":")
+        rates[int(offer_id)] = float(rate) if rate else float(os.getenv("WAITING_ROOM_DEFAULT_RATE", "10"))
+    return rates
+
+
+def build_waiting_room() -> WaitingRoom:
+    """Crée la salle d'attente configurée par l'environnement."""
+    ttl = int(os.getenv("WAITING_ROOM_TOKEN_TTL", "7200"))
+    backend = os.getenv("WAITING_ROOM_BACKEND", "memory")
+    if backend == "redis":
+        host = os.getenv("REDIS_HOST", "localhost")
+        port = os.getenv("REDIS_PORT", "6379")
+        store = RedisQueueStore(os.getenv("REDIS_URL", f"redis://{host}:{port}/0"), ttl=ttl)
+    elif backend == "memory":
+        store = MemoryQueueStore(ttl=ttl)
+    else:
+        raise ValueError(f"Unknown waiting room backend: {backend}")
+    burst = os.getenv("WAITING_ROOM_BURST")
+    return WaitingRoom(
+        QueueTokenSigner(os.getenv("WAITING_ROOM_SECRET") or os.getenv("SECRET_KEY", "YOUR_SECRET_KEY"), ttl=ttl),
+        store,
+        parse_offer_rates(os.getenv("WAITING_ROOM_OFFERS", "")),
+        burst=float(burst) if burst else None,
+    )
@@ -0,0 +1,136 @@
+import json
+import time
+import contextvars
+from typing import Optional
+
+# En-tête portant le temps restant (en millisecondes) pour traiter la requête.
+# Un délai relatif, plutôt qu'une date absolue, ne dépend pas de la
+# synchronisation des horloges entre l'API Gateway et les services.
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Le temps alloué à la requête est écoulé."""
+
+
+def parse_timeout(value: Optional[str]) -> Optional[float]:
+    """Analyse la valeur de l'en-tête de délai ; renvoie un temps en secondes, ou None s'il est invalide."""
+    try:
+        milliseconds = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, milliseconds) / 1000
+
+
+def remaining() -> Optional[float]:
+    """Temps restant (en secondes, éventuellement négatif) pour la requête en cours, ou None sans échéance."""
+    deadline = _deadline.get()
+    return deadline - time.monotonic() if deadline is not None else None
+
+
+def check():
+    """Lève DeadlineExceeded si le temps alloué à la requête en cours est écoulé."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+
+def set_deadline(budget: Optional[float]):
+    """Fixe l'échéance de la requête en cours ; renvoie le jeton permettant de la rétablir."""
+    return _deadline.set(time.monotonic() + budget if budget is not None else None)
+
+
+class DeadlineMiddleware:
+    """
+    Middleware ASGI fixant l'échéance de chaque requête d'après le temps reçu
+    dans l'en-tête x-request-timeout-ms (aucune échéance sans en-tête).
+
+    L'échéance est ensuite respectée par les requêtes SQL
+    (`enforce_deadline_sqlalchemy`). Une requête arrivée après son échéance est
+    refusée sans être traitée : le client ne l'attend plus, et une requête
+    interrompue par DeadlineExceeded reçoit une réponse 504.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = None
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER.encode():
+                budget = parse_timeout(value.decode("latin-1"))
+                break
+
+        if budget is not None and budget <= 0:
+            await deadline_exceeded_response(send)
+            return
+        started = False
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = set_deadline(budget)
+        try:
+            await self.app(scope, receive, send_tracking)
+        except DeadlineExceeded:
+            if started:
+                raise
+            await deadline_exceeded_response(send)
+        finally:
+            _deadline.reset(token)
+
+
+async def deadline_exceeded_response(send):
+    body = json.dumps({"detail": "Deadline exceeded"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 504,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def enforce_deadline_sqlalchemy():
+    """
+    Applique l'échéance de la requête en cours aux requêtes SQL de tous les moteurs
+    SQLAlchemy du processus :
+
+    - aucune requête SQL n'est lancée une fois l'échéance passée ;
+    - avec PostgreSQL, chaque transaction reçoit un statement_timeout égal au temps
+      restant (SET LOCAL, limité à la transaction) : le serveur interrompt la
+      requête en cours plutôt que de poursuivre un travail que plus personne n'attend ;
+    - les erreurs survenues après l'échéance sont signalées par DeadlineExceeded.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "begin", _begin)
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+def _begin(conn):
+    left = remaining()
+    if left is not None and conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    check()
+
+
+def _handle_error(exception_context):
+    left = remaining()
+    if left is not None and left <= 0 and not isinstance(exception_context.original_exception, DeadlineExceeded):
+        raise DeadlineExceeded() from exception_context.original_exception
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
@@ -13,6 +13,9 @@ import time
 import models
 import schemas
 from database import get_db
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, instrument_sqlalchemy
+from tracing import TracingMiddleware, build_tracer, trace_sqlalchemy
+from deadline import DeadlineMiddleware, enforce_deadline_sqlalchemy
 from security_logger import log_login_attempt, log_mfa_attempt, log_security_event
 
 # Configuration
@@ -23,6 +26,23 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 # Initialisation de l'application
 app = FastAPI(title="Service d'Authentification - Billetterie JO")
 
+# Métriques Prometheus : requêtes HTTP et durée des requêtes SQL
+app.add_middleware(MetricsMiddleware, registry=REGISTRY)
+instrument_sqlalchemy(REGISTRY)
+PASSWORD_HASH_DURATION = REGISTRY.histogram(
+    "password_hash_duration_seconds", "Durée des calculs bcrypt (vérification ou création d'un hash)",
+    ("operation",), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Échéance transmise par l'API Gateway (en-tête x-request-timeout-ms), appliquée aux requêtes SQL
+app.add_middleware(DeadlineMiddleware)
+enforce_deadline_sqlalchemy()
+
+# Traçage distribué : spans des requêtes (contexte reçu de l'API Gateway) et des requêtes SQL
+tracer = build_tracer("auth-service")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+trace_sqlalchemy(tracer)
+
 # Configuration CORS
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +59,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Fonctions utilitaires
+@tracer.traced("verify_password")
 def verify_password(plain_password, hashed_password):
     """Vérifie si un mot de passe en clair correspond à un mot de passe haché.
     
@@ -49,8 +70,13 @@ def verify_password(plain_password, hashed_password):
     Returns:
         bool: True si le mot de passe correspond, False sinon.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        PASSWORD_HASH_DURATION.labels("verify").observe(time.perf_counter() - started)
 
+@tracer.traced("get_password_hash")
 def get_password_hash(password):
     """Génère un hash sécurisé pour un mot de passe.
     
@@ -60,7 +86,11 @@ def get_password_hash(password):
     Returns:
         str: Le mot de passe haché.
     """
-    return pwd_context.hash(password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        PASSWORD_HASH_DURATION.labels("hash").observe(time.perf_counter() - started)
 
 def generate_security_key():
     """Génère une clé de sécurité cryptographiquement sûre.
@@ -169,6 +199,7 @@ async def register_user(user: schemas.UserCreate, db: Annotated[Session, Depends
     access_token = create_access_token(
         data={
             "sub": new_user.email,
+            "user_id": new_user.id,
             "is_employee": new_user.is_employee,
             "is_admin": new_user.is_admin
         }, 
@@ -250,6 +281,7 @@ async def login_for_access_token(request: Request, form_data: Annotated[OAuth2Pa
     access_token = create_access_token(
         data={
             "sub": user.email,
+            "user_id": user.id,
             "is_employee": user.is_employee,
             "is_admin": user.is_admin
         }, 
@@ -374,6 +406,16 @@ async def verify_mfa(request: Request, token_data: schemas.MFAToken, current_use
     
     return {"status": "success"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métriques du service au format Prometheus"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health")
+def health_check():
+    """Vérification de l'état du service (utilisée par la sonde de l'API Gateway)"""
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,253 @@
+import time
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Bornes (en secondes) des histogrammes de latence
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Type de contenu du format d'exposition texte de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class ThreadCells:
+    """
+    Cellules de comptage d'une métrique, propres à chaque thread.
+
+    Chaque thread (boucle d'événements, threads du pool des endpoints
+    synchrones) n'écrit que dans ses propres cellules : l'enregistrement se
+    fait sans verrou ni risque de perte de mise à jour. Les cellules de tous
+    les threads sont additionnées à la lecture, lors de l'export.
+    """
+
+    __slots__ = ("size", "local", "cells")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.local = threading.local()
+        self.cells: List[List[float]] = []
+
+    def get(self) -> List[float]:
+        cells = getattr(self.local, "cells", None)
+        if cells is None:
+            cells = self.local.cells = [0.0] * self.size
+            self.cells.append(cells)
+        return cells
+
+    def totals(self) -> List[float]:
+        totals = [0.0] * self.size
+        for cells in list(self.cells):
+            for index, value in enumerate(cells):
+                totals[index] += value
+        return totals
+
+
+class CounterChild:
+    __slots__ = ("cells",)
+
+    def __init__(self):
+        self.cells = ThreadCells(1)
+
+    def inc(self, amount: float = 1.0):
+        self.cells.get()[0] += amount
+
+    def samples(self, name: str, labels: str):
+        yield name, labels, self.cells.totals()[0]
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        self.cells.get()[0] -= amount
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "cells")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # Une cellule par borne, puis +Inf, la somme et le nombre d'observations
+        self.cells = ThreadCells(len(buckets) + 3)
+
+    def observe(self, value: float):
+        cells = self.cells.get()
+        cells[bisect.bisect_left(self.buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    def samples(self, name: str, labels: str):
+        totals = self.cells.totals()
+        separator = "," if labels else ""
+        cumulative = 0.0
+        for index, bound in enumerate(self.buckets):
+            cumulative += totals[index]
+            yield f"{name}_bucket", f'{labels}{separator}le="{bound}"', cumulative
+        yield f"{name}_bucket", f'{labels}{separator}le="+Inf"', cumulative + totals[len(self.buckets)]
+        yield f"{name}_sum", labels, totals[-2]
+        yield f"{name}_count", labels, totals[-1]
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """Métrique Prometheus, éventuellement déclinée par valeurs d'étiquettes."""
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str], factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.children[()] = factory()
+
+    def labels(self, *values):
+        """Renvoie la déclinaison de la métrique pour des valeurs d'étiquettes."""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children.setdefault(key, self.factory())
+        return child
+
+    # Raccourcis pour les métriques sans étiquette
+    def inc(self, amount: float = 1.0):
+        self.children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.children[()].dec(amount)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self.children.items()):
+            labels = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, key))
+            for sample, sample_labels, value in child.samples(self.name, labels):
+                sample_labels = f"{{{sample_labels}}}" if sample_labels else ""
+                lines.append(f"{sample}{sample_labels} {format_value(value)}")
+        return lines
+
+
+class Registry:
+    """Ensemble des métriques d'un processus, exportées au format texte de Prometheus."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        # Une métrique déjà déclarée est réutilisée (modules rechargés par les tests)
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("counter", name, documentation, labelnames, CounterChild))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("gauge", name, documentation, labelnames, GaugeChild))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        buckets = tuple(sorted(buckets))
+        return self._register(Metric("histogram", name, documentation, labelnames, lambda: HistogramChild(buckets)))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI mesurant les requêtes HTTP : nombre de requêtes en cours et
+    histogramme des durées par méthode, modèle de route (ex: /tickets/{ticket_id},
+    pour borner le nombre de séries) et code de statut. Le nombre de requêtes
+    est donné par le compteur `_count` de l'histogramme.
+    """
+
+    def __init__(self, app, registry: Registry = REGISTRY, prefix: str = "http"):
+        self.app = app
+        self.duration = registry.histogram(
+            f"{prefix}_request_duration_seconds", "Durée de traitement des requêtes HTTP",
+            ("method", "route", "status"),
+        )
+        self.in_flight = registry.gauge(f"{prefix}_requests_in_flight", "Requêtes HTTP en cours de traitement")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            self.duration.labels(scope["method"], template, status_code).observe(time.perf_counter() - started)
+
+
+def instrument_sqlalchemy(registry: Registry = REGISTRY):
+    """
+    Mesure la durée des requêtes SQL de tous les moteurs SQLAlchemy du processus,
+    par type d'instruction (SELECT, INSERT, UPDATE, ...).
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    duration = registry.histogram(
+        "db_query_duration_seconds", "Durée des requêtes SQL", ("operation",),
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    )
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started")
+        if started:
+            operation = statement.lstrip()[:6].upper()
+            if operation not in SQL_OPERATIONS:
+                operation = "OTHER"
+            duration.labels(operation).observe(time.perf_counter() - started.pop())
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+
+
+# Types d'instruction distingués par l'histogramme des requêtes SQL
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _handle_error(context):
+    # Une requête en échec ne passe pas par after_cursor_execute
+    connection = context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
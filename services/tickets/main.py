@@ -1,17 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List, Annotated
+from typing import List, Annotated, Iterable, Optional, Sequence
 import qrcode
 from io import BytesIO
 import base64
+import hashlib
 import secrets
+import time
 import models
 import schemas
 from database import get_db, engine
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, instrument_sqlalchemy
+from tracing import TracingMiddleware, build_tracer, trace_sqlalchemy
+from deadline import DeadlineMiddleware, enforce_deadline_sqlalchemy
+from qr_cache import key_version, qr_cache
 
 # Initialisation de l'application
 app = FastAPI(title="Service de Billetterie - Jeux Olympiques")
 
+# Métriques Prometheus : requêtes HTTP et durée des requêtes SQL
+app.add_middleware(MetricsMiddleware, registry=REGISTRY)
+instrument_sqlalchemy(REGISTRY)
+QR_RENDER_DURATION = REGISTRY.histogram(
+    "qr_render_duration_seconds", "Durée de génération des QR codes",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# Échéance transmise par l'API Gateway (en-tête x-request-timeout-ms), appliquée aux requêtes SQL
+app.add_middleware(DeadlineMiddleware)
+enforce_deadline_sqlalchemy()
+
+# Traçage distribué : spans des requêtes (contexte reçu de l'API Gateway) et des requêtes SQL
+tracer = build_tracer("tickets-service")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+trace_sqlalchemy(tracer)
+
 # Création des tables dans la base de données
 models.Base.metadata.create_all(bind=engine)
 
@@ -28,6 +51,7 @@ def generate_security_key_2():
     """
     return secrets.token_hex(32)
 
+@tracer.traced("generate_qr_code")
 def generate_qr_code(ticket_id: int, security_key_1: str, security_key_2: str):
     """Génère un QR code à partir des deux clés de sécurité.
     
@@ -42,6 +66,7 @@ def generate_qr_code(ticket_id: int, security_key_1: str, security_key_2: str):
     Returns:
         str: Une chaîne de caractères au format data URI contenant l'image du QR code encodée en base64.
     """
+    started = time.perf_counter()
     # Concaténation des deux clés avec l'ID du ticket pour créer une signature unique
     data = f"{ticket_id}:{security_key_1}:{security_key_2}"
     
@@ -63,17 +88,81 @@ def generate_qr_code(ticket_id: int, security_key_1: str, security_key_2: str):
     img.save(buffered)
     img_str = base64.b64encode(buffered.getvalue()).decode()
     
+    QR_RENDER_DURATION.observe(time.perf_counter() - started)
     return f"data:image/png;base64,{img_str}"
 
+# Champs exposés par les réponses, utilisés pour calculer les ETag
+OFFER_FIELDS = tuple(schemas.Offer.model_fields)
+TICKET_FIELDS = tuple(schemas.Ticket.model_fields)
+
+def compute_etag(rows: Iterable, fields: Sequence[str]) -> str:
+    """Calcule un ETag fort à partir du contenu des lignes renvoyées.
+    
+    L'empreinte porte sur les valeurs des champs exposés, lues directement sur les
+    objets SQLAlchemy : elle change dès que le contenu de la réponse change, quelle
+    que soit l'instance du service qui a modifié la base, et se calcule sans
+    sérialiser la réponse.
+    
+    Args:
+        rows (Iterable): Les objets renvoyés par la requête.
+        fields (Sequence[str]): Les champs exposés par la réponse.
+        
+    Returns:
+        str: L'ETag, entre guillemets.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(tuple(getattr(row, field) for field in fields)).encode())
+        digest.update(b"\n")
+    return f'"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Indique si l'en-tête If-None-Match désigne l'ETag (comparaison faible).
+    
+    Args:
+        if_none_match (Optional[str]): La valeur de l'en-tête If-None-Match.
+        etag (str): L'ETag de la représentation courante.
+        
+    Returns:
+        bool: True si le client possède déjà cette représentation.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return etag.removeprefix("W/") in [value.removeprefix("W/") for value in candidates]
+
+def conditional_response(request: Request, response: Response, rows: Iterable, fields: Sequence[str]) -> Optional[Response]:
+    """Ajoute l'ETag à la réponse, ou renvoie une réponse 304 si le client est à jour.
+    
+    Args:
+        request (Request): La requête, dont l'en-tête If-None-Match est examiné.
+        response (Response): La réponse en cours de construction.
+        rows (Iterable): Les objets renvoyés par la requête.
+        fields (Sequence[str]): Les champs exposés par la réponse.
+        
+    Returns:
+        Optional[Response]: Une réponse 304 sans corps, ou None si le corps doit être envoyé.
+    """
+    etag = compute_etag(rows, fields)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
 # Routes
 @app.get("/offers/", response_model=List[schemas.Offer])
-def get_offers(db: Annotated[Session, Depends(get_db)], skip: int = 0, limit: int = 100):
+def get_offers(request: Request, response: Response, db: Annotated[Session, Depends(get_db)], skip: int = 0, limit: int = 100):
     """Récupère la liste des offres de billets disponibles.
     
     Cette route permet de consulter toutes les offres de billets disponibles,
-    avec pagination pour gérer un grand nombre d'offres.
+    avec pagination pour gérer un grand nombre d'offres. La réponse porte un ETag :
+    un client envoyant If-None-Match avec l'ETag courant reçoit une réponse 304.
     
     Args:
+        request (Request): La requête HTTP, pour l'en-tête If-None-Match.
+        response (Response): La réponse HTTP, qui reçoit l'en-tête ETag.
         db (Session): Session de base de données SQLAlchemy.
         skip (int, optional): Nombre d'offres à sauter (pour la pagination). Par défaut 0.
         limit (int, optional): Nombre maximum d'offres à retourner. Par défaut 100.
@@ -82,17 +171,22 @@ def get_offers(db: Annotated[Session, Depends(get_db)], skip: int = 0, limit: in
         List[schemas.Offer]: Liste des offres de billets.
     """
     offers = models.get_offers(db, skip=skip, limit=limit)
+    not_modified = conditional_response(request, response, offers, OFFER_FIELDS)
+    if not_modified is not None:
+        return not_modified
     return offers
 
 @app.get("/offers/{offer_id}", response_model=schemas.Offer)
-def get_offer(offer_id: int, db: Annotated[Session, Depends(get_db)]):
+def get_offer(offer_id: int, request: Request, response: Response, db: Annotated[Session, Depends(get_db)]):
     """Récupère les détails d'une offre de billet spécifique.
     
     Cette route permet de consulter les détails d'une offre de billet en particulier,
-    identifiée par son ID unique.
+    identifiée par son ID unique. La réponse porte un ETag (voir get_offers).
     
     Args:
         offer_id (int): L'identifiant unique de l'offre.
+        request (Request): La requête HTTP, pour l'en-tête If-None-Match.
+        response (Response): La réponse HTTP, qui reçoit l'en-tête ETag.
         db (Session): Session de base de données SQLAlchemy.
         
     Returns:
@@ -104,6 +198,9 @@ def get_offer(offer_id: int, db: Annotated[Session, Depends(get_db)]):
     db_offer = models.get_offer(db, offer_id=offer_id)
     if db_offer is None:
         raise HTTPException(status_code=404, detail="Offer not found")
+    not_modified = conditional_response(request, response, [db_offer], OFFER_FIELDS)
+    if not_modified is not None:
+        return not_modified
     return db_offer
 
 @app.post("/tickets/", response_model=schemas.Ticket)
@@ -139,20 +236,25 @@ def create_ticket(ticket: schemas.TicketCreate, db: Annotated[Session, Depends(g
     return db_ticket
 
 @app.get("/tickets/user/{user_id}", response_model=List[schemas.Ticket])
-def get_user_tickets(user_id: int, db: Annotated[Session, Depends(get_db)]):
+def get_user_tickets(user_id: int, request: Request, response: Response, db: Annotated[Session, Depends(get_db)]):
     """Récupère tous les billets d'un utilisateur spécifique.
     
     Cette route permet de consulter tous les billets achetés par un utilisateur particulier,
-    identifié par son ID unique.
+    identifié par son ID unique. La réponse porte un ETag (voir get_offers).
     
     Args:
         user_id (int): L'identifiant unique de l'utilisateur.
+        request (Request): La requête HTTP, pour l'en-tête If-None-Match.
+        response (Response): La réponse HTTP, qui reçoit l'en-tête ETag.
         db (Session): Session de base de données SQLAlchemy.
         
     Returns:
         List[schemas.Ticket]: Liste des billets de l'utilisateur.
     """
     tickets = models.get_tickets_by_user(db, user_id=user_id)
+    not_modified = conditional_response(request, response, tickets, TICKET_FIELDS)
+    if not_modified is not None:
+        return not_modified
     return tickets
 
 @app.get("/tickets/{ticket_id}", response_model=schemas.Ticket)
@@ -183,7 +285,8 @@ def get_ticket_qrcode(ticket_id: int, db: Annotated[Session, Depends(get_db)]):
     
     Cette route génère un QR code sécurisé pour un billet, en combinant l'ID du billet
     avec les deux clés de sécurité. Ce QR code sera utilisé pour valider le billet
-    lors de l'entrée à l'événement.
+    lors de l'entrée à l'événement. Le QR code n'est généré qu'une fois par version
+    des clés du billet, puis servi depuis le cache.
     
     Args:
         ticket_id (int): L'identifiant unique du billet.
@@ -204,11 +307,25 @@ def get_ticket_qrcode(ticket_id: int, db: Annotated[Session, Depends(get_db)]):
     # Pour l'exemple, nous utilisons une clé fictive
     security_key_1 = "fake_security_key_1"  # À remplacer par un appel au service d'authentification
     
-    # Génération du QR code
-    qr_code = generate_qr_code(db_ticket.id, security_key_1, db_ticket.security_key_2)
+    # Génération du QR code, ou lecture en cache si les clés n'ont pas changé
+    qr_code = qr_cache.get_or_render(
+        db_ticket.id,
+        key_version(security_key_1, db_ticket.security_key_2),
+        lambda: generate_qr_code(db_ticket.id, security_key_1, db_ticket.security_key_2),
+    )
     
     return {"qr_code": qr_code}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métriques du service au format Prometheus"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health")
+def health_check():
+    """Vérification de l'état du service (utilisée par la sonde de l'API Gateway)"""
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,172 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("tickets-service")
+
+# Version du rendu des QR codes (taille, correction d'erreur, format) : à changer
+# avec les paramètres de generate_qr_code pour ne plus servir les images sur disque
+RENDER_VERSION = "1"
+
+QR_CACHE_LOOKUPS = REGISTRY.counter(
+    "qr_cache_lookups_total", "Lectures du cache des QR codes", ("result",)
+)
+
+
+def key_version(*keys: str) -> str:
+    """Empreinte des clés de sécurité d'un billet ; elle change à chaque rotation des clés.
+
+    Args:
+        keys (str): Les clés de sécurité utilisées pour générer le QR code.
+
+    Returns:
+        str: L'empreinte hexadécimale des clés (les clés ne sont pas conservées en clair).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for key in keys:
+        digest.update(key.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class QRCodeCache:
+    """Cache des QR codes générés, identifiés par (billet, version des clés).
+
+    Le rendu d'un QR code ne dépend que du billet et de ses clés de sécurité :
+    tant que les clés ne changent pas, le QR code déjà généré est renvoyé.
+
+    - Le niveau en mémoire est un cache LRU borné en octets ; il conserve une
+      seule version par billet, si bien qu'une rotation des clés remplace
+      l'entrée précédente.
+    - Le niveau sur disque, facultatif, est partagé entre les processus et
+      survit aux redémarrages. Chaque fichier est adressé par l'empreinte du
+      billet, de la version des clés et de la version du rendu : une version
+      périmée n'est jamais relue. Les QR codes contenant les clés de sécurité,
+      le répertoire et les fichiers ne sont accessibles qu'au propriétaire.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, directory: Optional[str] = None):
+        """Initialise le cache.
+
+        Args:
+            max_bytes (int): Taille maximale des QR codes conservés en mémoire, en octets.
+            directory (Optional[str]): Le répertoire du niveau sur disque (aucun si None).
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def get_or_render(self, ticket_id: int, version: str, render: Callable[[], str]) -> str:
+        """Renvoie le QR code en cache d'un billet, ou le génère et le met en cache.
+
+        Args:
+            ticket_id (int): L'identifiant du billet.
+            version (str): La version des clés du billet (voir `key_version`).
+            render (Callable[[], str]): La fonction générant le QR code.
+
+        Returns:
+            str: Le QR code au format data URI.
+        """
+        with self.lock:
+            entry = self.entries.get(ticket_id)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(ticket_id)
+                QR_CACHE_LOOKUPS.labels("memory_hit").inc()
+                return entry[1]
+
+        qr_code = self._read(ticket_id, version)
+        if qr_code is not None:
+            QR_CACHE_LOOKUPS.labels("disk_hit").inc()
+        else:
+            QR_CACHE_LOOKUPS.labels("miss").inc()
+            qr_code = render()
+            self._write(ticket_id, version, qr_code)
+        self._store(ticket_id, version, qr_code)
+        return qr_code
+
+    def _store(self, ticket_id: int, version: str, qr_code: str):
+        if len(qr_code) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(ticket_id, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+                if previous[0] != version:
+                    # Rotation des clés : l'image de l'ancienne version est supprimée
+                    self._remove(ticket_id, previous[0])
+            self.entries[ticket_id] = (version, qr_code)
+            self.size += len(qr_code)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def _path(self, ticket_id: int, version: str) -> str:
+        address = hashlib.blake2b(f"{RENDER_VERSION}:{ticket_id}:{version}".encode(), digest_size=20).hexdigest()
+        return os.path.join(self.directory, address[:2], address)
+
+    def _read(self, ticket_id: int, version: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(ticket_id, version), encoding="ascii") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not read cached QR code of ticket {ticket_id}: {str(e)}")
+            return None
+
+    def _write(self, ticket_id: int, version: str, qr_code: str):
+        if self.directory is None:
+            return
+        path = self._path(ticket_id, version)
+        temporary = None
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            # Écriture atomique : un autre processus ne lit jamais un fichier incomplet
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "w", encoding="ascii") as file:
+                file.write(qr_code)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning(f"Could not write cached QR code of ticket {ticket_id}: {str(e)}")
+            if temporary is not None and os.path.exists(temporary):
+                os.remove(temporary)
+
+    def _remove(self, ticket_id: int, version: str):
+        if self.directory is None:
+            return
+        try:
+            os.remove(self._path(ticket_id, version))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, object]:
+        """Renvoie l'occupation du cache."""
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "disk": self.directory is not None,
+            }
+
+
+# Cache des QR codes du service ; le niveau sur disque est activé par QR_CACHE_DIR
+qr_cache = QRCodeCache(
+    max_bytes=int(os.getenv("QR_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    directory=os.getenv("QR_CACHE_DIR") or None,
+)
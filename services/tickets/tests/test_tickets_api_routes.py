@@ -236,6 +236,55 @@ class TestTicketsRoutes:
         assert response.status_code == 404
         assert "not found" in response.json()["detail"].lower()
     
+    def test_health(self):
+        """Teste la route /health utilisée par la sonde de l'API Gateway"""
+        
+        response = client.get("/health")
+        assert response.status_code == 200
+        assert response.json() == {"status": "healthy"}
+    
+    def test_offers_etag_and_not_modified(self, test_offers):
+        """Teste l'ETag de la route /offers/ et la réponse 304 avec If-None-Match"""
+        
+        response = client.get("/offers/")
+        etag = response.headers["etag"]
+        assert etag.startswith('"')
+        
+        not_modified = client.get("/offers/", headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["etag"] == etag
+        
+        # Un ETag affaibli (réponse compressée par l'API Gateway) est aussi reconnu
+        weak = client.get("/offers/", headers={"If-None-Match": f"W/{etag}"})
+        assert weak.status_code == 304
+    
+    def test_offer_etag_changes_with_content(self, test_db, test_offer):
+        """Teste que l'ETag d'une offre change lorsque l'offre est modifiée"""
+        
+        etag = client.get(f"/offers/{test_offer.id}").headers["etag"]
+        
+        test_offer.price = 250.0
+        test_db.commit()
+        
+        response = client.get(f"/offers/{test_offer.id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["price"] == 250.0
+        assert response.headers["etag"] != etag
+    
+    def test_user_tickets_etag(self, test_db, test_ticket):
+        """Teste l'ETag de la liste des billets d'un utilisateur"""
+        
+        url = f"/tickets/user/{test_ticket.user_id}"
+        etag = client.get(url).headers["etag"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+        
+        # Un nouvel achat modifie la liste et donc son ETag
+        client.post("/tickets/", json={"user_id": test_ticket.user_id, "offer_id": test_ticket.offer_id})
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+    
     # Note: Dans une implémentation réelle, nous devrions vérifier que l'utilisateur
     # est autorisé à accéder au ticket. Ce test est omis pour le moment car
     # cette vérification n'est pas implémentée dans le service actuel.
@@ -261,6 +310,38 @@ class TestTicketsRoutes:
         assert response.status_code == 404
         assert "not found" in response.json()["detail"].lower()
     
+    def test_metrics(self, test_ticket):
+        """Teste la route /metrics : latence par modèle de route, requêtes SQL et génération des QR codes"""
+        
+        client.get(f"/tickets/{test_ticket.id}")
+        client.get(f"/tickets/{test_ticket.id}/qrcode")
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert 'http_request_duration_seconds_count{method="GET",route="/tickets/{ticket_id}",status="200"}' in body
+        assert 'db_query_duration_seconds_count{operation="SELECT"}' in body
+        assert "qr_render_duration_seconds_count" in body
+        assert "http_requests_in_flight 1" in body
+    
+    def test_trace_context(self, test_ticket, monkeypatch):
+        """Teste la poursuite de la trace reçue de l'API Gateway jusqu'à la génération du QR code"""
+        import main
+        spans = []
+        monkeypatch.setattr(main.tracer, "processor", MagicMock(on_end=spans.append))
+        monkeypatch.setattr(main.tracer, "enabled", True)
+        
+        client.get(f"/tickets/{test_ticket.id}/qrcode", headers={
+            "traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01",
+        })
+        
+        by_name = {span.name: span for span in spans}
+        server = by_name["GET /tickets/{ticket_id}/qrcode"]
+        assert server.parent_id == "00f067aa0ba902b7"
+        assert by_name["generate_qr_code"].context.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert by_name["generate_qr_code"].parent_id == server.context.span_id
+    
     # Note: Dans une implémentation réelle, nous devrions vérifier que l'utilisateur
     # est autorisé à accéder au QR code du ticket. Ce test est omis pour le moment car
     # cette vérification n'est pas implémentée dans le service actuel.
@@ -1,14 +1,20 @@
 import pytest
 import sys
 import os
+import time
 from datetime import datetime, timedelta
 import base64
 from io import BytesIO
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
 
 # Ajouter le répertoire parent au chemin pour pouvoir importer les modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import generate_security_key_2, generate_qr_code
+from deadline import DeadlineMiddleware, enforce_deadline_sqlalchemy
+from qr_cache import QRCodeCache, key_version
 import models
 from schemas import OfferCreate, TicketCreate
 
@@ -62,6 +68,70 @@ class TestQRCodeGeneration:
         # Vérifier que des entrées différentes produisent des QR codes différents
         assert qr_code1 != qr_code2
 
+# Tests pour le cache des QR codes
+class TestQRCodeCache:
+    def render(self, calls, ticket_id, key_2):
+        def render():
+            calls.append(ticket_id)
+            return generate_qr_code(ticket_id, "test_key_1", key_2)
+        return render
+
+    def test_qr_code_is_rendered_once_per_key_version(self):
+        """Vérifie que le QR code est généré une seule fois tant que les clés ne changent pas"""
+        cache = QRCodeCache()
+        calls = []
+        version = key_version("test_key_1", "test_key_2")
+
+        first = cache.get_or_render(123, version, self.render(calls, 123, "test_key_2"))
+        second = cache.get_or_render(123, version, self.render(calls, 123, "test_key_2"))
+
+        assert first == second == generate_qr_code(123, "test_key_1", "test_key_2")
+        assert calls == [123]
+
+    def test_key_rotation_invalidates_qr_code(self):
+        """Vérifie qu'une rotation des clés entraîne un nouveau QR code et remplace l'ancien"""
+        cache = QRCodeCache()
+        calls = []
+        old = cache.get_or_render(123, key_version("test_key_1", "old"), self.render(calls, 123, "old"))
+
+        new = cache.get_or_render(123, key_version("test_key_1", "new"), self.render(calls, 123, "new"))
+
+        assert old != new
+        assert calls == [123, 123]
+        assert cache.stats()["entries"] == 1
+        assert key_version("test_key_1", "new") != key_version("test_key_1new", "")
+
+    def test_memory_is_bounded_in_bytes(self):
+        """Vérifie l'éviction des QR codes les moins récemment utilisés au-delà de la taille maximale"""
+        size = len(generate_qr_code(1, "test_key_1", "test_key_2"))
+        cache = QRCodeCache(max_bytes=2 * size + size // 2)
+        calls = []
+        for ticket_id in (1, 2, 3):
+            cache.get_or_render(ticket_id, "v1", self.render(calls, ticket_id, "test_key_2"))
+
+        cache.get_or_render(1, "v1", self.render(calls, 1, "test_key_2"))
+
+        assert calls == [1, 2, 3, 1]
+        assert cache.stats()["bytes"] <= cache.max_bytes
+        assert cache.stats()["evictions"] == 2
+
+    def test_disk_tier_is_shared_and_content_addressed(self, tmp_path):
+        """Vérifie la relecture depuis le disque par un autre processus et la suppression à la rotation"""
+        calls = []
+        QRCodeCache(directory=str(tmp_path)).get_or_render(123, "v1", self.render(calls, 123, "test_key_2"))
+        cache = QRCodeCache(directory=str(tmp_path))
+
+        qr_code = cache.get_or_render(123, "v1", self.render(calls, 123, "test_key_2"))
+
+        assert calls == [123]
+        assert qr_code.startswith("data:image/png;base64,")
+        files = [path for path in tmp_path.rglob("*") if path.is_file()]
+        assert len(files) == 1 and "123" not in files[0].name
+        assert files[0].stat().st_mode & 0o077 == 0
+
+        cache.get_or_render(123, "v2", self.render(calls, 123, "rotated"))
+        assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
 # Tests pour les fonctions de modèle (avec mock de la base de données)
 class TestTicketModels:
     def test_create_offer(self, test_db):
@@ -264,3 +334,27 @@ class TestTicketModels:
         # Vérifier que le ticket est maintenant marqué comme utilisé
         assert updated_ticket.is_used is True
         assert updated_ticket.used_date is not None
+
+# Tests des échéances appliquées aux requêtes SQL
+class TestDeadline:
+    def test_sql_queries_stop_at_deadline(self):
+        """Vérifie qu'aucune requête SQL n'est lancée après l'échéance, et la réponse 504"""
+        enforce_deadline_sqlalchemy()
+        engine = create_engine("sqlite://")
+        app = FastAPI()
+
+        @app.get("/report")
+        def report():
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+                time.sleep(0.1)
+                connection.execute(text("SELECT 2"))
+            return {}
+
+        app.add_middleware(DeadlineMiddleware)
+        test_client = TestClient(app)
+
+        assert test_client.get("/report").status_code == 200
+        response = test_client.get("/report", headers={"x-request-timeout-ms": "50"})
+        assert response.status_code == 504
+        assert response.json() == {"detail": "Deadline exceeded"}
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 import requests
@@ -7,10 +7,26 @@ from typing import List, Annotated
 import models
 import schemas
 from database import get_db, engine
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, instrument_sqlalchemy
+from tracing import TracingMiddleware, build_tracer, trace_sqlalchemy
+from deadline import DeadlineMiddleware, enforce_deadline_sqlalchemy
 
 # Initialisation de l'application
 app = FastAPI(title="Service de Validation - Jeux Olympiques")
 
+# Métriques Prometheus : requêtes HTTP et durée des requêtes SQL
+app.add_middleware(MetricsMiddleware, registry=REGISTRY)
+instrument_sqlalchemy(REGISTRY)
+
+# Échéance transmise par l'API Gateway (en-tête x-request-timeout-ms), appliquée aux requêtes SQL
+app.add_middleware(DeadlineMiddleware)
+enforce_deadline_sqlalchemy()
+
+# Traçage distribué : spans des requêtes (contexte reçu de l'API Gateway) et des requêtes SQL
+tracer = build_tracer("validation-service")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+trace_sqlalchemy(tracer)
+
 # Création des tables dans la base de données
 models.Base.metadata.create_all(bind=engine)
 
@@ -122,6 +138,16 @@ async def get_employee_validations(employee_id: int, db: Annotated[Session, Depe
     validations = models.get_validation_records_by_employee(db, employee_id=employee_id)
     return validations
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métriques du service au format Prometheus"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health")
+def health_check():
+    """Vérification de l'état du service (utilisée par la sonde de l'API Gateway)"""
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)